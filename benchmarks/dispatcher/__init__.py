@@ -0,0 +1,5 @@
+"""
+Офлайн-бенчмарк диспетчера: настоящий main.create_dispatcher() (middleware,
+роутеры user / admin / correction, очередь заявок), фейковая сессия бота
+и локальная заглушка бэкенда. Запуск: python -m benchmarks.dispatcher
+"""
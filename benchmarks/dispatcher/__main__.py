@@ -0,0 +1,294 @@
+"""
+Бенчмарк диспетчера: сценарии нагрузки на настоящий main.create_dispatcher().
+
+Сценарии:
+  - start_storm      — N новых пользователей жмут /start (заявки на
+                       верификацию + рассылка администраторам);
+  - photo_flood      — N верифицированных пользователей шлют по фото;
+  - albums           — N альбомов по 10 фото;
+  - admin_approvals  — администраторы подтверждают N заявок;
+  - photo_resend     — N пользователей отправляют фото, затем то же фото
+                       повторно (исправление заявки): второй раз — из кэша;
+  - duplicate_orders — N заявок с фото, затем те же апдейты повторно (как при
+                       повторной доставке): повторы не доходят до бэкенда;
+  - noisy_user       — один пользователь шлёт N альбомов подряд, одновременно
+                       N других — по одному фото: задержка заявок остальных;
+  - orders_lookup    — N пользователей с заявкой по несколько раз подряд
+                       смотрят /orders: запросов списка к бэкенду — по одному
+                       на пользователя (кэш и слияние одновременных загрузок);
+  - backend_outage   — бэкенд отвечает 503 с задержкой, пользователи
+                       подтверждают N заявок: после срабатывания
+                       предохранителя ответ должен приходить сразу.
+
+Каждый сценарий запускается в отдельном процессе, чтобы пиковый RSS
+относился только к нему. Выводит апдейтов/с, p50/p99 обработки апдейта,
+для заявок — заявок/с и сквозную задержку до бэкенда, пиковый RSS.
+
+Запуск:
+    python -m benchmarks.dispatcher
+    python -m benchmarks.dispatcher --scenario albums -n 200 --concurrency 64
+    python -m benchmarks.dispatcher --scenario photo_flood --backend-error-rate 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.dispatcher import harness
+from benchmarks.dispatcher.harness import (
+    ADMIN_CHAT_ID, ADMIN_IDS, BotHarness, median, percentile, print_table, summarize,
+)
+
+SCENARIOS = ("start_storm", "photo_flood", "albums", "admin_approvals", "photo_resend", "duplicate_orders",
+             "noisy_user", "orders_lookup", "backend_outage")
+
+ALBUM_SIZE = 10
+
+# Задержка ответа бэкенда в сценарии backend_outage, если не задана --backend-latency (с)
+OUTAGE_LATENCY = 1.0
+
+# Сколько раз подряд каждый пользователь смотрит /orders в сценарии orders_lookup
+ORDERS_LOOKUPS = 4
+
+# Бюджет кэша фото в сценарии photo_resend (байты)
+PHOTO_RESEND_CACHE_BYTES = 64 * 1024 * 1024
+
+# Первые ID пользователей бенчмарка (не пересекаются с администраторами)
+_USER_BASE = 100_000
+
+
+async def _start_storm(h: BotHarness, n: int, concurrency: int) -> dict:
+    updates = [h.message(_USER_BASE + i, text="/start") for i in range(n)]
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    return {"updates": len(updates), "latencies": latencies, "elapsed": elapsed}
+
+
+async def _photo_flood(h: BotHarness, n: int, concurrency: int) -> dict:
+    users = [_USER_BASE + i for i in range(n)]
+    await h.seed_users(users, "approved")
+    updates = [h.message(user_id, photo=True, caption=f"Заявка {user_id}") for user_id in users]
+    started = time.perf_counter()
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    await h.wait_orders(n, timeout=max(60, n))
+    return {
+        "updates": len(updates), "latencies": latencies, "elapsed": elapsed,
+        "orders": n, "orders_elapsed": time.perf_counter() - started,
+    }
+
+
+async def _albums(h: BotHarness, n: int, concurrency: int) -> dict:
+    users = [_USER_BASE + i for i in range(n)]
+    await h.seed_users(users, "approved")
+    updates = []
+    for user_id in users:
+        group_id = f"album-{user_id}"
+        for part in range(ALBUM_SIZE):
+            caption = f"Альбом {user_id}" if part == 0 else None
+            updates.append(h.message(user_id, photo=True, caption=caption, media_group_id=group_id))
+    started = time.perf_counter()
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    await h.wait_orders(n, timeout=max(60, n))
+    return {
+        "updates": len(updates), "latencies": latencies, "elapsed": elapsed,
+        "orders": n, "orders_elapsed": time.perf_counter() - started,
+    }
+
+
+async def _admin_approvals(h: BotHarness, n: int, concurrency: int) -> dict:
+    users = [_USER_BASE + i for i in range(n)]
+    await h.seed_users(users, "pending")
+    text = "🔔 <b>Новая заявка на верификацию</b>"
+    updates = [
+        h.callback(ADMIN_IDS[i % len(ADMIN_IDS)], f"verify:approve:{user_id}", chat_id=ADMIN_CHAT_ID, text=text)
+        for i, user_id in enumerate(users)
+    ]
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    return {"updates": len(updates), "latencies": latencies, "elapsed": elapsed}
+
+
+async def _photo_resend(h: BotHarness, n: int, concurrency: int) -> dict:
+    users = [_USER_BASE + i for i in range(n)]
+    await h.seed_users(users, "approved")
+    first = [h.message(user_id, photo=True, caption=f"Заявка {user_id}") for user_id in users]
+    await h.run_updates(first, concurrency)
+    await h.wait_orders(n, timeout=max(60, n))
+
+    # Те же фото ещё раз — как при исправлении заявки; меряем только повтор
+    for update in first:
+        h.sent_at.pop(update["message"]["message_id"], None)
+    h.backend.received.clear()
+    downloads_before = h.session.calls["getFile"]
+    resend = [
+        h.message(update["message"]["chat"]["id"], photo=True, caption="Исправлено",
+                  photo_id=update["message"]["photo"][-1]["file_id"])
+        for update in first
+    ]
+    started = time.perf_counter()
+    latencies, elapsed = await h.run_updates(resend, concurrency)
+    await h.wait_orders(2 * n, timeout=max(60, n))
+    return {
+        "updates": len(resend), "latencies": latencies, "elapsed": elapsed,
+        "orders": n, "orders_elapsed": time.perf_counter() - started,
+        "extra": {"resend_get_file": h.session.calls["getFile"] - downloads_before},
+    }
+
+
+async def _duplicate_orders(h: BotHarness, n: int, concurrency: int) -> dict:
+    users = [_USER_BASE + i for i in range(n)]
+    await h.seed_users(users, "approved")
+    updates = [h.message(user_id, photo=True, caption=f"Заявка {user_id}") for user_id in users]
+    await h.run_updates(updates, concurrency)
+    await h.wait_orders(n, timeout=max(60, n))
+
+    # Те же апдейты ещё раз: заявки уже созданы, отвечаем их номерами
+    orders_before = h.backend.orders
+    downloads_before = h.session.calls["getFile"]
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    return {
+        "updates": len(updates), "latencies": latencies, "elapsed": elapsed,
+        "extra": {
+            "duplicate_backend_orders": h.backend.orders - orders_before,
+            "duplicate_get_file": h.session.calls["getFile"] - downloads_before,
+        },
+    }
+
+
+async def _noisy_user(h: BotHarness, n: int, concurrency: int) -> dict:
+    noisy = _USER_BASE
+    users = [_USER_BASE + 1 + i for i in range(n)]
+    await h.seed_users([noisy, *users], "approved")
+    updates = [
+        h.message(noisy, photo=True, caption=f"Альбом {album}" if part == 0 else None, media_group_id=f"noisy-{album}")
+        for album in range(n)
+        for part in range(ALBUM_SIZE)
+    ]
+    quiet = [h.message(user_id, photo=True, caption=f"Заявка {user_id}") for user_id in users]
+    quiet_ids = {update["message"]["message_id"] for update in quiet}
+    updates.extend(quiet)
+
+    started = time.perf_counter()
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    deadline = started + max(120, n)
+    while not quiet_ids <= h.backend.received.keys():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("заявки остальных пользователей не дошли до бэкенда")
+        await asyncio.sleep(0.05)
+    quiet_latencies = [h.backend.received[i] - h.sent_at[i] for i in quiet_ids]
+    return {
+        "updates": len(updates), "latencies": latencies, "elapsed": elapsed,
+        "extra": {
+            "quiet_order_p50_ms": median(quiet_latencies) * 1000,
+            "quiet_order_p99_ms": percentile(quiet_latencies, 0.99) * 1000,
+            "noisy_orders": h.backend.orders - len(quiet_ids),
+        },
+    }
+
+
+async def _orders_lookup(h: BotHarness, n: int, concurrency: int) -> dict:
+    users = [_USER_BASE + i for i in range(n)]
+    await h.seed_users(users, "approved")
+    await h.run_updates([h.message(user_id, photo=True, caption=f"Заявка {user_id}") for user_id in users], concurrency)
+    await h.wait_orders(n, timeout=max(60, n))
+
+    # Запросы одного пользователя идут подряд — часть из них одновременно
+    updates = [h.message(user_id, text="/orders") for user_id in users for _ in range(ORDERS_LOOKUPS)]
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    return {
+        "updates": len(updates), "latencies": latencies, "elapsed": elapsed,
+        "extra": {"backend_list_requests": h.backend.list_requests},
+    }
+
+
+async def _backend_outage(h: BotHarness, n: int, concurrency: int) -> dict:
+    users = [_USER_BASE + i for i in range(n)]
+    await h.seed_users(users, "approved")
+    h.backend.error_rate = 1.0
+    h.backend.latency = h.backend.latency or OUTAGE_LATENCY
+    updates = [
+        h.callback(user_id, f"user_confirm_{i + 1}", chat_id=user_id, text="✅ Заявка выполнена")
+        for i, user_id in enumerate(users)
+    ]
+    latencies, elapsed = await h.run_updates(updates, concurrency)
+    return {"updates": len(updates), "latencies": latencies, "elapsed": elapsed}
+
+
+_RUNNERS = {
+    "start_storm": _start_storm,
+    "photo_flood": _photo_flood,
+    "albums": _albums,
+    "admin_approvals": _admin_approvals,
+    "photo_resend": _photo_resend,
+    "duplicate_orders": _duplicate_orders,
+    "noisy_user": _noisy_user,
+    "orders_lookup": _orders_lookup,
+    "backend_outage": _backend_outage,
+}
+
+
+async def _run_one(args) -> dict:
+    h = BotHarness(
+        args.backend_port,
+        photo_size=args.photo_kb * 1024,
+        telegram_latency=args.telegram_latency,
+        backend_latency=args.backend_latency,
+        backend_error_rate=args.backend_error_rate,
+    )
+    await h.start()
+    try:
+        result = await _RUNNERS[args.scenario](h, args.n, args.concurrency)
+    finally:
+        await h.stop()
+
+    return summarize(args.scenario, result, h)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=(*SCENARIOS, "all"), default="all")
+    parser.add_argument("-n", type=int, default=1000, help="пользователей / заявок в сценарии")
+    parser.add_argument("--concurrency", type=int, default=32, help="параллельно обрабатываемых апдейтов")
+    parser.add_argument("--photo-kb", type=int, default=200, help="размер фиктивного фото, КБ")
+    parser.add_argument("--order-workers", type=int, default=4)
+    parser.add_argument("--media-group-debounce", type=float, default=0.3)
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка ответа фейкового Telegram, с")
+    parser.add_argument("--backend-latency", type=float, default=0.0, help="задержка ответа заглушки бэкенда, с")
+    parser.add_argument("--backend-error-rate", type=float, default=0.0, help="доля ответов 503 от заглушки бэкенда")
+    parser.add_argument("--telegram-limits", action="store_true", help="не отключать лимиты SendScheduler")
+    parser.add_argument("--json", action="store_true", help="вывести результат одной JSON-строкой")
+    parser.add_argument("--backend-port", type=int, default=0, help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+
+    if args.scenario == "all":
+        rows = []
+        for scenario in SCENARIOS:
+            cmd = [sys.executable, "-m", "benchmarks.dispatcher", *sys.argv[1:], "--scenario", scenario, "--json"]
+            output = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+            rows.append(json.loads(output.strip().splitlines()[-1]))
+        print_table(rows)
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    args.backend_port = args.backend_port or harness.free_port()
+    harness.configure_environment(
+        tempfile.mkdtemp(prefix="bench-dispatcher-"),
+        args.backend_port,
+        order_workers=args.order_workers,
+        media_group_debounce=args.media_group_debounce,
+        telegram_limits=args.telegram_limits,
+        # Кэш фото по умолчанию выключен — включаем там, где его и меряем
+        photo_cache_bytes=PHOTO_RESEND_CACHE_BYTES if args.scenario == "photo_resend" else 0,
+    )
+    summary = asyncio.run(_run_one(args))
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print_table([summary])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Фейковое окружение бота для бенчмарков.
+
+  - FakeSession — сессия aiogram без сети: записывает вызовы API, отвечает
+    правдоподобными объектами (ответ проходит обычный разбор check_response)
+    и отдаёт фиктивные байты фото вместо скачивания файла;
+  - StubBackend — aiohttp-заглушка бэкенда: принимает заявки (multipart
+    читается целиком) и подтверждения, запоминает момент получения заявки.
+    Задержку (latency) и долю ответов 503 (error_rate) можно менять на ходу —
+    так имитируется деградация бэкенда.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, AsyncGenerator, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiohttp import web
+
+_MESSAGE_METHODS = {
+    "sendMessage", "editMessageText", "editMessageReplyMarkup", "editMessageCaption", "sendPhoto",
+}
+
+
+class FakeSession(BaseSession):
+    def __init__(self, *, photo_size: int = 200 * 1024, latency: float = 0.0):
+        super().__init__()
+        self.calls: Counter = Counter()
+        self.downloaded_bytes = 0
+        self._photo = bytes(range(256)) * (photo_size // 256 + 1)
+        self._photo = self._photo[:photo_size]
+        self._latency = latency
+        self._message_ids = itertools.count(1_000_000)
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        timeout: Optional[int] = None,
+    ) -> TelegramType:
+        name = method.__api_method__
+        self.calls[name] += 1
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        content = json.dumps({"ok": True, "result": self._result(name, method)})
+        return self.check_response(bot, method, 200, content).result
+
+    def _result(self, name: str, method: TelegramMethod) -> Any:
+        if name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if name == "getFile":
+            return {
+                "file_id": method.file_id,
+                "file_unique_id": method.file_id,
+                "file_size": len(self._photo),
+                "file_path": f"photos/{method.file_id}.jpg",
+            }
+        if name in _MESSAGE_METHODS:
+            chat_id = getattr(method, "chat_id", None) or 0
+            chat_type = "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"
+            return {
+                "message_id": getattr(method, "message_id", None) or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": chat_type},
+                "text": getattr(method, "text", None) or "",
+            }
+        return True
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: Optional[dict[str, Any]] = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        self.calls["downloadFile"] += 1
+        for offset in range(0, len(self._photo), chunk_size):
+            chunk = self._photo[offset:offset + chunk_size]
+            self.downloaded_bytes += len(chunk)
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+
+class StubBackend:
+    def __init__(self, *, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.orders = 0
+        self.confirms = 0
+        # Запросы, получившие 503 (не считаются в orders / confirms)
+        self.failed = 0
+        self.photo_bytes = 0
+        # user_message_id -> момент получения заявки (time.perf_counter)
+        self.received: dict[int, float] = {}
+        self.order_received = asyncio.Event()
+        # Idempotency-Key -> созданная заявка (повтор получает её же со статусом 200)
+        self.idempotent: dict[str, dict[str, Any]] = {}
+        self.replays = 0
+        # telegram_user_id -> созданные заявки (для GET /correction-orders/) и число таких запросов
+        self.user_orders: dict[int, list[dict[str, Any]]] = {}
+        self.list_requests = 0
+        self._order_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str, port: int) -> None:
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_post("/correction-orders/", self._create_order)
+        app.router.add_get("/correction-orders/", self._list_orders)
+        app.router.add_post("/correction-orders/{order_id}/user-confirm", self._user_confirm)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _create_order(self, request: web.Request) -> web.Response:
+        fields: dict[str, str] = {}
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename:
+                while chunk := await part.read_chunk():
+                    self.photo_bytes += len(chunk)
+            else:
+                fields[part.name] = await part.text()
+        if (failure := await self._degrade()) is not None:
+            return failure
+
+        key = request.headers.get("Idempotency-Key")
+        if key in self.idempotent:
+            self.replays += 1
+            return web.json_response(self.idempotent[key], status=200)
+        self.orders += 1
+        message_id = int(fields.get("user_message_id") or 0)
+        self.received[message_id] = time.perf_counter()
+        self.order_received.set()
+        order = {"id": next(self._order_ids), "user_message_id": message_id}
+        if key:
+            self.idempotent[key] = order
+        self.user_orders.setdefault(int(fields.get("telegram_user_id") or 0), []).append(
+            {**order, "status": "new", "description": fields.get("description")},
+        )
+        return web.json_response(order, status=201)
+
+    async def _list_orders(self, request: web.Request) -> web.Response:
+        if (failure := await self._degrade()) is not None:
+            return failure
+        self.list_requests += 1
+        orders = self.user_orders.get(int(request.query["telegram_user_id"]), [])
+        limit = int(request.query.get("limit", 10))
+        return web.json_response(orders[::-1][:limit])
+
+    async def _user_confirm(self, request: web.Request) -> web.Response:
+        if (failure := await self._degrade()) is not None:
+            return failure
+        self.confirms += 1
+        return web.json_response({"id": int(request.match_info["order_id"]), "user_message_id": None})
+
+    async def _degrade(self) -> Optional[web.Response]:
+        """Задержка и, с вероятностью error_rate, ответ 503."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self.failed += 1
+            return web.json_response({"detail": "stub backend failure"}, status=503)
+        return None
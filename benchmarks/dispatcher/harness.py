@@ -0,0 +1,263 @@
+"""
+Обвязка для прогона апдейтов через настоящий диспетчер.
+
+configure_environment() нужно вызвать до импорта модулей бота: config.py
+читает переменные окружения один раз при импорте. Хранилище пользователей
+и очередь заявок создаются во временном каталоге (SQLite), рабочие
+users.json / orders.db не трогаются.
+"""
+
+import asyncio
+import itertools
+import os
+import resource
+import socket
+import statistics
+import time
+from typing import Any, Iterable, Optional
+
+from benchmarks.dispatcher.fakes import FakeSession, StubBackend
+
+HOST = "127.0.0.1"
+
+# Администраторы в бенчмарке: два пользователя и админ-группа
+ADMIN_IDS = (11, 12)
+ADMIN_CHAT_ID = -1001
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(
+    workdir: str,
+    backend_port: int,
+    *,
+    order_workers: int = 4,
+    media_group_debounce: float = 0.3,
+    telegram_limits: bool = False,
+    photo_cache_bytes: int = 0,
+) -> None:
+    os.environ.update({
+        "BOT_TOKEN": "0:benchmark",
+        "ADMIN_IDS": ",".join(map(str, ADMIN_IDS)),
+        "ADMIN_CHAT_ID": str(ADMIN_CHAT_ID),
+        "BACKEND_URL": f"http://{HOST}:{backend_port}",
+        "USERS_BACKEND": "sqlite",
+        "USERS_DB_PATH": os.path.join(workdir, "users.db"),
+        "ORDER_SPOOL_PATH": os.path.join(workdir, "orders.db"),
+        "FSM_DB_PATH": os.path.join(workdir, "fsm.db"),
+        "ORDER_WORKERS": str(order_workers),
+        "MEDIA_GROUP_DEBOUNCE": str(media_group_debounce),
+        "METRICS_PORT": "0",
+        "PHOTO_CACHE_BYTES": str(photo_cache_bytes),
+    })
+    if not telegram_limits:
+        # Меряем сам бот, а не лимиты Telegram в SendScheduler
+        os.environ.update({
+            "TELEGRAM_GLOBAL_RATE": "1e9",
+            "TELEGRAM_CHAT_RATE": "1e9",
+            "TELEGRAM_GROUP_RATE_PER_MINUTE": "1e9",
+            "TELEGRAM_CHAT_BURST": "1000000",
+        })
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def median(values: list[float]) -> float:
+    return statistics.median(values) if values else 0.0
+
+
+class BotHarness:
+    """Бот + диспетчер из main.py поверх FakeSession и StubBackend."""
+
+    def __init__(
+        self,
+        backend_port: int,
+        *,
+        photo_size: int,
+        telegram_latency: float,
+        backend_latency: float,
+        backend_error_rate: float = 0.0,
+    ):
+        self.session = FakeSession(photo_size=photo_size, latency=telegram_latency)
+        self._photo_size = photo_size
+        self.backend = StubBackend(latency=backend_latency, error_rate=backend_error_rate)
+        self._backend_port = backend_port
+        self._ids = itertools.count(1)
+        # message_id -> момент отправки апдейта (для сквозной задержки заявок)
+        self.sent_at: dict[int, float] = {}
+        self.bot = None
+        self.dp = None
+
+    async def start(self) -> None:
+        import main
+
+        await self.backend.start(HOST, self._backend_port)
+        self.bot = main.create_bot(session=self.session)
+        self.dp = main.create_dispatcher()
+        await self.dp.emit_startup(bot=self.bot, bots=[self.bot], dispatcher=self.dp, **self.dp.workflow_data)
+
+    async def stop(self) -> None:
+        await self.dp.emit_shutdown(bot=self.bot, bots=[self.bot], dispatcher=self.dp, **self.dp.workflow_data)
+        await self.backend.stop()
+
+    async def seed_users(self, user_ids: Iterable[int], status: str) -> None:
+        from db.users import upsert_user
+
+        for user_id in user_ids:
+            await upsert_user(user_id, {
+                "id": user_id, "username": f"user{user_id}", "full_name": f"User {user_id}", "status": status,
+            })
+
+    # ── Апдейты ─────────────────────────────────────────────────────────────
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def message(self, user_id: int, *, text: Optional[str] = None, photo: bool = False,
+                caption: Optional[str] = None, media_group_id: Optional[str] = None,
+                photo_id: Optional[str] = None) -> dict[str, Any]:
+        update_id = self.next_id()
+        message: dict[str, Any] = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"},
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if photo:
+            # photo_id — повторно отправить уже присланное фото (тот же file_unique_id)
+            file_id = photo_id or f"photo-{update_id}"
+            message["photo"] = [
+                {"file_id": f"{file_id}-s", "file_unique_id": f"{file_id}-s", "width": 90, "height": 90},
+                {
+                    "file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960,
+                    "file_size": self._photo_size,
+                },
+            ]
+        if caption is not None:
+            message["caption"] = caption
+        if media_group_id is not None:
+            message["media_group_id"] = media_group_id
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, user_id: int, data: str, *, chat_id: int, text: str) -> dict[str, Any]:
+        update_id = self.next_id()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": f"Admin {user_id}", "username": f"admin{user_id}"},
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                    "text": text,
+                },
+            },
+        }
+
+    async def feed(self, raw: dict[str, Any]) -> float:
+        """Прогоняет апдейт через диспетчер, возвращает время обработки."""
+        from aiogram.types import Update
+
+        update = Update.model_validate(raw, context={"bot": self.bot})
+        started = time.perf_counter()
+        message = raw.get("message")
+        if message is not None:
+            self.sent_at[message["message_id"]] = started
+        await self.dp.feed_update(self.bot, update)
+        return time.perf_counter() - started
+
+    async def run_updates(self, updates: list[dict[str, Any]], concurrency: int) -> tuple[list[float], float]:
+        """Скармливает апдейты с ограничением параллельности (как воркеры webhook)."""
+        latencies: list[float] = []
+        queue: asyncio.Queue = asyncio.Queue()
+        for raw in updates:
+            queue.put_nowait(raw)
+
+        async def worker():
+            while not queue.empty():
+                latencies.append(await self.feed(queue.get_nowait()))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, time.perf_counter() - started
+
+    async def wait_orders(self, count: int, timeout: float) -> None:
+        deadline = time.perf_counter() + timeout
+        while self.backend.orders < count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"бэкенд получил {self.backend.orders} заявок из {count}")
+            self.backend.order_received.clear()
+            try:
+                await asyncio.wait_for(self.backend.order_received.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def order_latencies(self) -> list[float]:
+        return [
+            received - self.sent_at[message_id]
+            for message_id, received in self.backend.received.items()
+            if message_id in self.sent_at
+        ]
+
+
+def summarize(name: str, result: dict[str, Any], h: BotHarness) -> dict[str, Any]:
+    """
+    Сводка прогона. result: updates, latencies, elapsed и, если были
+    заявки, orders и orders_elapsed; extra — дополнительные поля сценария
+    (попадают только в JSON).
+    """
+    latencies = result["latencies"]
+    summary = {
+        "scenario": name,
+        "updates": result["updates"],
+        "updates_per_s": result["updates"] / result["elapsed"],
+        "p50_ms": median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "api_calls": sum(h.session.calls.values()),
+    }
+    if result.get("orders"):
+        order_latencies = h.order_latencies()
+        summary.update({
+            "orders_per_s": result["orders"] / result["orders_elapsed"],
+            "order_p50_ms": median(order_latencies) * 1000,
+            "order_p99_ms": percentile(order_latencies, 0.99) * 1000,
+        })
+    summary.update(result.get("extra", {}))
+    return summary
+
+
+def print_table(rows: list[dict]) -> None:
+    header = (
+        f"{'scenario':>16} | {'updates':>7} | {'upd/s':>8} | {'p50 ms':>7} | {'p99 ms':>7} | "
+        f"{'orders/s':>8} | {'ord p50':>8} | {'ord p99':>8} | {'RSS MB':>7} | {'API':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        orders = (
+            f"{row['orders_per_s']:>8.1f} | {row['order_p50_ms']:>8.1f} | {row['order_p99_ms']:>8.1f}"
+            if "orders_per_s" in row else f"{'-':>8} | {'-':>8} | {'-':>8}"
+        )
+        print(
+            f"{row['scenario']:>16} | {row['updates']:>7} | {row['updates_per_s']:>8.0f} | "
+            f"{row['p50_ms']:>7.2f} | {row['p99_ms']:>7.2f} | {orders} | "
+            f"{row['peak_rss_mb']:>7.1f} | {row['api_calls']:>6}"
+        )
@@ -0,0 +1,179 @@
+"""
+Воспроизведение записанной трассы апдейтов (TRACE_RECORD_PATH) через
+настоящий диспетчер — с фейковым Telegram и заглушкой бэкенда, как
+в python -m benchmarks.dispatcher.
+
+Интервалы между апдейтами сохраняются с коэффициентом сжатия времени:
+--speed 10 проигрывает час трафика за 6 минут, --speed 0 — без пауз.
+Параллельность обработки ограничена --concurrency (как воркеры webhook);
+если воркеров не хватает, апдейты обрабатываются с опозданием — оно
+выводится отдельно (lag p50/p99).
+
+Пользователи из трассы заводятся в хранилище заранее (--seed auto):
+верифицированными, кроме тех, чей первый апдейт — /start. Администраторы
+трассы (role=admin) подменяются администраторами бенчмарка.
+
+Запуск:
+    python -m benchmarks.dispatcher.replay --trace trace.jsonl --speed 10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.dispatcher import harness
+from benchmarks.dispatcher.harness import ADMIN_IDS, BotHarness, median, percentile, print_table, summarize
+
+
+def load_trace(path: str) -> list[dict[str, Any]]:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def _sender(update: dict[str, Any]) -> dict[str, Any] | None:
+    event = update.get("message") or update.get("callback_query") or {}
+    return event.get("from")
+
+
+def _map_admins(records: list[dict[str, Any]]) -> None:
+    """Подменяет администраторов трассы на ADMIN_IDS бенчмарка."""
+    mapping: dict[int, int] = {}
+    for record in records:
+        sender = _sender(record["update"])
+        if record.get("role") != "admin" or sender is None:
+            continue
+        original = sender["id"]
+        admin_id = mapping.setdefault(original, ADMIN_IDS[len(mapping) % len(ADMIN_IDS)])
+        sender["id"] = admin_id
+        message = record["update"].get("message")
+        if message and message["chat"]["id"] == original:
+            message["chat"]["id"] = admin_id
+
+
+def _users_to_seed(records: list[dict[str, Any]]) -> list[int]:
+    first_text: dict[int, str] = {}
+    for record in records:
+        if record.get("role") == "admin":
+            continue
+        sender = _sender(record["update"])
+        if sender is None or sender["id"] in first_text:
+            continue
+        message = record["update"].get("message") or {}
+        first_text[sender["id"]] = message.get("text") or ""
+    return [user_id for user_id, text in first_text.items() if not text.startswith("/start")]
+
+
+async def _replay(h: BotHarness, records: list[dict[str, Any]], speed: float, concurrency: int) -> dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    lags: list[float] = []
+    t0 = records[0]["ts"]
+
+    async def play(scheduled: float, update: dict[str, Any]) -> None:
+        async with semaphore:
+            lags.append(time.perf_counter() - scheduled)
+            try:
+                latencies.append(await h.feed(update))
+            except Exception:
+                logging.exception("Ошибка обработки апдейта %s", update.get("update_id"))
+
+    started = time.perf_counter()
+    tasks = []
+    for record in records:
+        scheduled = started + (record["ts"] - t0) / speed if speed else started
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(play(scheduled, record["update"])))
+    await asyncio.gather(*tasks)
+    return {"latencies": latencies, "lags": lags, "elapsed": time.perf_counter() - started, "started": started}
+
+
+async def _wait_quiet(h: BotHarness, quiet: float) -> None:
+    """Ждёт, пока бэкенд не перестанет получать заявки в течение `quiet` секунд."""
+    while True:
+        h.backend.order_received.clear()
+        try:
+            await asyncio.wait_for(h.backend.order_received.wait(), timeout=quiet)
+        except asyncio.TimeoutError:
+            return
+
+
+async def _run(args) -> dict[str, Any]:
+    records = load_trace(args.trace)
+    if not records:
+        raise SystemExit(f"Трасса {args.trace} пуста")
+    _map_admins(records)
+
+    h = BotHarness(
+        args.backend_port,
+        photo_size=args.photo_kb * 1024,
+        telegram_latency=args.telegram_latency,
+        backend_latency=args.backend_latency,
+    )
+    await h.start()
+    try:
+        if args.seed == "auto":
+            await h.seed_users(_users_to_seed(records), "approved")
+        result = await _replay(h, records, args.speed, args.concurrency)
+        await _wait_quiet(h, args.drain)
+    finally:
+        await h.stop()
+
+    last_order = max(h.backend.received.values(), default=result["started"])
+    summary = summarize("replay", {
+        "updates": len(records),
+        "latencies": result["latencies"],
+        "elapsed": result["elapsed"],
+        "orders": h.backend.orders,
+        "orders_elapsed": max(last_order - result["started"], 1e-9),
+    }, h)
+    summary["trace_span_s"] = records[-1]["ts"] - records[0]["ts"]
+    summary["lag_p50_ms"] = median(result["lags"]) * 1000
+    summary["lag_p99_ms"] = percentile(result["lags"], 0.99) * 1000
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", required=True, help="файл трассы (TRACE_RECORD_PATH)")
+    parser.add_argument("--speed", type=float, default=1.0, help="сжатие времени; 0 — без пауз")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", choices=("auto", "none"), default="auto", help="заводить ли пользователей заранее")
+    parser.add_argument("--drain", type=float, default=3.0, help="ждать заявки, пока бэкенд молчит меньше, с")
+    parser.add_argument("--photo-kb", type=int, default=200)
+    parser.add_argument("--order-workers", type=int, default=4)
+    parser.add_argument("--media-group-debounce", type=float, default=0.3)
+    parser.add_argument("--telegram-latency", type=float, default=0.0)
+    parser.add_argument("--backend-latency", type=float, default=0.0)
+    parser.add_argument("--telegram-limits", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    args.backend_port = harness.free_port()
+    harness.configure_environment(
+        tempfile.mkdtemp(prefix="bench-replay-"),
+        args.backend_port,
+        order_workers=args.order_workers,
+        media_group_debounce=args.media_group_debounce,
+        telegram_limits=args.telegram_limits,
+    )
+    summary = asyncio.run(_run(args))
+    print_table([summary])
+    print(
+        f"трасса {summary['trace_span_s']:.1f} с при --speed {args.speed:g}; "
+        f"опоздание старта обработки p50 {summary['lag_p50_ms']:.1f} мс, p99 {summary['lag_p99_ms']:.1f} мс"
+    )
+
+
+if __name__ == "__main__":
+    main()
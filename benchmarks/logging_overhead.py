@@ -0,0 +1,152 @@
+"""
+Микробенчмарк: накладные расходы LoggingMiddleware на один апдейт.
+
+Сравнивает прежнюю реализацию (f-строка + синхронная запись из event
+loop) с текущей (очередь + фоновый поток, services/logging_setup.py):
+
+  - before          — прежний middleware, FileHandler прямо в loop;
+  - after           — текущий middleware, каждая запись уходит в очередь;
+  - after/ratelimit — 1000 активных пользователей, лимит 30 записей в минуту;
+  - after/warning   — уровень WARNING: запись отсекается до форматирования.
+
+Каждый сценарий гоняется дважды: с записью в обычный файл (буферизованный,
+почти бесплатный) и с «медленным» приёмником — каждая запись ждёт
+--sink-latency секунд, как консоль или забитый pipe docker logs.
+
+Запуск:
+    python -m benchmarks.logging_overhead --updates 20000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+from aiogram import BaseMiddleware  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+
+from config import is_admin  # noqa: E402
+from middlewares.logging_mw import LoggingMiddleware  # noqa: E402
+from services import logging_setup  # noqa: E402
+
+logger = logging.getLogger("UserLog")
+
+
+class LegacyLoggingMiddleware(BaseMiddleware):
+    """LoggingMiddleware до перехода на очередь — для сравнения."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user:
+            role = "👑 ADMIN" if is_admin(user.id) else "👤 USER"
+            username = f"@{user.username}" if user.username else "нет username"
+            text = (event.text or event.caption or "[медиа]")[:60]
+            logger.info(
+                f"{role} | ID: {user.id} | {username} | "
+                f"Имя: {user.full_name!r} | Сообщение: {text!r}"
+            )
+        return await handler(event, data)
+
+
+def _make_events(count: int, users: int) -> list[tuple[Message, dict]]:
+    events = []
+    for n in range(count):
+        user_id = 1000 + n % users
+        message = Message.model_validate({
+            "message_id": n,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"user{user_id}"},
+            "text": f"сообщение номер {n} " * 4,
+        })
+        events.append((message, {"event_from_user": message.from_user}))
+    return events
+
+
+async def _noop(event, data):
+    return None
+
+
+async def _measure(middleware, events) -> float:
+    started = time.perf_counter()
+    for event, data in events:
+        await middleware(_noop, event, data)
+    return (time.perf_counter() - started) / len(events) * 1e6
+
+
+class _SlowFile:
+    """Файл, запись в который занимает `latency` секунд."""
+
+    def __init__(self, path: str, latency: float):
+        self._file = open(path, "a", encoding="utf-8")
+        self._latency = latency
+
+    def write(self, data: str) -> int:
+        if self._latency:
+            time.sleep(self._latency)
+        return self._file.write(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _reset_root() -> logging.Logger:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    return root
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--sink-latency", type=float, default=0.0002, help="задержка записи медленного приёмника, с")
+    args = parser.parse_args()
+
+    log_path = os.path.join(tempfile.mkdtemp(), "bench.log")
+    real_stderr = sys.stderr
+    results: list[tuple[str, str, float]] = []
+    try:
+        for sink_name, latency in (("file", 0.0), ("slow", args.sink_latency)):
+            # Фоновый поток пишет в sys.stderr — подменяем его тем же приёмником
+            sys.stderr = _SlowFile(log_path, latency)
+
+            root = _reset_root()
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter(logging_setup.TEXT_FORMAT))
+            root.addHandler(handler)
+            root.setLevel(logging.INFO)
+            per_update = await _measure(LegacyLoggingMiddleware(), _make_events(args.updates, 1000))
+            results.append(("before", sink_name, per_update))
+            _reset_root()
+
+            scenarios = [
+                ("after", "INFO", {}),
+                ("after/ratelimit", "INFO", {"user_rate_per_minute": 30}),
+                ("after/warning", "WARNING", {}),
+            ]
+            for name, level, options in scenarios:
+                logging_setup.setup_logging(level=level, fmt="json", queue_size=args.updates)
+                per_update = await _measure(LoggingMiddleware(**options), _make_events(args.updates, 1000))
+                results.append((name, sink_name, per_update))
+                logging_setup.stop_logging()
+            sys.stderr.close()
+    finally:
+        sys.stderr = real_stderr
+
+    print(f"{'scenario':>16} | {'sink':>6} | {'µs/update':>10}")
+    for name, sink_name, per_update in results:
+        print(f"{name:>16} | {sink_name:>6} | {per_update:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
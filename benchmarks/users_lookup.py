@@ -0,0 +1,72 @@
+"""
+Бенчмарк чтения статуса пользователя.
+
+Сравнивает get_status() из реестра в памяти со старым путём
+(чтение и разбор всего users.json на каждый вызов) на 10k, 100k и 1M
+пользователей.
+
+Запуск:
+    python -m benchmarks.users_lookup
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+from db import users  # noqa: E402
+from db.json_storage import JsonUserStorage, _write_snapshot  # noqa: E402
+from db.users import UserStatus  # noqa: E402
+
+SIZES = (10_000, 100_000, 1_000_000)
+LOOKUPS = 100_000
+# Старый путь слишком медленный, чтобы гонять его на каждом размере
+LEGACY_LOOKUPS = 20
+
+
+async def _legacy_get_status(storage: JsonUserStorage, user_id: int):
+    data = await storage._read()
+    user = data.get(str(user_id))
+    return UserStatus(user["status"]) if user else None
+
+
+async def _bench(size: int) -> None:
+    tmp = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp.name, "users.json")
+    statuses = list(UserStatus)
+    _write_snapshot(path, {
+        str(user_id): {"id": user_id, "status": statuses[user_id % 3].value}
+        for user_id in range(size)
+    })
+    registry = JsonUserStorage(path, flush_interval=3600, flush_threshold=size + 1)
+    users._storage = registry
+    await users.init_storage()
+
+    ids = [random.randrange(size) for _ in range(LOOKUPS)]
+    started = time.perf_counter()
+    for user_id in ids:
+        await users.get_status(user_id)
+    registry_us = (time.perf_counter() - started) / LOOKUPS * 1e6
+
+    started = time.perf_counter()
+    for user_id in ids[:LEGACY_LOOKUPS]:
+        await _legacy_get_status(registry, user_id)
+    legacy_us = (time.perf_counter() - started) / LEGACY_LOOKUPS * 1e6
+
+    await users.close_storage()
+    tmp.cleanup()
+
+    print(f"{size:>10,} | {registry_us:>12.2f} | {legacy_us:>14.0f} | x{legacy_us / registry_us:,.0f}")
+
+
+async def main() -> None:
+    print(f"{'users':>10} | {'registry, µs':>12} | {'users.json, µs':>14} | speedup")
+    for size in SIZES:
+        await _bench(size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,184 @@
+"""
+Нагрузочный стенд: webhook против long polling.
+
+Поднимает локальный фейковый Telegram API, отправляет синтетические
+апдейты и меряет пропускную способность (апдейтов/с) и задержку от
+отправки апдейта до окончания хендлера (p50/p99).
+
+  - webhook — апдейты POST'ятся в WebhookServer (services/webhook.py);
+  - polling — апдейты отдаются диспетчеру через фейковый getUpdates.
+
+Хендлер имитирует работу через --handler-delay, чтобы было видно,
+как медленные хендлеры влияют на приём.
+
+Запуск:
+    python -m benchmarks.webhook_load --updates 5000 --handler-delay 0.02
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+from aiogram import Bot, Dispatcher, Router  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from aiohttp import ClientSession, web  # noqa: E402
+
+from services.webhook import WebhookServer, SECRET_HEADER  # noqa: E402
+
+HOST = "127.0.0.1"
+TELEGRAM_PORT = 8781
+WEBHOOK_PORT = 8782
+SECRET = "benchmark-secret"
+
+
+def _make_update(update_id: int) -> dict:
+    # Момент отправки передаём в тексте — хендлер по нему считает задержку
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": update_id % 1000, "type": "private"},
+            "from": {"id": update_id % 1000, "is_bot": False, "first_name": "Load"},
+            "text": repr(time.perf_counter()),
+        },
+    }
+
+
+class FakeTelegram:
+    """Минимальный Bot API: getMe, getUpdates из очереди, остальное — ok."""
+
+    def __init__(self):
+        self.updates: asyncio.Queue[dict] = asyncio.Queue()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+            }})
+        if method == "getUpdates":
+            batch = []
+            try:
+                batch.append(await asyncio.wait_for(self.updates.get(), timeout=1))
+                while len(batch) < 100 and not self.updates.empty():
+                    batch.append(self.updates.get_nowait())
+            except asyncio.TimeoutError:
+                pass
+            return web.json_response({"ok": True, "result": batch})
+        return web.json_response({"ok": True, "result": True})
+
+
+def _build_dispatcher(latencies: list[float], done: asyncio.Event, total: int, delay: float) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message):
+        if delay:
+            await asyncio.sleep(delay)
+        latencies.append(time.perf_counter() - float(message.text))
+        if len(latencies) >= total:
+            done.set()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def _report(mode: str, latencies: list[float], elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{mode:>8} | {len(latencies) / elapsed:>10.0f} | {p50:>8.1f} | {p99:>8.1f}")
+
+
+async def _run_webhook(bot: Bot, args) -> None:
+    latencies: list[float] = []
+    done = asyncio.Event()
+    dp = _build_dispatcher(latencies, done, args.updates, args.handler_delay)
+    server = WebhookServer(
+        bot, dp, path="/webhook", secret_token=SECRET,
+        queue_size=args.queue_size, workers=args.workers,
+    )
+    await server.start(HOST, WEBHOOK_PORT)
+
+    url = f"http://{HOST}:{WEBHOOK_PORT}/webhook"
+    next_id = iter(range(1, args.updates + 1))
+
+    async def sender(session: ClientSession):
+        for update_id in next_id:
+            while True:
+                async with session.post(url, json=_make_update(update_id), headers={SECRET_HEADER: SECRET}) as resp:
+                    if resp.status != 503:
+                        break
+                await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(args.concurrency)))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await server.stop()
+    _report("webhook", latencies, elapsed)
+
+
+async def _run_polling(bot: Bot, telegram: FakeTelegram, args) -> None:
+    latencies: list[float] = []
+    done = asyncio.Event()
+    dp = _build_dispatcher(latencies, done, args.updates, args.handler_delay)
+
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    for update_id in range(1, args.updates + 1):
+        telegram.updates.put_nowait(_make_update(update_id))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await dp.stop_polling()
+    await polling
+    _report("polling", latencies, elapsed)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("webhook", "polling", "both"), default="both")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50, help="параллельных отправителей (webhook)")
+    parser.add_argument("--handler-delay", type=float, default=0.0, help="имитация работы хендлера, с")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    # Отказы при переполненной очереди — ожидаемая часть нагрузки, не шумим
+    logging.getLogger("services.webhook").setLevel(logging.ERROR)
+
+    telegram = FakeTelegram()
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", telegram.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, TELEGRAM_PORT).start()
+
+    bot = Bot(
+        os.environ["BOT_TOKEN"],
+        session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://{HOST}:{TELEGRAM_PORT}")),
+    )
+    print(f"{'mode':>8} | {'updates/s':>10} | {'p50, ms':>8} | {'p99, ms':>8}")
+    try:
+        if args.mode in ("webhook", "both"):
+            await _run_webhook(bot, args)
+        if args.mode in ("polling", "both"):
+            await _run_polling(bot, telegram, args)
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
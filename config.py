@@ -25,12 +25,207 @@ ADMIN_IDS: set[int] = {
     if x.strip().isdigit()
 }
 
+# Сколько заявок на верификацию показывать на одной странице /pending
+PENDING_PAGE_SIZE: int = int(os.getenv("PENDING_PAGE_SIZE", "20"))
+
 # URL бэкенда Pulse TTM
 BACKEND_URL: str = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
 
 # Секретный ключ для подписи запросов к API (должен совпадать с backend .env)
 BOT_SECRET_KEY: str = os.getenv("BOT_SECRET_KEY", "")
 
+# ── Webhook (main.py --mode webhook) ──
+# Публичный адрес бота (https://bot.example.com). Если пуст — webhook в Telegram не регистрируется
+WEBHOOK_BASE_URL: str = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+
+# Размер очереди принятых апдейтов и число задач, которые её разбирают
+WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "32"))
+
+# Сборка альбомов: сколько ждать следующую часть (секунды, окно сдвигается
+# с каждой частью) и сколько максимум ждать с первой части
+MEDIA_GROUP_DEBOUNCE: float = float(os.getenv("MEDIA_GROUP_DEBOUNCE", "0.3"))
+MEDIA_GROUP_MAX_WAIT: float = float(os.getenv("MEDIA_GROUP_MAX_WAIT", "3"))
+
+# Таймауты запросов к бэкенду (секунды): обычные вызовы / загрузка заявки с фото / установка соединения
+BACKEND_TIMEOUT: float = float(os.getenv("BACKEND_TIMEOUT", "10"))
+BACKEND_UPLOAD_TIMEOUT: float = float(os.getenv("BACKEND_UPLOAD_TIMEOUT", "120"))
+BACKEND_CONNECT_TIMEOUT: float = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+
+# Предохранитель бэкенда: окно статистики (секунды), минимум вызовов в окне и доля ошибок,
+# при которой запросы перестают отправляться, и сколько секунд ждать до пробного запроса
+BACKEND_BREAKER_WINDOW: float = float(os.getenv("BACKEND_BREAKER_WINDOW", "60"))
+BACKEND_BREAKER_MIN_CALLS: int = int(os.getenv("BACKEND_BREAKER_MIN_CALLS", "10"))
+BACKEND_BREAKER_ERROR_RATE: float = float(os.getenv("BACKEND_BREAKER_ERROR_RATE", "0.5"))
+BACKEND_BREAKER_OPEN_SECONDS: float = float(os.getenv("BACKEND_BREAKER_OPEN_SECONDS", "30"))
+
+# Адаптивный таймаут: p99 задержки ответов × множитель, но не меньше минимума (секунды)
+# и не больше BACKEND_TIMEOUT / BACKEND_UPLOAD_TIMEOUT
+BACKEND_TIMEOUT_MULTIPLIER: float = float(os.getenv("BACKEND_TIMEOUT_MULTIPLIER", "3"))
+BACKEND_TIMEOUT_MIN: float = float(os.getenv("BACKEND_TIMEOUT_MIN", "2"))
+# Запас адаптивного таймаута загрузки заявки на каждый МБ фото (секунды; 2 — не медленнее 0.5 МБ/с)
+BACKEND_UPLOAD_SECONDS_PER_MB: float = float(os.getenv("BACKEND_UPLOAD_SECONDS_PER_MB", "2"))
+
+# Пул соединений с бэкендом: максимум соединений и время жизни кэша DNS (секунды)
+BACKEND_POOL_LIMIT: int = int(os.getenv("BACKEND_POOL_LIMIT", "20"))
+BACKEND_DNS_TTL: int = int(os.getenv("BACKEND_DNS_TTL", "300"))
+
+# Сколько фото одновременно скачивается из Telegram (на весь процесс)
+PHOTO_DOWNLOAD_CONCURRENCY: int = int(os.getenv("PHOTO_DOWNLOAD_CONCURRENCY", "8"))
+
+# Как фото попадают на бэкенд:
+#   stream — перекачиваются из Telegram прямо в тело запроса (chunked), память ~ PHOTO_CHUNK_SIZE
+#   spool  — сначала скачиваются во временные файлы, запрос уходит с Content-Length
+PHOTO_UPLOAD_MODE: str = os.getenv("PHOTO_UPLOAD_MODE", "stream").lower()
+
+# Размер куска при перекачке фото (байты)
+PHOTO_CHUNK_SIZE: int = int(os.getenv("PHOTO_CHUNK_SIZE", "65536"))
+
+# Логирование: уровень, формат (json — JSON-строки, text — как раньше),
+# файл в дополнение к консоли (пусто — только консоль) и размер очереди записей
+LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+LOG_FILE: str = os.getenv("LOG_FILE", "")
+LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Лог входящих сообщений: доля записываемых событий (0..1)
+# и максимум записей на пользователя в минуту (0 — без ограничения)
+LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+LOG_USER_RATE_PER_MINUTE: float = float(os.getenv("LOG_USER_RATE_PER_MINUTE", "30"))
+
+# Запись входящих апдейтов в трассу JSONL для воспроизведения (пусто — не записывать)
+TRACE_RECORD_PATH: str = os.getenv("TRACE_RECORD_PATH", "")
+
+# Соль для псевдонимов ID в трассе; пусто — случайная на каждый запуск
+TRACE_SALT: str = os.getenv("TRACE_SALT", "")
+
+# Метрики Prometheus: порт эндпоинта /metrics (0 — метрики выключены) и адрес
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Трассы этапов заявок: файл JSONL (пусто — не собирать), размер файла до ротации (байты)
+# и сколько ротированных файлов хранить. Отчёт: python -m services.trace_report
+ORDER_TRACE_PATH: str = os.getenv("ORDER_TRACE_PATH", "")
+ORDER_TRACE_MAX_BYTES: int = int(os.getenv("ORDER_TRACE_MAX_BYTES", str(16 * 1024 * 1024)))
+ORDER_TRACE_BACKUPS: int = int(os.getenv("ORDER_TRACE_BACKUPS", "5"))
+
+# Предел длительности профиля event loop по команде /profile (секунды)
+PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Лимиты отправки в Telegram: сообщений в секунду на весь бот, в секунду в личный чат,
+# в минуту в группу и сколько сообщений в чат можно отправить подряд без ожидания
+TELEGRAM_GLOBAL_RATE: float = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE: float = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE_PER_MINUTE: float = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))
+TELEGRAM_CHAT_BURST: int = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+
+# Сколько раз повторять запрос после ответа Telegram «Too Many Requests» (RetryAfter)
+TELEGRAM_MAX_RETRIES: int = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# Какой вариант фото брать из Telegram: наименьший, у которого длинная сторона
+# не меньше этого значения в пикселях (0 — всегда самый большой)
+PHOTO_TARGET_SIDE: int = int(os.getenv("PHOTO_TARGET_SIDE", "1280"))
+
+# Бюджет на одно фото (байты, 0 — без ограничения): фото больше бюджета пережимаются
+# (PHOTO_RECOMPRESS) или заменяются вариантом поменьше
+PHOTO_MAX_BYTES: int = int(os.getenv("PHOTO_MAX_BYTES", "0"))
+
+# Пережатие фото больше бюджета (нужен Pillow): длинная сторона, качество JPEG, число процессов
+PHOTO_RECOMPRESS: bool = os.getenv("PHOTO_RECOMPRESS", "0").lower() in ("1", "true", "yes")
+PHOTO_RECOMPRESS_SIDE: int = int(os.getenv("PHOTO_RECOMPRESS_SIDE", "1600"))
+PHOTO_RECOMPRESS_QUALITY: int = int(os.getenv("PHOTO_RECOMPRESS_QUALITY", "85"))
+PHOTO_RECOMPRESS_WORKERS: int = int(os.getenv("PHOTO_RECOMPRESS_WORKERS", "2"))
+
+# Кэш скачанных фото (по file_unique_id): бюджет памяти в байтах (0 — кэш выключен),
+# каталог и бюджет кэша на диске (пустой каталог — только память), время жизни записи (секунды).
+# Кэшируемое фото скачивается в память целиком, мимо PHOTO_UPLOAD_MODE, — по умолчанию выключен
+PHOTO_CACHE_BYTES: int = int(os.getenv("PHOTO_CACHE_BYTES", "0"))
+PHOTO_CACHE_DIR: str = os.getenv("PHOTO_CACHE_DIR", "")
+PHOTO_CACHE_DISK_BYTES: int = int(os.getenv("PHOTO_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+PHOTO_CACHE_TTL: float = float(os.getenv("PHOTO_CACHE_TTL", "3600"))
+
+# Очередь исходящих заявок: файл SQLite и число воркеров, отправляющих заявки на бэкенд
+ORDER_SPOOL_PATH: str = os.getenv("ORDER_SPOOL_PATH", "orders.db")
+ORDER_WORKERS: int = int(os.getenv("ORDER_WORKERS", "4"))
+
+# Повторные попытки отправки: максимум попыток и границы экспоненциальной задержки (секунды)
+ORDER_MAX_ATTEMPTS: int = int(os.getenv("ORDER_MAX_ATTEMPTS", "8"))
+ORDER_RETRY_BASE_DELAY: float = float(os.getenv("ORDER_RETRY_BASE_DELAY", "2"))
+ORDER_RETRY_MAX_DELAY: float = float(os.getenv("ORDER_RETRY_MAX_DELAY", "300"))
+
+# Сколько секунд помнить ключи отправленных заявок: повтор того же сообщения/альбома
+# за это время не отправляется заново, а получает номер уже созданной заявки
+ORDER_DEDUPE_TTL: float = float(os.getenv("ORDER_DEDUPE_TTL", "86400"))
+
+# Сколько секунд хранить в очереди заявки, которые так и не удалось отправить (0 — бессрочно)
+ORDER_FAILED_TTL: float = float(os.getenv("ORDER_FAILED_TTL", "604800"))
+
+# Как часто (не чаще, секунды) показывать ход отправки в статусном сообщении заявки (0 — не показывать)
+ORDER_PROGRESS_INTERVAL: float = float(os.getenv("ORDER_PROGRESS_INTERVAL", "2"))
+
+# Через сколько секунд заявка, взятая воркером (например, упавшим процессом), снова попадает в очередь
+ORDER_LEASE_SECONDS: float = float(os.getenv("ORDER_LEASE_SECONDS", str(BACKEND_UPLOAD_TIMEOUT + 60)))
+
+# Список заявок /orders: сколько последних заявок показывать; сколько секунд список в кэше
+# свежий (0 — без кэша) и сколько ещё отдаётся устаревшим, пока обновляется в фоне;
+# для скольких пользователей держать списки
+ORDERS_LIST_LIMIT: int = int(os.getenv("ORDERS_LIST_LIMIT", "10"))
+ORDERS_CACHE_TTL: float = float(os.getenv("ORDERS_CACHE_TTL", "30"))
+ORDERS_CACHE_STALE: float = float(os.getenv("ORDERS_CACHE_STALE", "300"))
+ORDERS_CACHE_MAX_USERS: int = int(os.getenv("ORDERS_CACHE_MAX_USERS", "10000"))
+
+# Ограничения на пользователя (ThrottleMiddleware): сообщений и нажатий кнопок в минуту и запас
+# (альбом считается одним сообщением); сколько секунд апдейт может ждать своей очереди, прежде чем
+# будет отклонён (0 — отклонять сразу); 0 в частоте — без ограничения
+THROTTLE_MESSAGE_RATE_PER_MINUTE: float = float(os.getenv("THROTTLE_MESSAGE_RATE_PER_MINUTE", "20"))
+THROTTLE_MESSAGE_BURST: float = float(os.getenv("THROTTLE_MESSAGE_BURST", "5"))
+THROTTLE_CALLBACK_RATE_PER_MINUTE: float = float(os.getenv("THROTTLE_CALLBACK_RATE_PER_MINUTE", "60"))
+THROTTLE_CALLBACK_BURST: float = float(os.getenv("THROTTLE_CALLBACK_BURST", "10"))
+THROTTLE_MAX_WAIT: float = float(os.getenv("THROTTLE_MAX_WAIT", "2"))
+
+# Допуск заявок: не больше стольких неотправленных заявок на пользователя и байт фото
+# во всей очереди на отправку (0 — без ограничения)
+ORDER_USER_MAX_PENDING: int = int(os.getenv("ORDER_USER_MAX_PENDING", "3"))
+ORDER_MAX_BACKLOG_BYTES: int = int(os.getenv("ORDER_MAX_BACKLOG_BYTES", str(256 * 1024 * 1024)))
+
+# Хранилище пользователей: json (users.json) или sqlite
+USERS_BACKEND: str = os.getenv("USERS_BACKEND", "json").lower()
+
+# Путь к базе SQLite (для USERS_BACKEND=sqlite)
+USERS_DB_PATH: str = os.getenv("USERS_DB_PATH", "users.db")
+
+# JSON-хранилище: как часто (в секундах) журнал изменений сворачивается в users.json
+USERS_FLUSH_INTERVAL: float = float(os.getenv("USERS_FLUSH_INTERVAL", "5"))
+
+# ... и сколько записей журнала можно накопить, прежде чем свернуть его немедленно
+USERS_FLUSH_THRESHOLD: int = int(os.getenv("USERS_FLUSH_THRESHOLD", "50"))
+
+# Хранилище состояний FSM (редактирование заявки и т.п.):
+# sqlite — переживает перезапуск и общее для всех процессов, memory — только в памяти процесса
+FSM_STORAGE: str = os.getenv("FSM_STORAGE", "sqlite").lower()
+FSM_DB_PATH: str = os.getenv("FSM_DB_PATH", "fsm.db")
+
+# Через сколько секунд без изменений состояние FSM считается устаревшим
+FSM_TTL: float = float(os.getenv("FSM_TTL", "86400"))
+
+# Запись состояний пачками: как часто (секунды) и при скольких изменённых ключах сбрасывать сразу
+FSM_FLUSH_INTERVAL: float = float(os.getenv("FSM_FLUSH_INTERVAL", "0.1"))
+FSM_FLUSH_BATCH: int = int(os.getenv("FSM_FLUSH_BATCH", "100"))
+
+# Число процессов-воркеров (main.py --workers); больше 1 — нужны общие хранилища
+# USERS_BACKEND=sqlite и FSM_STORAGE=sqlite
+WORKERS: int = int(os.getenv("WORKERS", "1"))
+
+# Проверка воркеров: как часто пинговать (секунды) и через сколько секунд без ответа перезапускать
+WORKER_HEALTH_INTERVAL: float = float(os.getenv("WORKER_HEALTH_INTERVAL", "5"))
+WORKER_HEALTH_TIMEOUT: float = float(os.getenv("WORKER_HEALTH_TIMEOUT", "30"))
+
 
 def is_admin(user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором."""
@@ -0,0 +1,61 @@
+"""
+Интерфейс хранилища пользователей.
+
+Конкретные реализации (JSON, SQLite) подключаются в db/users.py
+через настройку USERS_BACKEND. Хранилище оперирует «сырыми» словарями
+пользователя; статус хранится строкой (значение UserStatus).
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+
+
+class UserStorage(ABC):
+    def __init__(self):
+        self._opened = False
+        self._open_lock = asyncio.Lock()
+
+    async def ensure_open(self) -> None:
+        """Открывает хранилище при первом обращении (повторные вызовы — no-op)."""
+        if self._opened:
+            return
+        async with self._open_lock:
+            if not self._opened:
+                await self._open()
+                self._opened = True
+
+    async def close(self) -> None:
+        if self._opened:
+            await self._close()
+            self._opened = False
+
+    @abstractmethod
+    async def _open(self) -> None:
+        ...
+
+    @abstractmethod
+    async def _close(self) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, user_id: int) -> Optional[dict]:
+        """Возвращает копию записи пользователя или None."""
+
+    @abstractmethod
+    async def upsert(self, user_id: int, payload: dict) -> None:
+        """Создаёт пользователя или обновляет переданные поля."""
+
+    @abstractmethod
+    async def list_by_status(self, status: str, *, after_id: int = 0, limit: Optional[int] = None) -> list[dict]:
+        """
+        Пользователи с данным статусом, по возрастанию ID: с ID больше after_id,
+        не больше limit (keyset-пагинация — следующая страница после последнего ID).
+        """
+
+    @abstractmethod
+    async def set_status_batch(self, user_ids: Iterable[int], status: str, *, expected: str) -> list[int]:
+        """
+        Одной транзакцией ставит status тем из user_ids, у кого сейчас статус
+        expected. Возвращает ID, которые действительно изменились.
+        """
@@ -0,0 +1,228 @@
+"""
+SQLite-хранилище состояний FSM (aiogram BaseStorage).
+
+Состояние «редактирование заявки» (CorrectionState + replace_id) переживает
+перезапуск и видно всем процессам бота, работающим с одной базой:
+WAL позволяет читать параллельно с записью, busy_timeout — дождаться
+чужой транзакции вместо ошибки «database is locked».
+
+Запись пачками: set_state / set_data кладут изменение в буфер процесса,
+фоновая задача сбрасывает буфер одной транзакцией раз в flush_interval
+(или сразу, когда накопилось flush_batch ключей). Чтение в этом же процессе
+сначала смотрит в буфер, так что свои изменения видны сразу; другим
+процессам — после сброса (не позже flush_interval).
+
+Состояния, не менявшиеся дольше ttl секунд, считаются устаревшими:
+при чтении они игнорируются, а фоновая задача периодически их удаляет.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key        TEXT PRIMARY KEY,
+    state      TEXT,
+    data       TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm(updated_at);
+"""
+
+# Как часто удалять устаревшие состояния (секунды)
+_CLEANUP_INTERVAL = 600.0
+
+# Незаданное значение в буфере (None — допустимое состояние)
+_UNSET = object()
+
+
+class SqliteFSMStorage(BaseStorage):
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl: float,
+        flush_interval: float,
+        flush_batch: int,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self._path = path
+        self._ttl = ttl
+        self._flush_interval = flush_interval
+        self._flush_batch = max(1, flush_batch)
+        self._key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._db: Optional[aiosqlite.Connection] = None
+        self._open_lock = asyncio.Lock()
+        # Операции (запрос + commit) на общем соединении не должны перемежаться
+        self._lock = asyncio.Lock()
+        # key -> [state | _UNSET, data | _UNSET, время изменения]
+        self._pending: dict[str, list] = {}
+        self._flush_wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ── Жизненный цикл ──────────────────────────────────────────────────────
+    async def _ensure_open(self) -> aiosqlite.Connection:
+        if self._db is None:
+            async with self._open_lock:
+                if self._db is None:
+                    db = await aiosqlite.connect(self._path)
+                    await db.execute("PRAGMA journal_mode=WAL")
+                    await db.execute("PRAGMA synchronous=NORMAL")
+                    await db.execute("PRAGMA busy_timeout=5000")
+                    await db.executescript(_SCHEMA)
+                    await db.commit()
+                    self._db = db
+                    self._task = asyncio.create_task(self._flush_loop())
+        return self._db
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._db is not None:
+            await self.flush()
+            await self._db.close()
+            self._db = None
+
+    # ── BaseStorage ─────────────────────────────────────────────────────────
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._stage(self._key_builder.build(key), state=value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._read(self._key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._stage(self._key_builder.build(key), data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._read(self._key_builder.build(key))
+        return dict(data)
+
+    # ── Буфер и чтение ──────────────────────────────────────────────────────
+    async def _stage(self, key: str, *, state: Any = _UNSET, data: Any = _UNSET) -> None:
+        # Открытие базы запускает и фоновый сброс буфера
+        await self._ensure_open()
+        entry = self._pending.setdefault(key, [_UNSET, _UNSET, 0.0])
+        if state is not _UNSET:
+            entry[0] = state
+        if data is not _UNSET:
+            entry[1] = data
+        entry[2] = time.time()
+        if len(self._pending) >= self._flush_batch:
+            self._flush_wakeup.set()
+
+    async def _read(self, key: str) -> tuple[Optional[str], dict]:
+        entry = self._pending.get(key)
+        if entry is not None and entry[0] is not _UNSET and entry[1] is not _UNSET:
+            return entry[0], entry[1]
+
+        db = await self._ensure_open()
+        async with self._lock:
+            rows = await db.execute_fetchall(
+                "SELECT state, data FROM fsm WHERE key = ? AND updated_at >= ?",
+                (key, time.time() - self._ttl),
+            )
+        state, data = (rows[0][0], json.loads(rows[0][1])) if rows else (None, {})
+
+        # Буфер могли дополнить, пока ждали базу — он новее
+        entry = self._pending.get(key)
+        if entry is not None:
+            if entry[0] is not _UNSET:
+                state = entry[0]
+            if entry[1] is not _UNSET:
+                data = entry[1]
+        return state, data
+
+    # ── Запись ──────────────────────────────────────────────────────────────
+    async def flush(self) -> None:
+        """Сбрасывает буфер в базу одной транзакцией."""
+        if not self._pending:
+            return
+        db = await self._ensure_open()
+        batch, self._pending = self._pending, {}
+
+        both, state_only, data_only, deleted = [], [], [], []
+        for key, (state, data, updated_at) in batch.items():
+            data_json = json.dumps(data, ensure_ascii=False) if data is not _UNSET else None
+            if state is not _UNSET and data is not _UNSET:
+                if state is None and not data:
+                    deleted.append((key,))
+                else:
+                    both.append((key, state, data_json, updated_at))
+            elif state is not _UNSET:
+                state_only.append((key, state, updated_at))
+            else:
+                data_only.append((key, data_json, updated_at))
+
+        try:
+            async with self._lock:
+                await db.executemany(
+                    "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                    "updated_at = excluded.updated_at",
+                    both,
+                )
+                await db.executemany(
+                    "INSERT INTO fsm (key, state, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                    state_only,
+                )
+                await db.executemany(
+                    "INSERT INTO fsm (key, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    data_only,
+                )
+                await db.executemany("DELETE FROM fsm WHERE key = ?", deleted)
+                # Пустые записи (состояние сброшено по частям) не храним
+                await db.executemany(
+                    "DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'",
+                    [(key,) for key in batch],
+                )
+                await db.commit()
+        except BaseException:
+            # Не потерять изменения: вернуть в буфер, не затирая то, что изменили позже
+            for key, (state, data, updated_at) in batch.items():
+                entry = self._pending.setdefault(key, [state, data, updated_at])
+                if entry[0] is _UNSET:
+                    entry[0] = state
+                if entry[1] is _UNSET:
+                    entry[1] = data
+            raise
+
+    async def cleanup(self) -> int:
+        """Удаляет устаревшие состояния. Возвращает число удалённых."""
+        db = await self._ensure_open()
+        async with self._lock:
+            cursor = await db.execute("DELETE FROM fsm WHERE updated_at < ?", (time.time() - self._ttl,))
+            await db.commit()
+        return cursor.rowcount
+
+    async def _flush_loop(self) -> None:
+        last_cleanup = time.monotonic()
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            try:
+                await self.flush()
+                if time.monotonic() - last_cleanup >= _CLEANUP_INTERVAL:
+                    last_cleanup = time.monotonic()
+                    removed = await self.cleanup()
+                    if removed:
+                        logger.info("Удалено устаревших состояний FSM: %d", removed)
+            except Exception:
+                logger.exception("Не удалось сохранить состояния FSM")
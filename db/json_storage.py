@@ -0,0 +1,199 @@
+"""
+JSON-хранилище пользователей (users.json).
+
+Хранилище = снимок + журнал:
+  - users.json          — снимок всех пользователей;
+  - users.json.journal  — журнал изменений, по одной JSON-строке на upsert.
+
+Все пользователи держатся в памяти, чтение — O(1) из словаря. Каждое
+изменение дописывается в журнал и сбрасывается на диск (fsync) — запись
+стоит O(1) и не зависит от числа пользователей. Фоновая задача раз
+в flush_interval секунд (или после flush_threshold изменений) сворачивает
+журнал в новый снимок: запись во временный файл + атомарный os.replace,
+так что падение процесса в любой момент не портит базу.
+
+При старте снимок загружается, а журнал проигрывается поверх него.
+Оборванная последняя строка журнала (падение посреди записи) пропускается.
+
+Пакетная смена статуса (set_status_batch) пишется в журнал одной строкой
+{"ids": [...], "payload": {...}}, поэтому применяется целиком или никак.
+Для выборки по статусу в памяти держится индекс статус → множество ID.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+import aiofiles
+
+from db.base import UserStorage
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_dir(path: str) -> None:
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_snapshot(path: str, data: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+class JsonUserStorage(UserStorage):
+    def __init__(self, path: str, flush_interval: float, flush_threshold: int):
+        super().__init__()
+        self._path = path
+        self._journal_path = f"{path}.journal"
+        self._flush_interval = flush_interval
+        self._flush_threshold = max(1, flush_threshold)
+        self._data: dict[str, dict] = {}
+        # Индекс статус -> ID пользователей
+        self._by_status: dict[str, set[int]] = {}
+        self._journal = None
+        self._journal_lock = asyncio.Lock()
+        self._flush_wakeup = asyncio.Event()
+        self._dirty = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _read(self) -> dict:
+        if not os.path.exists(self._path):
+            return {}
+        async with aiofiles.open(self._path, "r", encoding="utf-8") as f:
+            content = await f.read()
+            return json.loads(content) if content.strip() else {}
+
+    async def _replay_journal(self) -> int:
+        if not os.path.exists(self._journal_path):
+            return 0
+        replayed = 0
+        async with aiofiles.open(self._journal_path, "r", encoding="utf-8") as f:
+            async for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Пропущена повреждённая запись журнала: %r", line[:80])
+                    continue
+                for key in entry.get("ids") or [entry["id"]]:
+                    self._data.setdefault(key, {}).update(entry["payload"])
+                replayed += 1
+        return replayed
+
+    def _reindex(self) -> None:
+        self._by_status = {}
+        for key, value in self._data.items():
+            self._by_status.setdefault(value.get("status"), set()).add(int(key))
+
+    def _apply(self, key: str, payload: dict) -> None:
+        """Обновляет запись в памяти вместе с индексом по статусу."""
+        user = self._data.setdefault(key, {})
+        old_status = user.get("status")
+        user.update(payload)
+        new_status = user.get("status")
+        if new_status != old_status:
+            self._by_status.get(old_status, set()).discard(int(key))
+        self._by_status.setdefault(new_status, set()).add(int(key))
+
+    async def _open(self) -> None:
+        self._data = await self._read()
+        replayed = await self._replay_journal()
+        self._reindex()
+        logger.info("Загружено пользователей: %d (из журнала: %d)", len(self._data), replayed)
+
+        self._journal = await aiofiles.open(self._journal_path, "a", encoding="utf-8")
+        if replayed:
+            # Сразу сворачиваем журнал — заодно избавляемся от оборванного хвоста
+            self._dirty = replayed
+            await self.flush()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def _close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self._journal.close()
+        self._journal = None
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        user = self._data.get(str(user_id))
+        return dict(user) if user is not None else None
+
+    async def upsert(self, user_id: int, payload: dict) -> None:
+        key = str(user_id)
+        line = json.dumps({"id": key, "payload": payload}, ensure_ascii=False) + "\n"
+        async with self._journal_lock:
+            await self._journal.write(line)
+            await self._journal.flush()
+            await asyncio.to_thread(os.fsync, self._journal.fileno())
+            self._apply(key, payload)
+            self._dirty += 1
+        if self._dirty >= self._flush_threshold:
+            self._flush_wakeup.set()
+
+    async def list_by_status(self, status: str, *, after_id: int = 0, limit: Optional[int] = None) -> list[dict]:
+        ids = sorted(user_id for user_id in self._by_status.get(status, ()) if user_id > after_id)
+        if limit is not None:
+            ids = ids[:limit]
+        return [{"id": user_id, **self._data[str(user_id)]} for user_id in ids]
+
+    async def set_status_batch(self, user_ids: Iterable[int], status: str, *, expected: str) -> list[int]:
+        payload = {"status": status}
+        async with self._journal_lock:
+            changed = sorted({
+                user_id for user_id in user_ids
+                if self._data.get(str(user_id), {}).get("status") == expected
+            })
+            if not changed:
+                return []
+            keys = [str(user_id) for user_id in changed]
+            line = json.dumps({"ids": keys, "payload": payload}, ensure_ascii=False) + "\n"
+            await self._journal.write(line)
+            await self._journal.flush()
+            await asyncio.to_thread(os.fsync, self._journal.fileno())
+            for key in keys:
+                self._apply(key, payload)
+            self._dirty += len(keys)
+        if self._dirty >= self._flush_threshold:
+            self._flush_wakeup.set()
+        return changed
+
+    async def flush(self) -> None:
+        """Сворачивает журнал в новый снимок users.json (если есть изменения)."""
+        async with self._journal_lock:
+            if not self._dirty:
+                return
+            # Копия нужна, чтобы сериализация в потоке не видела
+            # изменений, сделанных в цикле событий во время записи
+            snapshot = {key: dict(value) for key, value in self._data.items()}
+            await asyncio.to_thread(_write_snapshot, self._path, snapshot)
+            # Снимок на диске — журнал больше не нужен
+            await self._journal.truncate(0)
+            self._dirty = 0
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось свернуть журнал пользователей")
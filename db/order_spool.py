@@ -0,0 +1,272 @@
+"""
+Очередь исходящих заявок (SQLite).
+
+Хендлер кладёт сюда метаданные заявки (данные пользователя, описание,
+file_id фото, куда писать статус) и сразу отвечает пользователю.
+Фоновые воркеры (services/uploader.py) забирают заявки и отправляют
+их на бэкенд. Очередь переживает перезапуск бота: заявка, взятая
+воркером, но не завершённая (падение процесса), через ORDER_LEASE_SECONDS
+снова становится доступной.
+
+Статусы строки:
+  - queued       — ждёт отправки (с учётом next_attempt_at)
+  - in_progress  — взята воркером
+  - failed       — все попытки исчерпаны / бэкенд отверг заявку
+Успешно отправленные заявки из очереди удаляются. purge() чистит старое:
+строки failed старше failed_ttl секунд (время неудачи — finished_at)
+и записи submitted_orders старше dedupe_ttl.
+
+Дубли. У заявки может быть ключ идемпотентности (payload["idempotency_key"]):
+повторная отправка того же сообщения/альбома даёт тот же ключ. enqueue()
+не ставит заявку, если такая уже ждёт в очереди или недавно создана
+на бэкенде: номера созданных заявок хранятся в submitted_orders
+dedupe_ttl секунд. Ключ ждущей заявки лежит в колонке idempotency_key
+с уникальным индексом: вставка дубля — INSERT ... ON CONFLICT DO NOTHING,
+без поиска по payload и без гонки между проверкой и вставкой (в том числе
+между процессами с общим файлом очереди). У неудавшейся заявки ключ
+снимается — то же сообщение можно отправить заново.
+
+Для ограничения нагрузки (middlewares/throttle_mw.py) у строки есть
+user_id и photo_bytes — сколько заявок пользователя и байт фото ещё
+не отправлено (backlog()).
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import aiosqlite
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_spool (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload         TEXT    NOT NULL,
+    status          TEXT    NOT NULL DEFAULT 'queued',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL    NOT NULL,
+    claimed_at      REAL,
+    last_error      TEXT,
+    created_at      REAL    NOT NULL,
+    user_id         INTEGER,
+    photo_bytes     INTEGER NOT NULL DEFAULT 0,
+    finished_at     REAL,
+    idempotency_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_order_spool_due ON order_spool(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_order_spool_user ON order_spool(user_id, status);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_order_spool_key ON order_spool(idempotency_key);
+
+CREATE TABLE IF NOT EXISTS submitted_orders (
+    key        TEXT    PRIMARY KEY,
+    order_id   INTEGER NOT NULL,
+    created_at REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_submitted_orders_created ON submitted_orders(created_at);
+"""
+
+
+@dataclass
+class SpooledOrder:
+    id: int
+    payload: dict[str, Any]
+    attempts: int
+    # Ошибка прошлой попытки (None — заявку ещё не откладывали)
+    last_error: Optional[str] = None
+
+
+@dataclass
+class Enqueued:
+    """Итог enqueue(): новая строка очереди или найденный дубль."""
+    spool_id: Optional[int] = None
+    duplicate: bool = False
+    # Номер уже созданной на бэкенде заявки (дубль, который ещё в очереди, — None)
+    order_id: Optional[int] = None
+
+
+class OrderSpool:
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float,
+        dedupe_ttl: float,
+        failed_ttl: float = 0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._path = path
+        self._lease_seconds = lease_seconds
+        self._dedupe_ttl = dedupe_ttl
+        # 0 — неудавшиеся заявки хранятся бессрочно
+        self._failed_ttl = failed_ttl
+        self._clock = clock
+        self._db: Optional[aiosqlite.Connection] = None
+        # Одно соединение на всех воркеров: операции (запрос + commit)
+        # не должны перемежаться между корутинами
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        self._db = await aiosqlite.connect(self._path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.executescript(_SCHEMA)
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def enqueue(self, payload: dict[str, Any]) -> Enqueued:
+        """Ставит заявку в очередь, если заявки с тем же ключом ещё нет."""
+        now = self._clock()
+        key = payload.get("idempotency_key") or None
+        async with self._lock:
+            # Проверка submitted_orders и вставка — под одной блокировкой на запись:
+            # complete() в другом процессе не вклинится между ними
+            await self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = await self._enqueue(payload, key, now)
+                await self._db.commit()
+            except BaseException:
+                await self._db.rollback()
+                raise
+        return result
+
+    async def _enqueue(self, payload: dict[str, Any], key: Optional[str], now: float) -> Enqueued:
+        if key:
+            rows = await self._db.execute_fetchall(
+                "SELECT order_id FROM submitted_orders WHERE key = ? AND created_at >= ?",
+                (key, now - self._dedupe_ttl),
+            )
+            if rows:
+                return Enqueued(duplicate=True, order_id=rows[0][0])
+        rows = await self._db.execute_fetchall(
+            "INSERT INTO order_spool (payload, next_attempt_at, created_at, user_id, photo_bytes, idempotency_key) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(idempotency_key) DO NOTHING RETURNING id",
+            (
+                json.dumps(payload, ensure_ascii=False), now, now,
+                payload.get("telegram_user_id"), _photo_bytes(payload), key,
+            ),
+        )
+        if rows:
+            return Enqueued(spool_id=rows[0][0])
+        rows = await self._db.execute_fetchall("SELECT id FROM order_spool WHERE idempotency_key = ?", (key,))
+        return Enqueued(spool_id=rows[0][0], duplicate=True)
+
+    async def claim(self) -> Optional[SpooledOrder]:
+        """Забирает одну готовую к отправке заявку (или None, если таких нет)."""
+        now = self._clock()
+        async with self._lock:
+            rows = await self._db.execute_fetchall(
+                """
+                UPDATE order_spool
+                   SET status = 'in_progress', claimed_at = ?, attempts = attempts + 1
+                 WHERE id = (
+                    SELECT id FROM order_spool
+                     WHERE (status = 'queued' AND next_attempt_at <= ?)
+                        OR (status = 'in_progress' AND claimed_at < ?)
+                     ORDER BY next_attempt_at
+                     LIMIT 1
+                 )
+                RETURNING id, payload, attempts, last_error
+                """,
+                (now, now, now - self._lease_seconds),
+            )
+            await self._db.commit()
+        if not rows:
+            return None
+        row = rows[0]
+        return SpooledOrder(id=row[0], payload=json.loads(row[1]), attempts=row[2], last_error=row[3])
+
+    async def complete(
+        self, order_id: int, key: Optional[str] = None, backend_order_id: Optional[int] = None,
+    ) -> None:
+        """Убирает заявку из очереди; с ключом — запоминает номер созданной заявки."""
+        now = self._clock()
+        async with self._lock:
+            await self._db.execute("DELETE FROM order_spool WHERE id = ?", (order_id,))
+            if key and backend_order_id is not None:
+                await self._db.execute(
+                    "INSERT OR REPLACE INTO submitted_orders (key, order_id, created_at) VALUES (?, ?, ?)",
+                    (key, backend_order_id, now),
+                )
+                await self._db.execute(
+                    "DELETE FROM submitted_orders WHERE created_at < ?", (now - self._dedupe_ttl,),
+                )
+            await self._db.commit()
+
+    async def retry_later(self, order_id: int, delay: float, error: str) -> None:
+        async with self._lock:
+            await self._db.execute(
+                "UPDATE order_spool SET status = 'queued', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (self._clock() + delay, error, order_id),
+            )
+            await self._db.commit()
+
+    async def defer(self, order_id: int, delay: float, error: str) -> None:
+        """Как retry_later, но попытка не засчитывается (бэкенд заведомо недоступен)."""
+        async with self._lock:
+            await self._db.execute(
+                "UPDATE order_spool SET status = 'queued', next_attempt_at = ?, last_error = ?, "
+                "attempts = attempts - 1 WHERE id = ?",
+                (self._clock() + delay, error, order_id),
+            )
+            await self._db.commit()
+
+    async def fail(self, order_id: int, error: str) -> None:
+        async with self._lock:
+            await self._db.execute(
+                "UPDATE order_spool SET status = 'failed', last_error = ?, finished_at = ?, idempotency_key = NULL "
+                "WHERE id = ?",
+                (error, self._clock(), order_id),
+            )
+            await self._db.commit()
+
+    async def purge(self) -> int:
+        """Удаляет устаревшие строки failed и ключи отправленных заявок; возвращает число строк failed."""
+        now = self._clock()
+        purged = 0
+        async with self._lock:
+            if self._failed_ttl > 0:
+                cursor = await self._db.execute(
+                    "DELETE FROM order_spool WHERE status = 'failed' AND finished_at < ?",
+                    (now - self._failed_ttl,),
+                )
+                purged = cursor.rowcount
+            await self._db.execute(
+                "DELETE FROM submitted_orders WHERE created_at < ?", (now - self._dedupe_ttl,),
+            )
+            await self._db.commit()
+        return purged
+
+    async def backlog(self, user_id: int) -> tuple[int, int]:
+        """Неотправленные заявки пользователя и байт фото во всей очереди."""
+        async with self._lock:
+            user_rows = await self._db.execute_fetchall(
+                "SELECT COUNT(*) FROM order_spool WHERE user_id = ? AND status IN ('queued', 'in_progress')",
+                (user_id,),
+            )
+            bytes_rows = await self._db.execute_fetchall(
+                "SELECT COALESCE(SUM(photo_bytes), 0) FROM order_spool WHERE status IN ('queued', 'in_progress')"
+            )
+        return user_rows[0][0], bytes_rows[0][0]
+
+    async def user_pending(self, user_id: int) -> int:
+        """Неотправленные заявки пользователя."""
+        async with self._lock:
+            rows = await self._db.execute_fetchall(
+                "SELECT COUNT(*) FROM order_spool WHERE user_id = ? AND status IN ('queued', 'in_progress')",
+                (user_id,),
+            )
+        return rows[0][0]
+
+    async def pending_count(self) -> int:
+        async with self._lock:
+            rows = await self._db.execute_fetchall(
+                "SELECT COUNT(*) FROM order_spool WHERE status IN ('queued', 'in_progress')"
+            )
+        return rows[0][0]
+
+
+def _photo_bytes(payload: dict[str, Any]) -> int:
+    # Размеры известны из сообщения Telegram (PhotoRef.file_size)
+    return sum(photo.get("file_size") or 0 for photo in payload["photos"])
@@ -0,0 +1,161 @@
+"""
+SQLite-хранилище пользователей.
+
+База в режиме WAL, индекс по статусу, каждое изменение — upsert одной
+строки (O(1) вместо перезаписи всего файла). При первом открытии пустой
+базы пользователи однократно импортируются из users.json.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+import aiosqlite
+
+from db.base import UserStorage
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые хранятся отдельными колонками; всё остальное — в extra (JSON)
+_COLUMNS = ("username", "full_name", "status")
+
+# Сколько ID в одном IN (...) — меньше лимита параметров SQLite
+_BATCH_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id        INTEGER PRIMARY KEY,
+    username  TEXT,
+    full_name TEXT,
+    status    TEXT,
+    extra     TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_users_status ON users(status, id);
+"""
+
+
+def _row_to_user(row: aiosqlite.Row) -> dict:
+    user = {
+        "id": row["id"],
+        "username": row["username"],
+        "full_name": row["full_name"],
+        "status": row["status"],
+    }
+    user.update(json.loads(row["extra"]))
+    return user
+
+
+class SqliteUserStorage(UserStorage):
+    def __init__(self, path: str, import_from: Optional[str] = None):
+        super().__init__()
+        self._path = path
+        self._import_from = import_from
+        self._db: Optional[aiosqlite.Connection] = None
+        # Операции (запрос + commit) на общем соединении не должны перемежаться
+        self._lock = asyncio.Lock()
+
+    async def _open(self) -> None:
+        self._db = await aiosqlite.connect(self._path)
+        self._db.row_factory = aiosqlite.Row
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA synchronous=NORMAL")
+        await self._db.executescript(_SCHEMA)
+        await self._db.commit()
+
+        if self._import_from and os.path.exists(self._import_from):
+            if not await self._db.execute_fetchall("SELECT 1 FROM users LIMIT 1"):
+                await self.import_json(self._import_from)
+
+    async def _close(self) -> None:
+        await self._db.close()
+        self._db = None
+
+    async def import_json(self, path: str) -> int:
+        """Однократный импорт из users.json. Существующие записи не трогает."""
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        data = json.loads(content) if content.strip() else {}
+
+        rows = []
+        for key, user in data.items():
+            extra = {k: v for k, v in user.items() if k != "id" and k not in _COLUMNS}
+            rows.append((
+                int(key),
+                user.get("username"),
+                user.get("full_name"),
+                user.get("status"),
+                json.dumps(extra, ensure_ascii=False),
+            ))
+
+        async with self._lock:
+            await self._db.executemany(
+                "INSERT INTO users (id, username, full_name, status, extra) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(id) DO NOTHING",
+                rows,
+            )
+            await self._db.commit()
+        logger.info("Импортировано пользователей из %s: %d", path, len(rows))
+        return len(rows)
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        async with self._lock:
+            rows = await self._db.execute_fetchall("SELECT * FROM users WHERE id = ?", (user_id,))
+        return _row_to_user(rows[0]) if rows else None
+
+    async def upsert(self, user_id: int, payload: dict) -> None:
+        columns = [c for c in _COLUMNS if c in payload]
+        extra = {k: v for k, v in payload.items() if k != "id" and k not in _COLUMNS}
+
+        assignments = [f"{c} = excluded.{c}" for c in columns]
+        if extra:
+            # extra сливается в Python: json_patch удалил бы ключи со значением
+            # null, а JSON-хранилище хранит null как есть
+            assignments.append("extra = excluded.extra")
+
+        sql = (
+            f"INSERT INTO users (id, {', '.join(columns + ['extra'])}) "
+            f"VALUES ({', '.join('?' * (len(columns) + 2))}) "
+        )
+        sql += (
+            f"ON CONFLICT(id) DO UPDATE SET {', '.join(assignments)}"
+            if assignments else "ON CONFLICT(id) DO NOTHING"
+        )
+
+        async with self._lock:
+            if extra:
+                rows = await self._db.execute_fetchall("SELECT extra FROM users WHERE id = ?", (user_id,))
+                if rows:
+                    extra = {**json.loads(rows[0]["extra"]), **extra}
+            params = [user_id, *(payload[c] for c in columns), json.dumps(extra, ensure_ascii=False)]
+            await self._db.execute(sql, params)
+            await self._db.commit()
+
+    async def list_by_status(self, status: str, *, after_id: int = 0, limit: Optional[int] = None) -> list[dict]:
+        # Индекс (status, id): страница читается сразу с нужного места
+        async with self._lock:
+            rows = await self._db.execute_fetchall(
+                "SELECT * FROM users WHERE status = ? AND id > ? ORDER BY id LIMIT ?",
+                (status, after_id, -1 if limit is None else limit),
+            )
+        return [_row_to_user(row) for row in rows]
+
+    async def set_status_batch(self, user_ids: Iterable[int], status: str, *, expected: str) -> list[int]:
+        user_ids = list(user_ids)
+        changed: list[int] = []
+        async with self._lock:
+            try:
+                for start in range(0, len(user_ids), _BATCH_CHUNK):
+                    chunk = user_ids[start:start + _BATCH_CHUNK]
+                    rows = await self._db.execute_fetchall(
+                        f"UPDATE users SET status = ? WHERE status = ? AND id IN ({', '.join('?' * len(chunk))}) "
+                        "RETURNING id",
+                        (status, expected, *chunk),
+                    )
+                    changed.extend(row["id"] for row in rows)
+                await self._db.commit()
+            except BaseException:
+                await self._db.rollback()
+                raise
+        return sorted(changed)
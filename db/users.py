@@ -5,13 +5,20 @@
   - pending    — подал заявку, ждёт верификации
   - approved   — верифицирован, может пользоваться ботом
   - rejected   — отклонён администратором
+
+Реализация хранилища выбирается настройкой USERS_BACKEND:
+  - json   — users.json, реестр в памяти с отложенной записью (db/json_storage.py)
+  - sqlite — SQLite в режиме WAL с индексом по статусу (db/sqlite_storage.py)
 """
 
-import json
 import os
-import aiofiles
 from enum import Enum
-from typing import Optional
+from typing import Iterable, Optional
+
+from config import USERS_BACKEND, USERS_DB_PATH, USERS_FLUSH_INTERVAL, USERS_FLUSH_THRESHOLD
+from db.base import UserStorage
+from db.json_storage import JsonUserStorage
+from db.sqlite_storage import SqliteUserStorage
 
 USERS_FILE = os.path.join(os.path.dirname(__file__), "..", "users.json")
 
@@ -22,31 +29,40 @@ class UserStatus(str, Enum):
     REJECTED = "rejected"
 
 
-async def _load() -> dict:
-    if not os.path.exists(USERS_FILE):
-        return {}
-    async with aiofiles.open(USERS_FILE, "r", encoding="utf-8") as f:
-        content = await f.read()
-        return json.loads(content) if content.strip() else {}
+def _create_storage() -> UserStorage:
+    if USERS_BACKEND == "sqlite":
+        return SqliteUserStorage(USERS_DB_PATH, import_from=USERS_FILE)
+    if USERS_BACKEND == "json":
+        return JsonUserStorage(USERS_FILE, USERS_FLUSH_INTERVAL, USERS_FLUSH_THRESHOLD)
+    raise ValueError(f"Неизвестный USERS_BACKEND: {USERS_BACKEND!r}")
+
+
+_storage = _create_storage()
+
+
+async def _get_storage() -> UserStorage:
+    await _storage.ensure_open()
+    return _storage
 
 
-async def _save(data: dict) -> None:
-    async with aiofiles.open(USERS_FILE, "w", encoding="utf-8") as f:
-        await f.write(json.dumps(data, ensure_ascii=False, indent=2))
+async def init_storage() -> None:
+    """Открывает хранилище (загрузка / подключение к базе)."""
+    await _get_storage()
+
+
+async def close_storage() -> None:
+    """Закрывает хранилище, сохраняя несохранённые изменения."""
+    await _storage.close()
 
 
 async def get_user(user_id: int) -> Optional[dict]:
-    data = await _load()
-    return data.get(str(user_id))
+    storage = await _get_storage()
+    return await storage.get(user_id)
 
 
 async def upsert_user(user_id: int, payload: dict) -> None:
-    data = await _load()
-    key = str(user_id)
-    if key not in data:
-        data[key] = {}
-    data[key].update(payload)
-    await _save(data)
+    storage = await _get_storage()
+    await storage.upsert(user_id, payload)
 
 
 async def set_status(user_id: int, status: UserStatus) -> None:
@@ -58,3 +74,22 @@ async def get_status(user_id: int) -> Optional[UserStatus]:
     if not user:
         return None
     return UserStatus(user["status"])
+
+
+async def list_users_by_status(
+    status: UserStatus, *, after_id: int = 0, limit: Optional[int] = None,
+) -> list[dict]:
+    storage = await _get_storage()
+    return await storage.list_by_status(status.value, after_id=after_id, limit=limit)
+
+
+async def set_status_many(
+    user_ids: Iterable[int], status: UserStatus, *, expected: UserStatus = UserStatus.PENDING,
+) -> list[int]:
+    """
+    Одной транзакцией меняет статус тем из user_ids, у кого он сейчас expected
+    (заявку, уже обработанную другим администратором, не трогает).
+    Возвращает ID, у которых статус изменился.
+    """
+    storage = await _get_storage()
+    return await storage.set_status_batch(user_ids, status.value, expected=expected.value)
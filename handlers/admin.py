@@ -1,15 +1,54 @@
 """
 Обработчики для администраторов.
 Подтверждение и отклонение заявок на верификацию.
+
+Кроме кнопок под каждой заявкой есть /pending — список ожидающих
+по страницам (keyset-пагинация по ID) с пакетными действиями:
+«одобрить всех на странице», «одобрить / отклонить выбранных».
+Статусы меняются одной транзакцией хранилища, уведомления пользователям
+уходят параллельно. Выбор хранится в самих кнопках (callback_data),
+так что страница не зависит от процесса, который её показал.
+
+/profile [секунды] — выборочный профиль event loop (services/profiler.py):
+самые горячие функции и доля простоя.
 """
 
+import asyncio
+import logging
+import math
+import os
+from typing import Optional
+
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
+from aiogram.filters import Command, CommandObject
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.utils.markdown import hcode, html_decoration
 
-from db.users import set_status, get_user, get_status, UserStatus
+from config import PENDING_PAGE_SIZE, PROFILE_MAX_SECONDS, is_admin
+from db.users import get_user, get_status, list_users_by_status, set_status_many, UserStatus
+from services import profiler
+from services.sender import broadcast
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+APPROVED_USER_TEXT = (
+    "✅ <b>Ваш аккаунт верифицирован!</b>\n\n"
+    "Теперь вы можете пользоваться ботом.\n"
+    "Нажмите /start для начала работы."
+)
+REJECTED_USER_TEXT = (
+    "❌ <b>Ваша заявка на верификацию отклонена.</b>\n\n"
+    "Если вы считаете, что это произошло по ошибке — обратитесь к администратору."
+)
+
+_ACTIONS = {
+    "approve": (UserStatus.APPROVED, APPROVED_USER_TEXT),
+    "reject": (UserStatus.REJECTED, REJECTED_USER_TEXT),
+}
+
 
 @router.callback_query(F.data.startswith("verify:"))
 async def handle_verification(callback: CallbackQuery):
@@ -19,10 +58,14 @@ async def handle_verification(callback: CallbackQuery):
     """
     _, action, user_id_str = callback.data.split(":")
     user_id = int(user_id_str)
+    if action not in _ACTIONS:
+        await callback.answer()
+        return
+    status, user_text = _ACTIONS[action]
 
-    # ПРОВЕРКА: Не была ли заявка уже обработана другим админом?
-    current_status = await get_status(user_id)
-    if current_status != UserStatus.PENDING:
+    # Смена статуса только из pending: заявку, уже обработанную другим админом, не трогаем
+    if not await set_status_many([user_id], status):
+        current_status = await get_status(user_id)
         await callback.answer("⚠️ Эта заявка уже обработана!", show_alert=True)
         # Опционально: обновляем кнопки в сообщении, чтобы другие видели статус
         status_text = "✅ Подтверждён" if current_status == UserStatus.APPROVED else "❌ Отклонён"
@@ -32,42 +75,217 @@ async def handle_verification(callback: CallbackQuery):
             )
         return
 
-    user_data = await get_user(user_id)
-    full_name = user_data.get("full_name", "Пользователь") if user_data else "Пользователь"
-
-    if action == "approve":
-        await set_status(user_id, UserStatus.APPROVED)
-
-        # Уведомляем пользователя
-        await callback.bot.send_message(
-            chat_id=user_id,
-            text=(
-                "✅ <b>Ваш аккаунт верифицирован!</b>\n\n"
-                "Теперь вы можете пользоваться ботом.\n"
-                "Нажмите /start для начала работы."
-            ),
-        )
-
-        # Обновляем сообщение в админ-чате
-        await callback.message.edit_text(
-            callback.message.html_text + f"\n\n✅ <b>Подтверждён</b> администратором @{callback.from_user.username or callback.from_user.full_name}"
-        )
-
-    elif action == "reject":
-        await set_status(user_id, UserStatus.REJECTED)
-
-        # Уведомляем пользователя
-        await callback.bot.send_message(
-            chat_id=user_id,
-            text=(
-                "❌ <b>Ваша заявка на верификацию отклонена.</b>\n\n"
-                "Если вы считаете, что это произошло по ошибке — обратитесь к администратору."
-            ),
-        )
-
-        # Обновляем сообщение в админ-чате
-        await callback.message.edit_text(
-            callback.message.html_text + f"\n\n❌ <b>Отклонён</b> администратором @{callback.from_user.username or callback.from_user.full_name}"
-        )
+    admin_name = callback.from_user.username or callback.from_user.full_name
+    if status == UserStatus.APPROVED:
+        admin_text = callback.message.html_text + f"\n\n✅ <b>Подтверждён</b> администратором @{admin_name}"
+    else:
+        admin_text = callback.message.html_text + f"\n\n❌ <b>Отклонён</b> администратором @{admin_name}"
+
+    # Уведомляем пользователя и обновляем сообщение в админ-чате параллельно
+    # edit_text() возвращает объект метода aiogram (awaitable, но не корутину) —
+    # gather принимает только корутины и future, поэтому оборачиваем
+    async def _edit_admin_message():
+        return await callback.message.edit_text(admin_text)
+
+    notify_result, edit_result = await asyncio.gather(
+        callback.bot.send_message(chat_id=user_id, text=user_text),
+        _edit_admin_message(),
+        return_exceptions=True,
+    )
+    if isinstance(notify_result, Exception):
+        user_data = await get_user(user_id)
+        full_name = user_data.get("full_name", "Пользователь") if user_data else "Пользователь"
+        logger.warning("Не удалось уведомить пользователя %s (%s): %s", user_id, full_name, notify_result)
+    if isinstance(edit_result, Exception):
+        logger.warning("Не удалось обновить сообщение о заявке %s: %s", user_id, edit_result)
+
+    await callback.answer()
+
+
+# ── /pending: список ожидающих по страницам ─────────────────────────────────
+# callback_data:
+#   pending:p:{after}              — показать страницу с ID > after
+#   pending:t:{after}:{id}:{0|1}   — отметить / снять отметку с пользователя
+#   pending:{ap|as|rs}:{after}     — одобрить страницу / одобрить / отклонить выбранных
+
+def _user_label(user: dict) -> str:
+    name = user.get("full_name") or "Без имени"
+    username = f" @{user['username']}" if user.get("username") else ""
+    return f"{name}{username}"[:40]
+
+
+def _toggle_button(after_id: int, user_id: int, label: str, selected: bool) -> InlineKeyboardButton:
+    return InlineKeyboardButton(
+        text=f"{'☑️' if selected else '⬜'} {label}",
+        callback_data=f"pending:t:{after_id}:{user_id}:{int(selected)}",
+    )
+
+
+async def _render_page(after_id: int) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    # Лишняя запись — признак, что есть следующая страница
+    users = await list_users_by_status(UserStatus.PENDING, after_id=after_id, limit=PENDING_PAGE_SIZE + 1)
+    has_next = len(users) > PENDING_PAGE_SIZE
+    users = users[:PENDING_PAGE_SIZE]
+
+    if not users:
+        text = "📋 <b>Заявок на верификацию нет.</b>"
+        if not after_id:
+            return text, None
+        keyboard = [[InlineKeyboardButton(text="⏮ В начало", callback_data="pending:p:0")]]
+        return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    lines = [
+        f"{n}. {html_decoration.quote(_user_label(user))} — {hcode(str(user['id']))}"
+        for n, user in enumerate(users, 1)
+    ]
+    text = (
+        "📋 <b>Заявки на верификацию</b>\n"
+        "━━━━━━━━━━━━━━━━━━━━━━\n"
+        + "\n".join(lines)
+        + "\n\nОтметьте пользователей кнопками ниже."
+    )
+    keyboard = [[_toggle_button(after_id, user["id"], _user_label(user), False)] for user in users]
+    keyboard.append([
+        InlineKeyboardButton(text="✅ Одобрить страницу", callback_data=f"pending:ap:{after_id}"),
+    ])
+    keyboard.append([
+        InlineKeyboardButton(text="✅ Одобрить выбранных", callback_data=f"pending:as:{after_id}"),
+        InlineKeyboardButton(text="❌ Отклонить выбранных", callback_data=f"pending:rs:{after_id}"),
+    ])
+    navigation = []
+    if after_id:
+        navigation.append(InlineKeyboardButton(text="⏮ В начало", callback_data="pending:p:0"))
+    navigation.append(InlineKeyboardButton(text="🔄", callback_data=f"pending:p:{after_id}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Далее ➡️", callback_data=f"pending:p:{users[-1]['id']}"))
+    keyboard.append(navigation)
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def _page_selection(markup: Optional[InlineKeyboardMarkup]) -> list[tuple[int, bool]]:
+    """Пользователи страницы и отметки — из кнопок сообщения."""
+    selection = []
+    for row in markup.inline_keyboard if markup else ():
+        for button in row:
+            if button.callback_data and button.callback_data.startswith("pending:t:"):
+                _, _, _, user_id, selected = button.callback_data.split(":")
+                selection.append((int(user_id), selected == "1"))
+    return selection
 
+
+async def _show_page(message: Message, after_id: int) -> None:
+    text, markup = await _render_page(after_id)
+    try:
+        await message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as exc:
+        # «🔄» без изменений в списке
+        if "message is not modified" not in exc.message:
+            raise
+
+
+@router.message(Command("pending"), F.from_user.id.func(is_admin))
+async def cmd_pending(message: Message):
+    text, markup = await _render_page(0)
+    await message.answer(text, reply_markup=markup)
+
+
+@router.callback_query(F.data.startswith("pending:p:"), F.from_user.id.func(is_admin))
+async def pending_page(callback: CallbackQuery):
     await callback.answer()
+    await _show_page(callback.message, int(callback.data.split(":")[2]))
+
+
+@router.callback_query(F.data.startswith("pending:t:"), F.from_user.id.func(is_admin))
+async def pending_toggle(callback: CallbackQuery):
+    # Без обращения к хранилищу: меняется только отметка на кнопке
+    target = callback.data
+    keyboard = [
+        [
+            _toggle_button(*map(int, target.split(":")[2:4]), button.text.split(" ", 1)[1], target.endswith(":0"))
+            if button.callback_data == target else button
+            for button in row
+        ]
+        for row in callback.message.reply_markup.inline_keyboard
+    ]
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+
+
+@router.callback_query(F.data.regexp(r"^pending:(ap|as|rs):\d+$"), F.from_user.id.func(is_admin))
+async def pending_batch(callback: CallbackQuery):
+    _, action, after_id = callback.data.split(":")
+    selection = _page_selection(callback.message.reply_markup)
+    if action == "ap":
+        user_ids = [user_id for user_id, _ in selection]
+    else:
+        user_ids = [user_id for user_id, selected in selection if selected]
+    if not user_ids:
+        await callback.answer("Никто не выбран.", show_alert=True)
+        return
+
+    status, user_text = _ACTIONS["reject" if action == "rs" else "approve"]
+    changed = await set_status_many(user_ids, status)
+    skipped = len(user_ids) - len(changed)
+    verb = "Одобрено" if status == UserStatus.APPROVED else "Отклонено"
+    await callback.answer(f"{verb}: {len(changed)}" + (f", уже обработаны: {skipped}" if skipped else ""))
+    admin_name = callback.from_user.username or callback.from_user.full_name
+    logger.info("%s администратором @%s: %s", verb, admin_name, changed)
+
+    failed, refresh_result = await asyncio.gather(
+        broadcast(changed, lambda user_id: callback.bot.send_message(chat_id=user_id, text=user_text)),
+        _show_page(callback.message, int(after_id)),
+        return_exceptions=True,
+    )
+    if isinstance(refresh_result, Exception):
+        logger.warning("Не удалось обновить список заявок: %s", refresh_result)
+    if isinstance(failed, Exception):
+        logger.warning("Не удалось разослать уведомления о верификации: %s", failed)
+    else:
+        for user_id, exc in failed.items():
+            logger.warning("Не удалось уведомить пользователя %s: %s", user_id, exc)
+
+
+# ── /profile: профиль event loop ────────────────────────────────────────────
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_TOP = 15
+
+
+def _profile_text(result: profiler.ProfileResult) -> str:
+    samples = result.samples or 1
+    header = (
+        f"⏱ <b>Профиль event loop</b> — {result.seconds:g} с, pid {os.getpid()}\n"
+        f"Выборок: {result.samples}, простой: {result.idle * 100 // samples}%"
+    )
+    top = result.top(PROFILE_TOP)
+    if not top:
+        return header + "\n\nloop всё время ждал событий."
+    rows = [f"{'своё%':>6} {'всего%':>6}  функция"] + [
+        f"{own * 100 / samples:>6.1f} {total * 100 / samples:>6.1f}  {name}"
+        for name, own, total in top
+    ]
+    return header + "\n<pre>" + html_decoration.quote("\n".join(rows)) + "</pre>"
+
+
+@router.message(Command("profile"), F.from_user.id.func(is_admin))
+async def cmd_profile(message: Message, command: CommandObject):
+    try:
+        seconds = float(command.args) if command.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        seconds = math.nan
+    # float() принимает и «nan» / «inf»: min/max их не ограничат
+    if not math.isfinite(seconds):
+        await message.answer("Использование: /profile [секунды]")
+        return
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+
+    status_msg = await message.answer(f"⏱ <i>Профилирую event loop {seconds:g} с...</i>")
+    try:
+        result = await profiler.profile(seconds)
+    except profiler.ProfilerBusy:
+        await status_msg.edit_text("⚠️ Профиль уже снимается, дождитесь результата.")
+        return
+    logger.info(
+        "Профиль event loop: %d выборок, простой %d", result.samples, result.idle,
+        extra={"profile_top": result.top(PROFILE_TOP)},
+    )
+    await status_msg.edit_text(_profile_text(result))
@@ -1,23 +1,41 @@
 """
 Обработчик для заявок на корректировку товаров.
 
-Верифицированный пользователь отправляет фото(+текст) → бот делает
-POST /correction-orders на бэкенд с multipart/form-data.
+Верифицированный пользователь отправляет фото(+текст) → бот ставит заявку
+в очередь, а фоновые воркеры делают POST /correction-orders на бэкенд
+с multipart/form-data.
 Поддерживается как одиночное фото, так и альбом (media_group).
+
+Повтор той же заявки (повторная доставка апдейта, двойная отправка альбома)
+определяется по ключу идемпотентности и не отправляется заново:
+пользователь сразу получает номер уже созданной заявки.
+
+Здесь же открывается трасса заявки (services/tracing.py): сборка альбома
+и ответ «Заявка принята» попадают в неё до постановки в очередь.
+
+/orders — последние заявки пользователя и их статусы. Список берётся
+из кэша (services/orders_cache.py) и сбрасывается, когда заявка меняется:
+при постановке в очередь и при подтверждении.
 """
 
-import asyncio
-import io
+import hashlib
 import logging
-from collections import defaultdict
+import time
 
-import aiohttp
-from aiogram import Router, F, Bot
+from aiogram import Router, F
+from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, CallbackQuery
+from aiogram.utils.markdown import html_decoration
 
-from config import BACKEND_URL, BOT_SECRET_KEY
+from config import MEDIA_GROUP_DEBOUNCE, MEDIA_GROUP_MAX_WAIT
+from services.backend import BackendClient, BackendError, BackendUnavailable
+from services.media_group import MediaGroupAggregator
+from services.orders_cache import Orders, OrdersCache
+from services import tracing
+from services.photos import photo_ref
+from services.uploader import OrderUploader
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -26,14 +44,48 @@ logger = logging.getLogger(__name__)
 class CorrectionState(StatesGroup):
     waiting_for_replacement = State()  # Ждем новую версию заявки после ввода ID
 
-# ── Буфер для сборки media_group ─────────────────────────────────────────────
-# ... (existing buffer code)
-_media_group_buffer: dict[str, list[Message]] = defaultdict(list)
-_media_group_tasks: dict[str, asyncio.TimerHandle] = {}
+# ── Сборка media_group ───────────────────────────────────────────────────────
+media_groups: MediaGroupAggregator[Message] = MediaGroupAggregator(
+    debounce=MEDIA_GROUP_DEBOUNCE,
+    max_wait=MEDIA_GROUP_MAX_WAIT,
+)
+
+ORDER_ACCEPTED_TEXT = "📥 <i>Заявка принята, отправляю...</i>"
+
+# Фото или картинка, отправленная файлом (без сжатия Telegram)
+HAS_IMAGE = F.photo | F.document.mime_type.startswith("image/")
+
+
+def _idempotency_key(first: Message, replace_id: int = None) -> str:
+    """
+    Ключ заявки: чат + альбом (или сообщение) + заменяемая заявка.
+    Одни и те же сообщения всегда дают один ключ.
+    """
+    source = f"g{first.media_group_id}" if first.media_group_id else f"m{first.message_id}"
+    raw = f"{first.chat.id}:{source}:{replace_id or ''}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
 
 
-async def _send_order(bot: Bot, messages: list[Message], replace_id: int = None, status_msg: Message = None):
-    """Собирает данные из сообщений и отправляет POST на бэкенд."""
+def _duplicate_text(order_id: int = None) -> str:
+    if order_id is not None:
+        return f"ℹ️ <b>Эта заявка уже отправлена: #{order_id}.</b>"
+    return "ℹ️ <b>Эта заявка уже отправляется.</b>\n\nСтатус обновится в предыдущем сообщении."
+
+
+async def _send_order(
+    uploader: OrderUploader,
+    orders_cache: OrdersCache,
+    messages: list[Message],
+    replace_id: int = None,
+    status_msg: Message = None,
+):
+    """
+    Собирает данные из сообщений и ставит заявку в очередь на отправку.
+    Сам POST на бэкенд делают фоновые воркеры (services/uploader.py),
+    они же обновят статусное сообщение по итогу.
+    Кэш /orders сбрасывается здесь — в процессе, который обслуживает
+    пользователя; пока заявка в очереди, он список не сохраняет.
+    """
     first = messages[0]
     user = first.from_user
 
@@ -43,68 +95,31 @@ async def _send_order(bot: Bot, messages: list[Message], replace_id: int = None,
         None,
     )
 
-    # Скачиваем все фото через Telegram API
-    photo_bytes: list[tuple[str, bytes]] = []
-    for msg in messages:
-        if msg.photo:
-            file_id = msg.photo[-1].file_id
-            tg_file = await bot.get_file(file_id)
-            buf = io.BytesIO()
-            await bot.download_file(tg_file.file_path, buf)
-            filename = f"{file_id}.jpg"
-            photo_bytes.append((filename, buf.getvalue()))
-
     # Если статусное сообщение не передано, создаем его
     if not status_msg:
-        status_msg = await first.answer("📤 <i>Отправляю заявку...</i>")
-
-    # Отправляем multipart POST
-    url = f"{BACKEND_URL}/correction-orders/"
-    headers = {"X-Bot-Secret": BOT_SECRET_KEY}
+        status_msg = await first.answer(ORDER_ACCEPTED_TEXT)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            form = aiohttp.FormData()
-            form.add_field("telegram_user_id", str(user.id))
-            form.add_field("telegram_chat_id", str(first.chat.id))
-            if user.username:
-                form.add_field("telegram_username", user.username)
-            if user.full_name:
-                form.add_field("telegram_full_name", user.full_name)
-            if description:
-                form.add_field("description", description)
-            if replace_id:
-                form.add_field("replace_order_id", str(replace_id))
-            if first.message_id:
-                form.add_field("user_message_id", str(first.message_id))
-
-            for filename, data in photo_bytes:
-                form.add_field(
-                    "photos",
-                    data,
-                    filename=filename,
-                    content_type="image/jpeg",
-                )
-
-            async with session.post(url, data=form, headers=headers) as resp:
-                if resp.status == 201:
-                    order = await resp.json()
-                    status_text = "успешно создана" if not replace_id else f"обновлена"
-                    await status_msg.edit_text(
-                        f"✅ <b>Заявка #{order['id']} {status_text}!</b>\n"
-                        f"📋 Описание: {description or '<i>не указано</i>'}\n"
-                        f"⏳ Заявка в работе..."
-                    )
-                else:
-                    body = await resp.text()
-                    logger.error("Backend error %s: %s", resp.status, body)
-                    await status_msg.edit_text(f"❌ <b>Ошибка сервера ({resp.status}).</b>\n\nПожалуйста, попробуйте позже.")
+        result = await uploader.submit({
+            "telegram_user_id": user.id,
+            "telegram_chat_id": first.chat.id,
+            "telegram_username": user.username,
+            "telegram_full_name": user.full_name,
+            "description": description,
+            "replace_order_id": replace_id,
+            "user_message_id": first.message_id,
+            "photos": [ref.to_payload() for ref in map(photo_ref, messages) if ref],
+            "status_message_id": status_msg.message_id,
+            "idempotency_key": _idempotency_key(first, replace_id),
+            "trace": tracing.export(),
+        })
+        if result.duplicate:
+            await status_msg.edit_text(_duplicate_text(result.order_id))
+        else:
+            orders_cache.invalidate(user.id)
     except Exception as exc:
-        logger.exception("Error sending order: %s", exc)
-        try:
-            await status_msg.edit_text("❌ <b>Произошла ошибка при отправке.</b>\n\nПроверьте соединение и попробуйте снова.")
-        except:
-            await first.answer("❌ Произошла ошибка при отправке.")
+        logger.exception("Error queueing order: %s", exc)
+        await status_msg.edit_text("❌ <b>Произошла ошибка при отправке.</b>\n\nПопробуйте снова.")
 
 
 # ── Обработка ID для замены ──────────────────────────────────────────────────
@@ -121,65 +136,67 @@ async def handle_order_id_for_replacement(message: Message, state: FSMContext):
 
 
 # ── Обработчики фото ──────────────────────────────────────────────────────────
-@router.message(F.photo & ~F.media_group_id)
-async def handle_single_photo(message: Message, state: FSMContext):
+@router.message(HAS_IMAGE & ~F.media_group_id)
+async def handle_single_photo(
+    message: Message, state: FSMContext, uploader: OrderUploader, orders_cache: OrdersCache,
+):
     data = await state.get_data()
     replace_id = data.get("replace_id")
-    
-    status_msg = await message.answer("📤 <i>Отправляю заявку...</i>")
-    await _send_order(message.bot, [message], replace_id=replace_id, status_msg=status_msg)
-    await state.clear()
 
+    with tracing.begin():
+        with tracing.span("status_message"):
+            status_msg = await message.answer(ORDER_ACCEPTED_TEXT)
+        await _send_order(uploader, orders_cache, [message], replace_id=replace_id, status_msg=status_msg)
+    await state.clear()
 
-@router.message(F.photo & F.media_group_id)
-async def handle_album_photo(message: Message, state: FSMContext):
-    group_id = message.media_group_id
-    _media_group_buffer[group_id].append(message)
 
-    if group_id in _media_group_tasks:
-        return
+@router.message(HAS_IMAGE & F.media_group_id)
+async def handle_album_photo(
+    message: Message, state: FSMContext, uploader: OrderUploader, orders_cache: OrdersCache,
+):
+    # Альбом сбрасывает колбэк первой части — значит, отсчёт от её прихода
+    received = time.time()
 
-    async def _flush():
-        await asyncio.sleep(0.5)
-        messages = _media_group_buffer.pop(group_id, [])
-        _media_group_tasks.pop(group_id, None)
-        if messages:
-            data = await state.get_data()
-            replace_id = data.get("replace_id")
-            status_msg = await messages[0].answer("📤 <i>Отправляю заявку...</i>")
-            await _send_order(messages[0].bot, messages, replace_id=replace_id, status_msg=status_msg)
-            await state.clear()
+    async def _flush(messages: list[Message]):
+        data = await state.get_data()
+        replace_id = data.get("replace_id")
+        with tracing.begin(started=received) as trace:
+            if trace is not None:
+                trace.add("album_buffer", received, time.time(), parts=len(messages))
+            with tracing.span("status_message"):
+                status_msg = await messages[0].answer(ORDER_ACCEPTED_TEXT)
+            await _send_order(uploader, orders_cache, messages, replace_id=replace_id, status_msg=status_msg)
+        await state.clear()
 
-    _media_group_tasks[group_id] = asyncio.ensure_future(_flush())
+    media_groups.add(message.media_group_id, message, _flush)
 
 
 @router.callback_query(F.data.startswith("user_confirm_"))
-async def process_user_confirm(callback: CallbackQuery):
+async def process_user_confirm(callback: CallbackQuery, backend: BackendClient, orders_cache: OrdersCache):
     order_id = int(callback.data.split("_")[-1])
-    url = f"{BACKEND_URL}/correction-orders/{order_id}/user-confirm"
-    headers = {"X-Bot-Secret": BOT_SECRET_KEY}
 
     # Сразу отвечаем, чтобы убрать спиннер, но даем понять, что процесс идет
     await callback.answer("⏳ Заявка в работе...")
     
     try:
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-            async with session.post(url, headers=headers) as resp:
-                if resp.status == 200:
-                    order_data = await resp.json()
-                    await callback.message.edit_reply_markup(reply_markup=None)
-                    reply_params = {}
-                    if order_data.get("user_message_id"):
-                        reply_params = {"reply_to_message_id": order_data["user_message_id"]}
-                    
-                    await callback.message.reply(
-                        f"✅ <b>Заявка #{order_id} выполнена успешно!</b>",
-                        **reply_params
-                    )
-                else:
-                    body = await resp.json()
-                    detail = body.get("detail", "Ошибка сервера")
-                    await callback.message.reply(f"❌ <b>Ошибка:</b> {detail}")
+        order_data = await backend.user_confirm(order_id)
+        orders_cache.invalidate(callback.from_user.id)
+        await callback.message.edit_reply_markup(reply_markup=None)
+        reply_params = {}
+        if order_data.get("user_message_id"):
+            reply_params = {"reply_to_message_id": order_data["user_message_id"]}
+
+        await callback.message.reply(
+            f"✅ <b>Заявка #{order_id} выполнена успешно!</b>",
+            **reply_params
+        )
+    except BackendUnavailable as e:
+        # Бэкенд недавно не отвечал — не ждём таймаут, сразу просим повторить позже
+        await callback.message.reply(
+            f"⏳ <b>Сервер временно недоступен.</b>\n\nПопробуйте через {max(1, round(e.retry_after))} с."
+        )
+    except BackendError as e:
+        await callback.message.reply(f"❌ <b>Ошибка:</b> {e.detail or 'Ошибка сервера'}")
     except Exception as e:
         logger.error("Callback error: %s", e)
         await callback.message.reply("❌ Ошибка связи с сервером. Попробуйте позже.")
@@ -197,3 +214,53 @@ async def handle_user_edit(callback: CallbackQuery, state: FSMContext):
         f"⚠️ <b>ключен режим редактирования заявки #{order_id}.</b>\n"
         "‼️ Пожалуйста, пересоздайте заявку с учетом дополнительной информации."
     )
+
+
+# ── /orders: список заявок пользователя ──────────────────────────────────────
+_ORDER_STATUS_LABELS = {
+    "new": "🆕 новая",
+    "in_progress": "⏳ в работе",
+    "done": "✅ выполнена",
+    "confirmed": "☑️ подтверждена",
+    "rejected": "❌ отклонена",
+}
+
+
+def _orders_text(orders: Orders) -> str:
+    if not orders:
+        return "📋 <b>У вас пока нет заявок.</b>\n\nОтправьте фото товара с описанием, чтобы создать заявку."
+    lines = []
+    for order in orders:
+        status = order.get("status") or ""
+        label = _ORDER_STATUS_LABELS.get(status) or html_decoration.quote(status)
+        line = f"<b>#{order['id']}</b> — {label}"
+        if order.get("description"):
+            description = order["description"]
+            if len(description) > 60:
+                description = description[:59] + "…"
+            line += f"\n<i>{html_decoration.quote(description)}</i>"
+        lines.append(line)
+    return (
+        "📋 <b>Ваши заявки</b>\n\n"
+        + "\n\n".join(lines)
+        + "\n\nЧтобы обновить заявку, отправьте её номер."
+    )
+
+
+@router.message(Command("orders"))
+async def cmd_orders(message: Message, orders_cache: OrdersCache):
+    try:
+        text = _orders_text(await orders_cache.get(message.from_user.id))
+    except BackendUnavailable as e:
+        await message.answer(
+            f"⏳ <b>Сервер временно недоступен.</b>\n\nПопробуйте через {max(1, round(e.retry_after))} с."
+        )
+        return
+    except BackendError as e:
+        await message.answer(f"❌ <b>Ошибка:</b> {e.detail or 'Ошибка сервера'}")
+        return
+    except Exception as e:
+        logger.error("Orders list error: %s", e)
+        await message.answer("❌ Ошибка связи с сервером. Попробуйте позже.")
+        return
+    await message.answer(text)
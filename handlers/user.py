@@ -2,6 +2,8 @@
 Обработчики для обычных пользователей.
 """
 
+import logging
+
 from aiogram import Router
 from aiogram.filters import CommandStart
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
@@ -9,6 +11,9 @@ from aiogram.utils.markdown import hbold, hcode
 
 from db.users import get_status, upsert_user, UserStatus
 from config import ADMIN_CHAT_ID, is_admin
+from services.sender import broadcast
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
@@ -103,13 +108,14 @@ async def cmd_start(message: Message):
             f"📎 Username: {username_str}"
         )
 
-        for target_id in admin_targets:
-            try:
-                await message.bot.send_message(
-                    chat_id=target_id,
-                    text=text,
-                    reply_markup=keyboard,
-                )
-            except Exception as e:
-                # В логах можно зафиксировать, что одному из админов не ушло
-                pass
+        # Всем администраторам параллельно, с низким приоритетом относительно ответов пользователям
+        failed = await broadcast(
+            admin_targets,
+            lambda target_id: message.bot.send_message(
+                chat_id=target_id,
+                text=text,
+                reply_markup=keyboard,
+            ),
+        )
+        for target_id, exc in failed.items():
+            logger.warning("Заявка %s: не удалось уведомить администратора %s: %s", user.id, target_id, exc)
@@ -1,44 +1,386 @@
+import argparse
 import asyncio
 import logging
+import os
+import secrets
+import sys
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, BACKEND_URL, BOT_SECRET_KEY,
+    BACKEND_TIMEOUT, BACKEND_UPLOAD_TIMEOUT, BACKEND_CONNECT_TIMEOUT,
+    BACKEND_POOL_LIMIT, BACKEND_DNS_TTL,
+    BACKEND_BREAKER_WINDOW, BACKEND_BREAKER_MIN_CALLS, BACKEND_BREAKER_ERROR_RATE,
+    BACKEND_BREAKER_OPEN_SECONDS, BACKEND_TIMEOUT_MULTIPLIER, BACKEND_TIMEOUT_MIN,
+    BACKEND_UPLOAD_SECONDS_PER_MB,
+    ORDER_SPOOL_PATH, ORDER_WORKERS, ORDER_MAX_ATTEMPTS,
+    ORDER_RETRY_BASE_DELAY, ORDER_RETRY_MAX_DELAY, ORDER_LEASE_SECONDS, ORDER_DEDUPE_TTL,
+    ORDER_FAILED_TTL,
+    ORDER_USER_MAX_PENDING, ORDER_MAX_BACKLOG_BYTES, ORDER_PROGRESS_INTERVAL,
+    ORDERS_LIST_LIMIT, ORDERS_CACHE_TTL, ORDERS_CACHE_STALE, ORDERS_CACHE_MAX_USERS,
+    THROTTLE_MESSAGE_RATE_PER_MINUTE, THROTTLE_MESSAGE_BURST, THROTTLE_CALLBACK_RATE_PER_MINUTE,
+    THROTTLE_CALLBACK_BURST, THROTTLE_MAX_WAIT,
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS,
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE_PER_MINUTE,
+    TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES,
+    METRICS_PORT, METRICS_HOST, TRACE_RECORD_PATH, TRACE_SALT,
+    ORDER_TRACE_PATH, ORDER_TRACE_MAX_BYTES, ORDER_TRACE_BACKUPS,
+    LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE, LOG_USER_RATE_PER_MINUTE,
+    FSM_STORAGE, FSM_DB_PATH, FSM_TTL, FSM_FLUSH_INTERVAL, FSM_FLUSH_BATCH,
+    PHOTO_CACHE_DIR, USERS_BACKEND, WORKERS, WORKER_HEALTH_INTERVAL, WORKER_HEALTH_TIMEOUT,
+)
+from db.fsm_storage import SqliteFSMStorage
+from db.order_spool import OrderSpool
+from db.users import init_storage, close_storage
 from handlers import user, admin, correction
 from middlewares.auth import VerificationMiddleware
 from middlewares.logging_mw import LoggingMiddleware
+from middlewares.metrics_mw import MetricsMiddleware
+from middlewares.throttle_mw import ThrottleMiddleware
+from middlewares.trace_mw import TraceRecorderMiddleware
+from services import metrics, photos, recompress, tracing
+from services.backend import BackendClient, is_backend_failure
+from services.breaker import BreakerState, CircuitBreaker
+from services.cluster import Supervisor, serve_worker
+from services.logging_setup import setup_logging, stop_logging, dropped_records
+from services.orders_cache import OrdersCache
+from services.sender import SendScheduler
+from services.uploader import OrderUploader
+from services.webhook import WebhookServer
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-)
 logger = logging.getLogger(__name__)
 
 
-async def main():
+async def on_startup(bot: Bot, backend: BackendClient, uploader: OrderUploader):
+    await init_storage()
+    await backend.start()
+    await uploader.start(bot)
+
+
+async def on_shutdown(
+    dispatcher: Dispatcher, backend: BackendClient, uploader: OrderUploader, orders_cache: OrdersCache,
+):
+    await uploader.close()
+    await orders_cache.close()
+    await backend.close()
+    await close_storage()
+    # Диспетчер сам хранилище FSM не закрывает — дописываем буфер состояний
+    await dispatcher.storage.close()
+    recompress.close()
+    photos.cache.log_stats()
+
+
+def create_bot(**kwargs) -> Bot:
     bot = Bot(
         token=BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        **kwargs,
+    )
+    # Все исходящие запросы в чаты идут через лимиты Telegram
+    bot.session.middleware(SendScheduler(
+        global_rate=TELEGRAM_GLOBAL_RATE,
+        chat_rate=TELEGRAM_CHAT_RATE,
+        group_rate=TELEGRAM_GROUP_RATE_PER_MINUTE / 60,
+        chat_burst=TELEGRAM_CHAT_BURST,
+        max_retries=TELEGRAM_MAX_RETRIES,
+    ))
+    return bot
+
+
+def create_fsm_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return SqliteFSMStorage(
+        FSM_DB_PATH,
+        ttl=FSM_TTL,
+        flush_interval=FSM_FLUSH_INTERVAL,
+        flush_batch=FSM_FLUSH_BATCH,
+    )
+
+
+def create_dispatcher() -> Dispatcher:
+    """Собирает диспетчер со всеми middleware, роутерами и сервисами."""
+    dp = Dispatcher(storage=create_fsm_storage())
+
+    # Общий клиент бэкенда — попадает в хендлеры аргументом `backend`
+    backend = BackendClient(
+        BACKEND_URL,
+        BOT_SECRET_KEY,
+        timeout=BACKEND_TIMEOUT,
+        upload_timeout=BACKEND_UPLOAD_TIMEOUT,
+        connect_timeout=BACKEND_CONNECT_TIMEOUT,
+        limit_per_host=BACKEND_POOL_LIMIT,
+        dns_ttl=BACKEND_DNS_TTL,
+        breaker=CircuitBreaker(
+            window=BACKEND_BREAKER_WINDOW,
+            min_calls=BACKEND_BREAKER_MIN_CALLS,
+            error_rate=BACKEND_BREAKER_ERROR_RATE,
+            open_seconds=BACKEND_BREAKER_OPEN_SECONDS,
+            timeout_multiplier=BACKEND_TIMEOUT_MULTIPLIER,
+            timeout_min=BACKEND_TIMEOUT_MIN,
+            seconds_per_mb=BACKEND_UPLOAD_SECONDS_PER_MB,
+            is_failure=is_backend_failure,
+        ),
+    )
+    dp["backend"] = backend
+
+    # Очередь заявок с фоновыми воркерами — аргумент `uploader`
+    dp["uploader"] = OrderUploader(
+        OrderSpool(
+            ORDER_SPOOL_PATH,
+            lease_seconds=ORDER_LEASE_SECONDS,
+            dedupe_ttl=ORDER_DEDUPE_TTL,
+            failed_ttl=ORDER_FAILED_TTL,
+        ),
+        backend,
+        workers=ORDER_WORKERS,
+        max_attempts=ORDER_MAX_ATTEMPTS,
+        retry_base_delay=ORDER_RETRY_BASE_DELAY,
+        retry_max_delay=ORDER_RETRY_MAX_DELAY,
+        progress_interval=ORDER_PROGRESS_INTERVAL,
     )
-    dp = Dispatcher()
+
+    # Кэш списка заявок для /orders — аргумент `orders_cache`.
+    # Пока у пользователя есть заявки в очереди, список не кэшируется
+    dp["orders_cache"] = OrdersCache(
+        lambda user_id: backend.list_orders(user_id, limit=ORDERS_LIST_LIMIT),
+        ttl=ORDERS_CACHE_TTL,
+        stale=ORDERS_CACHE_STALE,
+        max_users=ORDERS_CACHE_MAX_USERS,
+        pending=dp["uploader"].has_pending,
+    )
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
 
     # LoggingMiddleware — первым (до проверки верификации)
-    dp.message.middleware(LoggingMiddleware())
-    dp.callback_query.middleware(LoggingMiddleware())
+    logging_mw = LoggingMiddleware(
+        sample_rate=LOG_SAMPLE_RATE,
+        user_rate_per_minute=LOG_USER_RATE_PER_MINUTE,
+    )
+    dp.message.middleware(logging_mw)
+    dp.callback_query.middleware(logging_mw)
 
     # VerificationMiddleware — вторым (блокирует неверифицированных)
     dp.message.middleware(VerificationMiddleware())
     dp.callback_query.middleware(VerificationMiddleware())
 
+    # ThrottleMiddleware — после верификации: лимиты на пользователя и допуск заявок
+    throttle_mw = ThrottleMiddleware(
+        dp["uploader"],
+        message_rate_per_minute=THROTTLE_MESSAGE_RATE_PER_MINUTE,
+        message_burst=THROTTLE_MESSAGE_BURST,
+        callback_rate_per_minute=THROTTLE_CALLBACK_RATE_PER_MINUTE,
+        callback_burst=THROTTLE_CALLBACK_BURST,
+        max_wait=THROTTLE_MAX_WAIT,
+        max_pending=ORDER_USER_MAX_PENDING,
+        max_backlog_bytes=ORDER_MAX_BACKLOG_BYTES,
+    )
+    dp.message.middleware(throttle_mw)
+    dp.callback_query.middleware(throttle_mw)
+
+    # Запись обезличенных апдейтов для benchmarks.dispatcher.replay
+    if TRACE_RECORD_PATH:
+        recorder = TraceRecorderMiddleware(TRACE_RECORD_PATH, TRACE_SALT or secrets.token_hex(16))
+        dp.update.outer_middleware(recorder)
+        dp.startup.register(recorder.start)
+        dp.shutdown.register(recorder.close)
+
+    # Трассы этапов заявок (services/tracing.py); писатель закрывается после воркеров отправки
+    if ORDER_TRACE_PATH:
+        trace_writer = tracing.enable(
+            ORDER_TRACE_PATH, max_bytes=ORDER_TRACE_MAX_BYTES, backups=ORDER_TRACE_BACKUPS,
+        )
+        dp.startup.register(trace_writer.start)
+        dp.shutdown.register(trace_writer.close)
+
+    # MetricsMiddleware — последним, чтобы мерить время самого хендлера
+    if METRICS_PORT:
+        _setup_metrics(dp, throttle_mw, logging_mw)
+
     dp.include_router(user.router)
     dp.include_router(admin.router)
     dp.include_router(correction.router)
+    return dp
+
+
+def _setup_metrics(dp: Dispatcher, throttle_mw: ThrottleMiddleware, logging_mw: LoggingMiddleware) -> None:
+    metrics.enable()
+    metrics_mw = MetricsMiddleware()
+    dp.update.outer_middleware(metrics_mw)
+    dp.message.middleware(metrics_mw)
+    dp.callback_query.middleware(metrics_mw)
+
+    metrics.Gauge(
+        "bot_media_group_pending_groups", "Альбомы, ожидающие сборки",
+        lambda: correction.media_groups.pending_groups,
+    )
+    metrics.Gauge(
+        "bot_media_group_pending_items", "Фото в буфере сборки альбомов",
+        lambda: correction.media_groups.pending_items,
+    )
+
+    breaker = dp["backend"].breaker
+    state_codes = {BreakerState.CLOSED: 0, BreakerState.HALF_OPEN: 1, BreakerState.OPEN: 2}
+    metrics.Gauge(
+        "bot_backend_breaker_state", "Предохранитель бэкенда: 0 — замкнут, 1 — проба, 2 — разомкнут",
+        lambda: state_codes[breaker.state],
+    )
+    metrics.Gauge("bot_backend_breaker_error_rate", "Доля ошибок бэкенда в окне предохранителя", breaker.error_rate)
+    metrics.Gauge(
+        "bot_backend_breaker_rejected_total", "Запросы к бэкенду, отклонённые предохранителем",
+        lambda: breaker.rejected,
+    )
 
-    logger.info("✅ Бот запущен и принимает сообщения")
+    for key, name, help_text in (
+        ("hit_rate", "bot_photo_cache_hit_ratio", "Доля запросов фото, обслуженных кэшем"),
+        ("memory_bytes", "bot_photo_cache_memory_bytes", "Байт фото в кэше в памяти"),
+        ("disk_bytes", "bot_photo_cache_disk_bytes", "Байт фото в кэше на диске"),
+    ):
+        metrics.Gauge(name, help_text, lambda key=key: photos.cache.stats()[key])
+
+    metrics.Gauge(
+        "bot_orders_cache_users", "Пользователи со списком заявок в кэше /orders",
+        lambda: dp["orders_cache"].size,
+    )
+
+    metrics.Gauge(
+        "bot_throttle_tracked_users", "Пользователи с состоянием в ThrottleMiddleware",
+        lambda: throttle_mw.tracked_users,
+    )
+
+    metrics.Gauge("bot_log_dropped_total", "Записи лога, отброшенные из-за переполненной очереди", dropped_records)
+    metrics.Gauge(
+        "bot_log_suppressed_total", "Сообщения без записи в лог: выборка и лимит записей на пользователя",
+        lambda: logging_mw.suppressed,
+    )
+
+    server = metrics.MetricsServer(METRICS_HOST, METRICS_PORT)
+    dp.startup.register(server.start)
+    dp.shutdown.register(server.close)
+
+
+def create_supervisor_dispatcher(workers: int) -> Dispatcher:
+    """Диспетчер процесса-супервизора: принимает апдейты и раздаёт их воркерам."""
+    if USERS_BACKEND != "sqlite" or FSM_STORAGE != "sqlite":
+        raise ValueError("Для --workers > 1 нужны общие хранилища: USERS_BACKEND=sqlite и FSM_STORAGE=sqlite")
+
+    dp = Dispatcher()
+
+    # Трасса пишется здесь: супервизор видит все апдейты в порядке поступления
+    if TRACE_RECORD_PATH:
+        recorder = TraceRecorderMiddleware(TRACE_RECORD_PATH, TRACE_SALT or secrets.token_hex(16))
+        dp.update.outer_middleware(recorder)
+        dp.startup.register(recorder.start)
+        dp.shutdown.register(recorder.close)
+
+    supervisor = Supervisor(
+        workers,
+        command=lambda index: [sys.executable, os.path.abspath(__file__), "--worker-index", str(index)],
+        env=lambda index: _worker_env(index, workers),
+        health_interval=WORKER_HEALTH_INTERVAL,
+        health_timeout=WORKER_HEALTH_TIMEOUT,
+    )
+    dp.update.outer_middleware(supervisor)
+    dp.startup.register(supervisor.start)
+    dp.shutdown.register(supervisor.close)
+
+    # Роутеры — только чтобы resolve_used_update_types() знал нужные типы апдейтов:
+    # до хендлеров апдейт не доходит, их выполняют воркеры
+    dp.include_router(user.router)
+    dp.include_router(admin.router)
+    dp.include_router(correction.router)
+    return dp
+
+
+def _worker_env(index: int, workers: int) -> dict[str, str]:
+    env = {
+        # Лимиты Telegram действуют на бота целиком — делим их между процессами
+        "TELEGRAM_GLOBAL_RATE": str(TELEGRAM_GLOBAL_RATE / workers),
+        "TELEGRAM_GROUP_RATE_PER_MINUTE": str(TELEGRAM_GROUP_RATE_PER_MINUTE / workers),
+        "TRACE_RECORD_PATH": "",
+    }
+    if PHOTO_CACHE_DIR:
+        # Свой каталог кэша у каждого воркера: бюджет и индекс — на процесс
+        env["PHOTO_CACHE_DIR"] = os.path.join(PHOTO_CACHE_DIR, f"worker-{index}")
+    if ORDER_TRACE_PATH:
+        # Свой файл трасс у каждого воркера: ротировать один файл из нескольких процессов нельзя
+        root, ext = os.path.splitext(ORDER_TRACE_PATH)
+        env["ORDER_TRACE_PATH"] = f"{root}-worker-{index}{ext}"
+    if METRICS_PORT:
+        # У каждого воркера свой /metrics: METRICS_PORT, METRICS_PORT + 1, ...
+        env["METRICS_PORT"] = str(METRICS_PORT + index)
+    return env
+
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    logger.info("✅ Бот запущен и принимает сообщения (long polling)")
     await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
 
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    server = WebhookServer(
+        bot,
+        dp,
+        path=WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        workers=WEBHOOK_WORKERS,
+    )
+    await server.start(WEBHOOK_HOST, WEBHOOK_PORT)
+    try:
+        if WEBHOOK_BASE_URL:
+            await bot.set_webhook(
+                url=f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        logger.info("✅ Бот запущен и принимает сообщения (webhook :%d%s)", WEBHOOK_PORT, WEBHOOK_PATH)
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await bot.session.close()
+
+
+async def main(mode: str = "polling", workers: int = 1, worker_index: Optional[int] = None):
+    bot = create_bot()
+    if worker_index is not None:
+        # Процесс-воркер: апдейты приходят от супервизора (services/cluster.py)
+        await serve_worker(bot, create_dispatcher(), worker_index)
+        return
+
+    dp = create_dispatcher() if workers <= 1 else create_supervisor_dispatcher(workers)
+
+    if mode == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        await run_polling(bot, dp)
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Items Correction Bot")
+    parser.add_argument(
+        "--mode",
+        choices=("polling", "webhook"),
+        default="polling",
+        help="способ получения апдейтов от Telegram",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="число процессов-воркеров, обрабатывающих апдейты",
+    )
+    parser.add_argument("--worker-index", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, log_file=LOG_FILE, queue_size=LOG_QUEUE_SIZE)
+    try:
+        asyncio.run(main(args.mode, args.workers, args.worker_index))
+    finally:
+        stop_logging()
@@ -10,6 +10,7 @@ from aiogram.types import Message, CallbackQuery, TelegramObject
 
 from db.users import get_status, UserStatus
 from config import is_admin
+from services import metrics
 
 # Команды, доступные без верификации
 ALLOWED_COMMANDS = {"/start"}
@@ -39,6 +40,7 @@ class VerificationMiddleware(BaseMiddleware):
 
         # ── Проверяем статус пользователя ──────────────────────────────
         status = await get_status(user.id)
+        metrics.VERIFICATION_LOOKUPS.inc("unknown" if status is None else "found")
 
         if status == UserStatus.APPROVED:
             return await handler(event, data)
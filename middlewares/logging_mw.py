@@ -1,20 +1,58 @@
 """
 Middleware логирования входящих сообщений.
-Выводит в консоль информацию о каждом написавшем пользователе —
+Выводит в лог информацию о каждом написавшем пользователе —
 для удобного добавления новых админов.
+
+Запись структурная (поля user_id, username, full_name, role, event,
+payload — в JSON-формате попадают в объект записи) и дешёвая для
+event loop: форматирование и вывод выполняет фоновый поток
+(services/logging_setup.py). Для частых событий есть выборка
+(sample_rate) и ограничение числа записей на пользователя в минуту;
+первые сообщения нового пользователя ограничение не срезает.
+Сколько записей срезано — счётчик suppressed (метрика bot_log_suppressed_total).
 """
 
 import logging
+import random
 from typing import Any, Awaitable, Callable, Dict
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message, CallbackQuery
 
 from config import is_admin
+from services.sender import TokenBucket
 
 logger = logging.getLogger("UserLog")
 
+# Сколько символов текста / callback-данных попадает в лог
+PAYLOAD_LIMIT = 60
+
+# Больше стольких пользователей не держим бакеты — сбрасываем все разом
+_MAX_TRACKED_USERS = 10000
+
 
 class LoggingMiddleware(BaseMiddleware):
+    def __init__(self, *, sample_rate: float = 1.0, user_rate_per_minute: float = 0):
+        self._sample_rate = sample_rate
+        self._user_rate = user_rate_per_minute / 60
+        self._user_burst = max(1.0, user_rate_per_minute / 6)
+        self._buckets: dict[int, TokenBucket] = {}
+        self.suppressed = 0
+
+    def _allowed(self, user_id: int) -> bool:
+        if self._sample_rate < 1 and random.random() >= self._sample_rate:
+            return False
+        if not self._user_rate:
+            return True
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= _MAX_TRACKED_USERS:
+                self._buckets.clear()
+            bucket = self._buckets[user_id] = TokenBucket(self._user_rate, self._user_burst)
+        if bucket.wait_time() > 0:
+            return False
+        bucket.take()
+        return True
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -22,20 +60,30 @@ class LoggingMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         user = data.get("event_from_user")
-        if user:
-            role = "👑 ADMIN" if is_admin(user.id) else "👤 USER"
-            username = f"@{user.username}" if user.username else "нет username"
-
+        if user and logger.isEnabledFor(logging.INFO):
             if isinstance(event, Message):
-                text = (event.text or event.caption or "[медиа]")[:60]
-                logger.info(
-                    f"{role} | ID: {user.id} | {username} | "
-                    f"Имя: {user.full_name!r} | Сообщение: {text!r}"
-                )
+                kind, payload = "message", (event.text or event.caption or "[медиа]")[:PAYLOAD_LIMIT]
             elif isinstance(event, CallbackQuery):
+                kind, payload = "callback", (event.data or "")[:PAYLOAD_LIMIT]
+            else:
+                kind = None
+
+            if kind and self._allowed(user.id):
+                role = "admin" if is_admin(user.id) else "user"
                 logger.info(
-                    f"{role} | ID: {user.id} | {username} | "
-                    f"Имя: {user.full_name!r} | Callback: {event.data!r}"
+                    "%s | ID: %s | %s | Имя: %r | %s: %r",
+                    role, user.id, f"@{user.username}" if user.username else "нет username",
+                    user.full_name, kind, payload,
+                    extra={
+                        "user_id": user.id,
+                        "username": user.username,
+                        "full_name": user.full_name,
+                        "role": role,
+                        "event": kind,
+                        "payload": payload,
+                    },
                 )
+            elif kind:
+                self.suppressed += 1
 
         return await handler(event, data)
@@ -0,0 +1,46 @@
+"""
+Middleware метрик (services/metrics.py).
+
+Регистрируется только при включённых метриках (METRICS_PORT):
+  - на dp.update (outer) — число апдейтов по типу и полное время обработки;
+  - на message / callback_query (inner, последним) — время самого хендлера
+    с разбивкой по роутеру (модулю) и функции.
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from services import metrics
+
+
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            update_type = event.event_type
+            metrics.UPDATES.inc(update_type)
+            started = time.perf_counter()
+            try:
+                return await handler(event, data)
+            finally:
+                metrics.UPDATE_LATENCY.observe(time.perf_counter() - started, update_type)
+
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        router = getattr(callback, "__module__", "unknown")
+        name = getattr(callback, "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.HANDLER_ERRORS.inc(router, name)
+            raise
+        finally:
+            metrics.HANDLER_LATENCY.observe(time.perf_counter() - started, router, name)
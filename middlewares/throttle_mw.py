@@ -0,0 +1,230 @@
+"""
+Middleware ограничения нагрузки от одного пользователя.
+
+Стоит после VerificationMiddleware (main.create_dispatcher):
+
+  - token bucket на пользователя — отдельно для сообщений и callback'ов.
+    Если токена нет, но он появится в пределах max_wait секунд, апдейт
+    ждёт своей очереди; иначе отклоняется (на сообщения — один ответ
+    за серию, на callback — всплывающее уведомление). Альбом тратит один
+    токен: остальные сообщения той же media_group проходят без списания,
+    но не раньше первой части — пока она ждёт токена и допуска, они ждут
+    её (иначе сборка альбома сбросила бы альбом без первого фото и подписи),
+    а если альбом отклонён, отбрасываются вместе с ней;
+  - не больше max_pending неотправленных заявок на пользователя: новая
+    заявка с фото отклоняется с ответом, пока прежние не отправлены;
+  - общий допуск: пока в очереди на отправку больше max_backlog_bytes байт
+    фото, новые заявки не принимаются.
+
+Состояние пользователя — объект со __slots__ (два бакета, время, флаги);
+записи, чьи бакеты давно полны, удаляются периодическим проходом, так что
+память не растёт с числом пользователей. Администраторы не ограничиваются.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import is_admin
+from services import metrics
+from services.uploader import OrderUploader
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять записи неактивных пользователей (секунды)
+_SWEEP_INTERVAL = 60.0
+
+_THROTTLED_TEXT = "⏳ <b>Слишком много сообщений.</b>\n\nПодождите {seconds} с и повторите."
+_THROTTLED_CALLBACK_TEXT = "⏳ Слишком часто. Подождите {seconds} с."
+_PENDING_TEXT = (
+    "⏳ <b>Предыдущие заявки ещё отправляются ({count}).</b>\n\n"
+    "Дождитесь их отправки и пришлите новую заявку."
+)
+_BACKLOG_TEXT = "⏳ <b>Сервер перегружен.</b>\n\nПожалуйста, пришлите заявку через пару минут."
+
+
+class _UserState:
+    __slots__ = ("messages", "callbacks", "updated", "notified", "album", "album_admitted", "rejected_album")
+
+    def __init__(self, messages: float, callbacks: float, now: float):
+        self.messages = messages        # токены сообщений
+        self.callbacks = callbacks      # токены callback'ов
+        self.updated = now
+        self.notified = False           # уже ответили «слишком много» в этой серии
+        self.album: Optional[str] = None           # пропущенный альбом (его части — без токена)
+        # Итог первой части альбома: True — передана в хендлер, False — отклонена
+        self.album_admitted: Optional[asyncio.Future] = None
+        self.rejected_album: Optional[str] = None  # отклонённый альбом (части — молча)
+
+
+def _has_image(message: Message) -> bool:
+    return bool(message.photo) or bool(
+        message.document and (message.document.mime_type or "").startswith("image/")
+    )
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        uploader: OrderUploader,
+        *,
+        message_rate_per_minute: float,
+        message_burst: float,
+        callback_rate_per_minute: float,
+        callback_burst: float,
+        max_wait: float,
+        max_pending: int,
+        max_backlog_bytes: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._uploader = uploader
+        self._message_rate = message_rate_per_minute / 60
+        self._message_burst = message_burst
+        self._callback_rate = callback_rate_per_minute / 60
+        self._callback_burst = callback_burst
+        self._max_wait = max_wait
+        self._max_pending = max_pending
+        self._max_backlog_bytes = max_backlog_bytes
+        self._clock = clock
+        self._users: dict[int, _UserState] = {}
+        # Через столько секунд простоя оба бакета гарантированно полны
+        self._idle_ttl = max(
+            message_burst / self._message_rate if self._message_rate else 0,
+            callback_burst / self._callback_rate if self._callback_rate else 0,
+        )
+        self._last_sweep = clock()
+
+    @property
+    def tracked_users(self) -> int:
+        return len(self._users)
+
+    # ── Бакеты ──────────────────────────────────────────────────────────────
+    def _state(self, user_id: int) -> _UserState:
+        now = self._clock()
+        state = self._users.get(user_id)
+        if state is None:
+            self._sweep(now)
+            state = self._users[user_id] = _UserState(self._message_burst, self._callback_burst, now)
+            return state
+        elapsed = now - state.updated
+        state.messages = min(self._message_burst, state.messages + elapsed * self._message_rate)
+        state.callbacks = min(self._callback_burst, state.callbacks + elapsed * self._callback_rate)
+        state.updated = now
+        return state
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep < _SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        idle = [
+            user_id for user_id, state in self._users.items()
+            if now - state.updated > max(self._idle_ttl, _SWEEP_INTERVAL)
+        ]
+        for user_id in idle:
+            del self._users[user_id]
+
+    def _reserve(self, state: _UserState, callback: bool) -> float:
+        """
+        Сколько ждать своей очереди. Токен списывается, только если
+        ждать не дольше max_wait (иначе апдейт отклоняется).
+        """
+        rate = self._callback_rate if callback else self._message_rate
+        if not rate:
+            return 0.0
+        tokens = (state.callbacks if callback else state.messages) - 1
+        wait = 0.0 if tokens >= 0 else -tokens / rate
+        if wait > self._max_wait:
+            return wait
+        if callback:
+            state.callbacks = tokens
+        else:
+            state.messages = tokens
+        return wait
+
+    # ── Middleware ──────────────────────────────────────────────────────────
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if not user or is_admin(user.id):
+            return await handler(event, data)
+
+        state = self._state(user.id)
+        if isinstance(event, CallbackQuery):
+            wait = self._reserve(state, callback=True)
+            if wait > self._max_wait:
+                metrics.THROTTLED.inc("callback")
+                await event.answer(_THROTTLED_CALLBACK_TEXT.format(seconds=math.ceil(wait)))
+                return None
+            if wait:
+                await asyncio.sleep(wait)
+            return await handler(event, data)
+        if not isinstance(event, Message):
+            return await handler(event, data)
+
+        group = event.media_group_id
+        if group is not None and group == state.album:
+            # Часть уже пропущенного альбома — та же заявка, но в хендлер только после
+            # первой части. shield: отмена одного апдейта не должна отменить общий future
+            if await asyncio.shield(state.album_admitted):
+                return await handler(event, data)
+            return None
+        if group is not None and group == state.rejected_album:
+            return None
+
+        wait = self._reserve(state, callback=False)
+        if wait > self._max_wait:
+            metrics.THROTTLED.inc("message")
+            state.rejected_album = group
+            if not state.notified:
+                state.notified = True
+                await event.answer(_THROTTLED_TEXT.format(seconds=math.ceil(wait)))
+            return None
+        state.notified = False
+
+        admitted: Optional[asyncio.Future] = None
+        if group is not None:
+            state.album = group
+            admitted = state.album_admitted = asyncio.get_running_loop().create_future()
+        handled = False
+        try:
+            if _has_image(event) and not await self._admit_order(event, user.id):
+                # Альбом отклоняем целиком и отвечаем один раз
+                if group is not None:
+                    state.album = None
+                    state.rejected_album = group
+                return None
+            if wait:
+                await asyncio.sleep(wait)
+            handled = True
+            return await handler(event, data)
+        finally:
+            # Хендлер альбома только кладёт часть в сборку и сразу возвращается —
+            # после этого остальные части уже не обгонят первую
+            if admitted is not None:
+                admitted.set_result(handled)
+
+    async def _admit_order(self, message: Message, user_id: int) -> bool:
+        """Можно ли принять заявку: лимит неотправленных заявок и общий объём очереди."""
+        if not self._max_pending and not self._max_backlog_bytes:
+            return True
+        pending, backlog_bytes = await self._uploader.backlog(user_id)
+        if self._max_pending and pending >= self._max_pending:
+            metrics.THROTTLED.inc("pending")
+            text = _PENDING_TEXT.format(count=pending)
+        elif self._max_backlog_bytes and backlog_bytes >= self._max_backlog_bytes:
+            metrics.THROTTLED.inc("backlog")
+            logger.warning("Очередь заявок переполнена: %d байт фото, заявка отклонена", backlog_bytes)
+            text = _BACKLOG_TEXT
+        else:
+            return True
+        await message.answer(text)
+        return False
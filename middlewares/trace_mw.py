@@ -0,0 +1,182 @@
+"""
+Запись входящих апдейтов в трассу (JSONL) для последующего воспроизведения
+(python -m benchmarks.dispatcher.replay).
+
+Включается настройкой TRACE_RECORD_PATH. Одна строка трассы:
+    {"ts": <unix time>, "role": "admin" | "user", "update": {...}}
+
+Апдейт обезличивается до записи:
+  - ID пользователей и чатов заменяются псевдонимами (HMAC с TRACE_SALT),
+    одинаковыми в пределах трассы — видно, что альбом или серия сообщений
+    от одного человека;
+  - имена и username удаляются, текст и подписи заменяются заглушкой той же
+    длины (команды и номера заявок сохраняются — от них зависит маршрутизация);
+  - file_id фото заменяются хэшами;
+  - всё, что бот не использует, отбрасывается (белый список полей).
+
+Запись в файл — пачками из фоновой задачи, хендлеры её не ждут.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiofiles
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import is_admin
+
+logger = logging.getLogger(__name__)
+
+# Как часто сбрасывать накопленные строки в файл (секунды)
+_FLUSH_INTERVAL = 1.0
+
+_NUMBER = re.compile(r"\d+")
+
+
+class _Sanitizer:
+    def __init__(self, salt: str):
+        self._key = salt.encode()
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self._key, value.encode(), hashlib.sha256).digest()
+
+    def user_id(self, value: int) -> int:
+        pseudonym = int.from_bytes(self._digest(str(abs(value)))[:4], "big") % 2_000_000_000 + 1
+        # Знак сохраняем: отрицательные ID — группы и каналы
+        return -pseudonym if value < 0 else pseudonym
+
+    def file_id(self, value: str) -> str:
+        return self._digest(value)[:12].hex()
+
+    def text(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        if value.startswith("/") or value.isdigit():
+            return value
+        return "x" * len(value)
+
+    def callback_data(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return _NUMBER.sub(lambda m: str(self.user_id(int(m.group()))), value)
+
+    def user(self, user: Optional[dict]) -> Optional[dict]:
+        if user is None:
+            return None
+        return {"id": self.user_id(user["id"]), "is_bot": user.get("is_bot", False), "first_name": "user"}
+
+    def chat(self, chat: dict) -> dict:
+        return {"id": self.user_id(chat["id"]), "type": chat["type"]}
+
+    def message(self, message: dict) -> dict:
+        result: dict[str, Any] = {
+            "message_id": message["message_id"],
+            "date": message["date"],
+            "chat": self.chat(message["chat"]),
+        }
+        if message.get("from"):
+            result["from"] = self.user(message["from"])
+        for key in ("text", "caption"):
+            if message.get(key) is not None:
+                result[key] = self.text(message[key])
+        if result.get("text", "").startswith("/"):
+            result["entities"] = [
+                entity for entity in message.get("entities") or () if entity.get("type") == "bot_command"
+            ]
+        if message.get("media_group_id"):
+            result["media_group_id"] = self.file_id(message["media_group_id"])
+        if message.get("photo"):
+            result["photo"] = [
+                {
+                    "file_id": self.file_id(size["file_id"]),
+                    "file_unique_id": self.file_id(size["file_unique_id"]),
+                    "width": size["width"],
+                    "height": size["height"],
+                    "file_size": size.get("file_size"),
+                }
+                for size in message["photo"]
+            ]
+        return result
+
+    def update(self, update: dict) -> Optional[dict]:
+        if update.get("message"):
+            return {"update_id": update["update_id"], "message": self.message(update["message"])}
+        callback = update.get("callback_query")
+        if callback:
+            result = {
+                "id": callback["id"],
+                "from": self.user(callback["from"]),
+                "chat_instance": self.file_id(callback.get("chat_instance", "")),
+                "data": self.callback_data(callback.get("data")),
+            }
+            if callback.get("message"):
+                result["message"] = self.message(callback["message"])
+            return {"update_id": update["update_id"], "callback_query": result}
+        # Остальные типы апдейтов бот не обрабатывает
+        return None
+
+
+class TraceRecorderMiddleware(BaseMiddleware):
+    """Outer-middleware для dp.update: пишет обезличенные апдейты в трассу."""
+
+    def __init__(self, path: str, salt: str):
+        self._path = path
+        self._sanitizer = _Sanitizer(salt)
+        self._buffer: list[str] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            try:
+                self._record(event, data)
+            except Exception:
+                logger.exception("Не удалось записать апдейт %s в трассу", event.update_id)
+        return await handler(event, data)
+
+    def _record(self, update: Update, data: Dict[str, Any]) -> None:
+        sanitized = self._sanitizer.update(update.model_dump(mode="json", exclude_none=True, by_alias=True))
+        if sanitized is None:
+            return
+        user = data.get("event_from_user")
+        self._buffer.append(json.dumps({
+            "ts": time.time(),
+            "role": "admin" if user and is_admin(user.id) else "user",
+            "update": sanitized,
+        }, ensure_ascii=False))
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(_FLUSH_INTERVAL)
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Не удалось сбросить трассу в %s", self._path)
+
+    async def _flush(self) -> None:
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        async with aiofiles.open(self._path, "a", encoding="utf-8") as f:
+            await f.write("\n".join(lines) + "\n")
@@ -0,0 +1,289 @@
+"""
+Клиент бэкенда Pulse TTM.
+
+Один экземпляр на процесс: создаётся в main.py, сессия открывается
+на старте диспетчера и закрывается при остановке. В хендлеры клиент
+попадает через данные диспетчера (аргумент ``backend``).
+
+Все запросы идут через общий пул соединений aiohttp (keep-alive,
+лимит соединений на хост, кэш DNS), поэтому новые методы API достаточно
+добавить сюда — они автоматически используют тот же пул.
+
+Если задан предохранитель (services/breaker.py), все запросы идут через
+него: при недоступном бэкенде вызов сразу завершается BackendUnavailable,
+а таймаут запроса подстраивается под наблюдаемые задержки бэкенда.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Optional
+
+import aiohttp
+from aiohttp.payload import Payload
+
+from services import metrics, tracing
+from services.breaker import BackendUnavailable, CircuitBreaker
+from services.photos import PhotoPart
+
+logger = logging.getLogger(__name__)
+
+
+class BackendError(Exception):
+    """Бэкенд ответил неожиданным статусом."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"{status}: {detail}")
+        self.status = status
+        self.detail = detail
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """Говорит ли ошибка о проблеме бэкенда (а не конкретного запроса)."""
+    if isinstance(exc, BackendError):
+        return exc.status >= 500 or exc.status in (408, 429)
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+@dataclass
+class NewOrder:
+    """Данные для POST /correction-orders/."""
+    telegram_user_id: int
+    telegram_chat_id: int
+    telegram_username: Optional[str] = None
+    telegram_full_name: Optional[str] = None
+    description: Optional[str] = None
+    replace_order_id: Optional[int] = None
+    user_message_id: Optional[int] = None
+    photos: list[PhotoPart] = field(default_factory=list)
+    # Уходит заголовком Idempotency-Key: повтор того же запроса не создаёт вторую заявку
+    idempotency_key: Optional[str] = None
+
+    def to_form(self) -> aiohttp.FormData:
+        form = aiohttp.FormData()
+        form.add_field("telegram_user_id", str(self.telegram_user_id))
+        form.add_field("telegram_chat_id", str(self.telegram_chat_id))
+        if self.telegram_username:
+            form.add_field("telegram_username", self.telegram_username)
+        if self.telegram_full_name:
+            form.add_field("telegram_full_name", self.telegram_full_name)
+        if self.description:
+            form.add_field("description", self.description)
+        if self.replace_order_id:
+            form.add_field("replace_order_id", str(self.replace_order_id))
+        if self.user_message_id:
+            form.add_field("user_message_id", str(self.user_message_id))
+
+        for photo in self.photos:
+            form.add_field(
+                "photos",
+                photo.body,
+                filename=photo.filename,
+                content_type=photo.content_type,
+            )
+        return form
+
+    def photo_bytes(self) -> Optional[int]:
+        """Сколько байт фото уйдёт в теле запроса; None — если размер какого-то фото неизвестен."""
+        if any(photo.size is None for photo in self.photos):
+            return None
+        return sum(photo.size for photo in self.photos)
+
+
+# on_progress(отправлено байт, всего байт или None); по окончании тела — (n, n)
+UploadProgress = Callable[[int, Optional[int]], None]
+
+
+class _CountingWriter:
+    def __init__(self, writer: Any, on_chunk: Callable[[int], None]):
+        self._writer = writer
+        self._on_chunk = on_chunk
+
+    async def write(self, chunk: bytes) -> None:
+        await self._writer.write(chunk)
+        self._on_chunk(len(chunk))
+
+
+class _ProgressPayload(Payload):
+    """Тело запроса, сообщающее, сколько байт уже ушло в сокет."""
+
+    def __init__(self, inner: Payload, on_progress: UploadProgress):
+        super().__init__(inner, headers=inner.headers)
+        self._inner = inner
+        self._on_progress = on_progress
+        self._sent = 0
+
+    @property
+    def size(self) -> Optional[int]:
+        return self._inner.size
+
+    def _on_chunk(self, size: int) -> None:
+        self._sent += size
+        self._on_progress(self._sent, self.size)
+
+    async def write(self, writer: Any) -> None:
+        await self._inner.write(_CountingWriter(writer, self._on_chunk))
+        self._on_progress(self._sent, self._sent)
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        return self._inner.decode(encoding, errors)
+
+
+async def _error_detail(resp: aiohttp.ClientResponse) -> str:
+    body = await resp.text()
+    try:
+        return str(json.loads(body).get("detail", body))
+    except (ValueError, AttributeError):
+        return body
+
+
+class BackendClient:
+    def __init__(
+        self,
+        base_url: str,
+        secret_key: str,
+        *,
+        timeout: float,
+        upload_timeout: float,
+        connect_timeout: float,
+        limit_per_host: int,
+        dns_ttl: int,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self._base_url = base_url
+        self._headers = {"X-Bot-Secret": secret_key}
+        self._timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._upload_timeout = aiohttp.ClientTimeout(total=upload_timeout, connect=connect_timeout)
+        self._limit_per_host = limit_per_host
+        self._dns_ttl = dns_ttl
+        self.breaker = breaker
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        if self._session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self._limit_per_host,
+            ttl_dns_cache=self._dns_ttl,
+            keepalive_timeout=30,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self._headers,
+            timeout=self._timeout,
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            raise RuntimeError("BackendClient не запущен (start() не вызывался)")
+        return self._session
+
+    def _url(self, path: str) -> str:
+        return f"{self._base_url}{path}"
+
+    def check_available(self) -> None:
+        """Бросает BackendUnavailable, если предохранитель сейчас отклонит запрос."""
+        if self.breaker is not None:
+            self.breaker.check()
+
+    def _post(self, route: str, path: str, **kwargs):
+        return self._call("POST", route, path, **kwargs)
+
+    def _get(self, route: str, path: str, **kwargs):
+        return self._call("GET", route, path, **kwargs)
+
+    @asynccontextmanager
+    async def _call(
+        self, method: str, route: str, path: str, *,
+        upload: bool = False, payload_bytes: Optional[int] = 0, **kwargs,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        Запрос через предохранитель и с метриками: route — шаблон пути (без ID),
+        метка endpoint — «METHOD route»; upload — запрос с фото (длинный таймаут),
+        payload_bytes — размер тела для адаптивного таймаута (None — неизвестен).
+        """
+        endpoint = f"{method} {route}"
+        timeout = self._upload_timeout if upload else self._timeout
+        if self.breaker is None:
+            async with self._request(method, endpoint, path, timeout, **kwargs) as resp:
+                yield resp
+            return
+        try:
+            async with self.breaker.guard(endpoint, timeout.total, payload_bytes) as total:
+                timeout = aiohttp.ClientTimeout(total=total, connect=timeout.connect)
+                async with self._request(method, endpoint, path, timeout, **kwargs) as resp:
+                    yield resp
+        except BackendUnavailable:
+            metrics.BACKEND_RESPONSES.inc(endpoint, "rejected")
+            raise
+
+    @asynccontextmanager
+    async def _request(
+        self, method: str, endpoint: str, path: str, timeout: aiohttp.ClientTimeout, **kwargs,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with self.session.request(method, self._url(path), timeout=timeout, **kwargs) as resp:
+                status = str(resp.status)
+                yield resp
+        finally:
+            metrics.BACKEND_LATENCY.observe(time.perf_counter() - started, endpoint)
+            metrics.BACKEND_RESPONSES.inc(endpoint, status)
+
+    # ── /correction-orders ──────────────────────────────────────────────────
+    async def create_order(
+        self, order: NewOrder, on_progress: Optional[UploadProgress] = None,
+    ) -> dict[str, Any]:
+        """
+        Создаёт (или заменяет) заявку. Возвращает созданную заявку.
+        С ключом идемпотентности бэкенд на повтор отвечает 200 и уже созданной заявкой.
+        on_progress получает ход отправки тела запроса.
+        """
+        headers = {"Idempotency-Key": order.idempotency_key} if order.idempotency_key else None
+        with tracing.span("multipart"):
+            data = order.to_form()
+            if on_progress is not None:
+                data = _ProgressPayload(data(), on_progress)
+        async with self._post(
+            "/correction-orders/", "/correction-orders/",
+            data=data, headers=headers, upload=True, payload_bytes=order.photo_bytes(),
+        ) as resp:
+            if resp.status not in (200, 201):
+                raise BackendError(resp.status, await _error_detail(resp))
+            return await resp.json()
+
+    async def user_confirm(self, order_id: int) -> dict[str, Any]:
+        """Пользователь подтверждает выполнение заявки."""
+        async with self._post(
+            "/correction-orders/{id}/user-confirm", f"/correction-orders/{order_id}/user-confirm",
+        ) as resp:
+            if resp.status != 200:
+                raise BackendError(resp.status, await _error_detail(resp))
+            return await resp.json()
+
+    async def list_orders(self, telegram_user_id: int, limit: int) -> list[dict[str, Any]]:
+        """Последние заявки пользователя, новые первыми."""
+        async with self._get(
+            "/correction-orders/", "/correction-orders/",
+            params={"telegram_user_id": telegram_user_id, "limit": limit},
+        ) as resp:
+            if resp.status != 200:
+                raise BackendError(resp.status, await _error_detail(resp))
+            orders = await resp.json()
+        # Список уходит в кэш и в HTML-текст /orders — форму ответа и номера проверяем здесь
+        try:
+            if not isinstance(orders, list):
+                raise TypeError(type(orders).__name__)
+            return [{**order, "id": int(order["id"])} for order in orders]
+        except (TypeError, KeyError, ValueError):
+            raise BackendError(resp.status, "Некорректный ответ сервера") from None
@@ -0,0 +1,243 @@
+"""
+Предохранитель (circuit breaker) для запросов к бэкенду.
+
+Пока бэкенд отвечает нормально, предохранитель замкнут (closed) и только
+считает: доля ошибок за последние `window` секунд и задержки ответов.
+Если ошибок стало не меньше `error_rate` (при хотя бы `min_calls` вызовах
+в окне), предохранитель размыкается (open): вызовы сразу завершаются
+BackendUnavailable, не занимая соединения и задачи на полный таймаут.
+Через `open_seconds` пропускается одна пробная попытка (half-open):
+удачная замыкает предохранитель, неудачная — снова размыкает. Ошибкой
+считается то, что решает `is_failure` (сеть, таймаут, 5xx); ответ 4xx —
+признак живого бэкенда.
+
+Таймаут запроса подстраивается под бэкенд: p99 задержки успешных ответов
+в окне × `timeout_multiplier`, но не меньше `timeout_min` и не больше
+настроенного таймаута вызова. Пока данных мало — настроенный таймаут.
+Время загрузки тела зависит от его размера, а не только от бэкенда:
+к таймауту запроса с телом добавляется `seconds_per_mb` на каждый МБ,
+а запрос с телом неизвестного размера идёт с настроенным таймаутом.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import AsyncIterator, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних вызовов хранить в окне (на случай очень частых вызовов)
+_WINDOW_LIMIT = 2000
+
+# Сколько успешных ответов нужно, чтобы считать p99 по ним
+_LATENCY_MIN_SAMPLES = 20
+
+# p99 пересчитывается не чаще раза в столько секунд
+_LATENCY_REFRESH = 1.0
+
+_MB = 1024 * 1024
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class BackendUnavailable(Exception):
+    """Предохранитель разомкнут: бэкенд недавно не отвечал, вызов не выполнялся."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"бэкенд недоступен, повтор через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+class _LatencyWindow:
+    def __init__(self, window: float, clock: Callable[[], float]):
+        self._window = window
+        self._clock = clock
+        self._samples: deque[tuple[float, float]] = deque(maxlen=_WINDOW_LIMIT)
+        self._p99: Optional[float] = None
+        self._computed_at = float("-inf")
+
+    def add(self, latency: float) -> None:
+        self._samples.append((self._clock(), latency))
+
+    def p99(self) -> Optional[float]:
+        now = self._clock()
+        if now - self._computed_at >= _LATENCY_REFRESH:
+            self._computed_at = now
+            while self._samples and self._samples[0][0] < now - self._window:
+                self._samples.popleft()
+            if len(self._samples) < _LATENCY_MIN_SAMPLES:
+                self._p99 = None
+            else:
+                latencies = sorted(latency for _, latency in self._samples)
+                self._p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return self._p99
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        *,
+        window: float,
+        min_calls: int,
+        error_rate: float,
+        open_seconds: float,
+        timeout_multiplier: float,
+        timeout_min: float,
+        is_failure: Callable[[BaseException], bool],
+        seconds_per_mb: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._window = window
+        self._min_calls = min_calls
+        self._error_rate = error_rate
+        self._open_seconds = open_seconds
+        self._timeout_multiplier = timeout_multiplier
+        self._timeout_min = timeout_min
+        self._seconds_per_mb = seconds_per_mb
+        self._is_failure = is_failure
+        self._clock = clock
+
+        self.state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # (момент, неудача?) за последние window секунд
+        self._calls: deque[tuple[float, bool]] = deque(maxlen=_WINDOW_LIMIT)
+        self._failures = 0
+        self._latency: dict[str, _LatencyWindow] = {}
+        self.rejected = 0
+        self.opened = 0
+
+    # ── Статистика окна ─────────────────────────────────────────────────────
+    def _prune(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self._window:
+            _, failed = self._calls.popleft()
+            self._failures -= failed
+
+    def _add_call(self, failed: bool) -> None:
+        now = self._clock()
+        if len(self._calls) == self._calls.maxlen:
+            self._failures -= self._calls[0][1]
+        self._calls.append((now, failed))
+        self._failures += failed
+        self._prune(now)
+
+    def error_rate(self) -> float:
+        self._prune(self._clock())
+        return self._failures / len(self._calls) if self._calls else 0.0
+
+    def timeout(self, endpoint: str, default: float, payload_bytes: Optional[int] = 0) -> float:
+        """
+        Таймаут вызова: из p99 задержек endpoint плюс запас на отправку
+        payload_bytes, в пределах [timeout_min, default].
+        payload_bytes=None — размер тела неизвестен, таймаут не сокращается.
+        """
+        if payload_bytes is None:
+            return default
+        window = self._latency.get(endpoint)
+        p99 = window.p99() if window is not None else None
+        if p99 is None:
+            return default
+        adaptive = max(self._timeout_min, p99 * self._timeout_multiplier)
+        return min(default, adaptive + payload_bytes / _MB * self._seconds_per_mb)
+
+    # ── Состояния ───────────────────────────────────────────────────────────
+    def _set_state(self, state: BreakerState) -> None:
+        if state is self.state:
+            return
+        logger.warning("Предохранитель бэкенда: %s → %s", self.state.value, state.value)
+        self.state = state
+        if state is BreakerState.OPEN:
+            self.opened += 1
+            self._opened_at = self._clock()
+        elif state is BreakerState.CLOSED:
+            # Ошибки до восстановления не должны сразу разомкнуть снова, а задержки
+            # «до» — задавать таймаут бэкенду, который после сбоя может отвечать медленнее
+            self._calls.clear()
+            self._failures = 0
+            self._latency.clear()
+
+    def _acquire(self) -> bool:
+        """Можно ли выполнить вызов. True — это пробный вызов в half-open."""
+        if self.state is BreakerState.OPEN:
+            retry_after = self._opened_at + self._open_seconds - self._clock()
+            if retry_after > 0:
+                self.rejected += 1
+                raise BackendUnavailable(retry_after)
+            self._set_state(BreakerState.HALF_OPEN)
+        if self.state is BreakerState.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise BackendUnavailable(self._open_seconds)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def check(self) -> None:
+        """Бросает BackendUnavailable, если вызов сейчас будет отклонён (без пробы)."""
+        if self.state is BreakerState.OPEN:
+            retry_after = self._opened_at + self._open_seconds - self._clock()
+            if retry_after > 0:
+                raise BackendUnavailable(retry_after)
+
+    @asynccontextmanager
+    async def guard(
+        self, endpoint: str, default_timeout: float, payload_bytes: Optional[int] = 0,
+    ) -> AsyncIterator[float]:
+        """
+        Оборачивает вызов: отклоняет его при разомкнутом предохранителе,
+        выдаёт таймаут (см. timeout()) и учитывает результат.
+        """
+        probe = self._acquire()
+        started = self._clock()
+        try:
+            # Проба — с полным таймаутом: иначе медленный, но живой бэкенд её не пройдёт
+            yield default_timeout if probe else self.timeout(endpoint, default_timeout, payload_bytes)
+        except asyncio.CancelledError:
+            # Отмена (остановка бота) — ни успех, ни ошибка
+            if probe:
+                self._probe_in_flight = False
+            raise
+        except Exception as exc:
+            self._record(endpoint, self._is_failure(exc), self._clock() - started, probe)
+            raise
+        else:
+            self._record(endpoint, False, self._clock() - started, probe)
+
+    def _record(self, endpoint: str, failed: bool, latency: float, probe: bool) -> None:
+        if not failed:
+            window = self._latency.get(endpoint)
+            if window is None:
+                window = self._latency[endpoint] = _LatencyWindow(self._window, self._clock)
+            window.add(latency)
+
+        if probe:
+            self._probe_in_flight = False
+            self._set_state(BreakerState.OPEN if failed else BreakerState.CLOSED)
+            return
+        if self.state is not BreakerState.CLOSED:
+            # Вызов начался до размыкания — состояние решает только проба
+            return
+
+        self._add_call(failed)
+        if (
+            len(self._calls) >= self._min_calls
+            and self._failures / len(self._calls) >= self._error_rate
+        ):
+            self._set_state(BreakerState.OPEN)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state.value,
+            "error_rate": round(self.error_rate(), 3),
+            "calls": len(self._calls),
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "p99": {endpoint: window.p99() for endpoint, window in self._latency.items()},
+        }
@@ -0,0 +1,359 @@
+"""
+Обработка апдейтов в нескольких процессах (main.py --workers N).
+
+Процесс-супервизор только принимает апдейты (polling или webhook) и
+раздаёт их N процессам-воркерам по хэшу ID пользователя: все апдейты
+одного пользователя попадают в один воркер и обрабатываются там строго
+по очереди — это важно для альбомов (сборка частей в памяти процесса)
+и сценария «заменить заявку». Разные пользователи обрабатываются
+параллельно — и внутри воркера, и между воркерами.
+
+Канал связи — stdin / stdout воркера, одна JSON-строка на сообщение:
+  супервизор → воркер: {"type": "update", "seq", "key", "update"},
+                       {"type": "ping"}, {"type": "stop"}
+  воркер → супервизор: {"type": "ready"}, {"type": "ack", "seq"}, {"type": "pong", "pending"}
+
+Супервизор периодически пингует воркеры. Воркер, который упал или не
+отвечает дольше health_timeout (завис event loop), перезапускается;
+неподтверждённые апдейты доставляются новому процессу повторно — но не
+больше max_redeliveries раз, чтобы апдейт, роняющий воркер, не ронял его
+бесконечно.
+
+Общие для всех процессов данные должны жить вне памяти процесса:
+пользователи — USERS_BACKEND=sqlite, состояния FSM — FSM_STORAGE=sqlite,
+очередь заявок — SQLite (заявку забирает один воркер атомарно).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина одного сообщения канала (байты)
+_LINE_LIMIT = 4 * 1024 * 1024
+
+# Пауза перед перезапуском упавшего воркера (секунды) — не крутить перезапуски вхолостую
+_RESTART_DELAY = 1.0
+
+# Сколько ждать запуска воркера (импорт, открытие хранилищ), прежде чем считать его зависшим
+_STARTUP_TIMEOUT = 60.0
+
+# Сколько ждать завершения воркеров при остановке (секунды)
+_STOP_TIMEOUT = 15.0
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+# ── Супервизор ──────────────────────────────────────────────────────────────
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        # seq -> (ключ, апдейт, сколько раз уже доставлялся)
+        self.unacked: dict[int, tuple[int, dict, int]] = {}
+        self.last_pong = 0.0
+        self.pending = 0
+        self.restarts = 0
+        self.ready = asyncio.Event()
+        self.reader_task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def send(self, message: dict) -> None:
+        # write() без await: порядок отправки совпадает с порядком вызовов
+        self.process.stdin.write(_encode(message))
+
+
+class Supervisor(BaseMiddleware):
+    """
+    Outer-middleware для dp.update в процессе-супервизоре: вместо обработки
+    отправляет апдейт воркеру. Хендлеры в супервизоре не выполняются.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        *,
+        command: Callable[[int], list[str]],
+        env: Callable[[int], Dict[str, str]],
+        health_interval: float,
+        health_timeout: float,
+        max_redeliveries: int = 1,
+    ):
+        self._workers = [_Worker(index) for index in range(workers)]
+        self._command = command
+        self._env = env
+        self._health_interval = health_interval
+        self._health_timeout = health_timeout
+        self._max_redeliveries = max_redeliveries
+        self._seq = 0
+        self._stopping = False
+        self._health_task: Optional[asyncio.Task] = None
+
+    # ── Жизненный цикл ──────────────────────────────────────────────────────
+    async def start(self) -> None:
+        for worker in self._workers:
+            await self._spawn(worker)
+        self._health_task = asyncio.create_task(self._health_loop(), name="supervisor-health")
+        # Апдейты можно отправлять и раньше (ждут в канале), но о запуске сообщаем по факту
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(worker.ready.wait() for worker in self._workers)),
+                timeout=_STARTUP_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Не все воркеры запустились за %.0f с", _STARTUP_TIMEOUT)
+        logger.info("Запущено воркеров: %d", sum(worker.ready.is_set() for worker in self._workers))
+
+    async def close(self) -> None:
+        self._stopping = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        # Воркеры дообрабатывают принятое; подтверждения читаются до их выхода
+        await asyncio.gather(*(self._stop(worker) for worker in self._workers))
+
+    async def _spawn(self, worker: _Worker) -> None:
+        worker.process = await asyncio.create_subprocess_exec(
+            *self._command(worker.index),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env={**os.environ, **self._env(worker.index)},
+            limit=_LINE_LIMIT,
+        )
+        worker.last_pong = time.monotonic()
+        worker.pending = 0
+        worker.ready.clear()
+        worker.reader_task = asyncio.create_task(self._read(worker), name=f"supervisor-worker-{worker.index}")
+
+        # Неподтверждённое прежним процессом — новому
+        redeliver, worker.unacked = worker.unacked, {}
+        for seq, (key, update, attempts) in sorted(redeliver.items()):
+            if attempts > self._max_redeliveries:
+                logger.error(
+                    "Воркер %d: апдейт %s отброшен после %d попыток",
+                    worker.index, update.get("update_id"), attempts,
+                )
+                continue
+            self._deliver(worker, key, update, attempts)
+
+    async def _stop(self, worker: _Worker) -> None:
+        if not worker.alive:
+            return
+        try:
+            worker.send({"type": "stop"})
+            worker.process.stdin.close()
+            await asyncio.wait_for(worker.process.wait(), timeout=_STOP_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            logger.warning("Воркер %d не остановился за %.0f с — завершаем принудительно", worker.index, _STOP_TIMEOUT)
+            worker.process.kill()
+            await worker.process.wait()
+        await asyncio.gather(worker.reader_task, return_exceptions=True)
+        if worker.unacked:
+            logger.warning("Воркер %d: не обработано апдейтов при остановке: %d", worker.index, len(worker.unacked))
+
+    async def _restart(self, worker: _Worker, reason: str) -> None:
+        worker.restarts += 1
+        logger.error(
+            "Воркер %d (pid %s) %s — перезапуск, неподтверждённых апдейтов: %d",
+            worker.index, worker.process.pid, reason, len(worker.unacked),
+        )
+        if worker.alive:
+            worker.process.kill()
+        await worker.process.wait()
+        await asyncio.sleep(_RESTART_DELAY)
+        if not self._stopping:
+            await self._spawn(worker)
+
+    # ── Обмен сообщениями ───────────────────────────────────────────────────
+    def _deliver(self, worker: _Worker, key: int, update: dict, attempts: int = 0) -> None:
+        self._seq += 1
+        worker.unacked[self._seq] = (key, update, attempts + 1)
+        if worker.alive:
+            worker.send({"type": "update", "seq": self._seq, "key": key, "update": update})
+        # Иначе апдейт уйдёт новому процессу при перезапуске
+
+    async def _read(self, worker: _Worker) -> None:
+        process = worker.process
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except ValueError:
+                # Строка длиннее _LINE_LIMIT — asyncio её уже отбросил
+                logger.error("Воркер %d: слишком длинное сообщение в канале", worker.index)
+                continue
+            if not line:
+                break
+            # Одна испорченная строка не должна останавливать чтение: иначе подтверждения
+            # копятся в unacked, а воркер в итоге встаёт на записи в переполненный stdout
+            try:
+                self._receive(worker, json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                logger.error("Воркер %d: некорректное сообщение в канале: %r", worker.index, line[:200])
+        # stdout закрыт — процесс завершается
+        await process.wait()
+        if not self._stopping and worker.process is process:
+            await self._restart(worker, f"завершился с кодом {process.returncode}")
+
+    @staticmethod
+    def _receive(worker: _Worker, message: dict) -> None:
+        if message["type"] == "ack":
+            worker.unacked.pop(message["seq"], None)
+        elif message["type"] == "pong":
+            worker.last_pong = time.monotonic()
+            worker.pending = message["pending"]
+        elif message["type"] == "ready":
+            worker.last_pong = time.monotonic()
+            worker.ready.set()
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._health_interval)
+            now = time.monotonic()
+            for worker in self._workers:
+                if not worker.alive:
+                    continue
+                timeout = self._health_timeout
+                if not worker.ready.is_set():
+                    timeout = max(timeout, _STARTUP_TIMEOUT)
+                if now - worker.last_pong > timeout:
+                    # Процесс жив, но event loop не отвечает — убиваем, _read перезапустит
+                    logger.error("Воркер %d не отвечает %.0f с", worker.index, now - worker.last_pong)
+                    worker.process.kill()
+                    continue
+                try:
+                    worker.send({"type": "ping"})
+                    await worker.process.stdin.drain()
+                except ConnectionError:
+                    pass
+
+    def stats(self) -> list[dict]:
+        """Состояние воркеров: для логов и метрик."""
+        return [
+            {
+                "index": worker.index,
+                "pid": worker.process.pid if worker.process else None,
+                "alive": worker.alive,
+                "pending": worker.pending,
+                "unacked": len(worker.unacked),
+                "restarts": worker.restarts,
+            }
+            for worker in self._workers
+        ]
+
+    # ── Маршрутизация ───────────────────────────────────────────────────────
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        key = user.id if user else chat.id if chat else event.update_id
+        worker = self._workers[abs(key) % len(self._workers)]
+        self._deliver(worker, key, event.model_dump(mode="json", exclude_none=True, by_alias=True))
+        if worker.alive:
+            try:
+                # Медленный воркер притормаживает приём, а не копит апдейты в памяти
+                await worker.process.stdin.drain()
+            except ConnectionError:
+                pass
+        return None
+
+
+# ── Воркер ──────────────────────────────────────────────────────────────────
+class _KeyedRunner:
+    """Задачи с одним ключом выполняются по очереди, с разными — параллельно."""
+
+    def __init__(self):
+        self._tails: dict[int, asyncio.Task] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self._tails)
+
+    def submit(self, key: int, job: Callable[[], Awaitable[None]]) -> None:
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._run(previous, job))
+        self._tails[key] = task
+        task.add_done_callback(lambda _: self._tails.pop(key) if self._tails.get(key) is task else None)
+
+    @staticmethod
+    async def _run(previous: Optional[asyncio.Task], job: Callable[[], Awaitable[None]]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        await job()
+
+    async def join(self, timeout: float) -> None:
+        tasks = list(self._tails.values())
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+
+async def _open_channel() -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """stdin / stdout процесса как асинхронный канал к супервизору."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=_LINE_LIMIT)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+
+    # Канал забирает fd 1 себе, а случайный print() уходит в stderr, не ломая протокол
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, channel)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, writer
+
+
+async def serve_worker(bot: Bot, dp: Dispatcher, index: int) -> None:
+    """Основной цикл процесса-воркера: апдейты от супервизора → dp.feed_raw_update."""
+    reader, writer = await _open_channel()
+    runner = _KeyedRunner()
+    workflow = dict(bot=bot, bots=[bot], dispatcher=dp, **dp.workflow_data)
+
+    async def process(seq: int, update: dict) -> None:
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception:
+            logger.exception("Воркер %d: ошибка обработки апдейта %s", index, update.get("update_id"))
+        writer.write(_encode({"type": "ack", "seq": seq}))
+
+    await dp.emit_startup(**workflow)
+    writer.write(_encode({"type": "ready"}))
+    logger.info("Воркер %d запущен (pid %d)", index, os.getpid())
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                logger.warning("Воркер %d: канал супервизора закрыт", index)
+                break
+            message = json.loads(line)
+            kind = message["type"]
+            if kind == "update":
+                seq, update = message["seq"], message["update"]
+                runner.submit(message["key"], lambda seq=seq, update=update: process(seq, update))
+            elif kind == "ping":
+                writer.write(_encode({"type": "pong", "pending": runner.pending}))
+            elif kind == "stop":
+                break
+        await runner.join(timeout=_STOP_TIMEOUT)
+    finally:
+        await dp.emit_shutdown(**workflow)
+        await bot.session.close()
+        writer.close()
@@ -0,0 +1,174 @@
+"""
+Сборка альбомов (media_group) из отдельных сообщений.
+
+Telegram присылает альбом отдельными апдейтами с общим media_group_id.
+Агрегатор копит части и отдаёт альбом целиком, когда:
+  - с последней части прошло `debounce` секунд (окно сдвигается
+    с каждой новой частью — медленно догружающиеся альбомы не рвутся);
+  - набралось `max_items` частей (максимум альбома в Telegram — 10),
+    тогда без ожидания;
+  - с первой части прошло `max_wait` секунд — верхняя граница задержки.
+
+Часть, пришедшая уже после сброса своего альбома (опоздавшая дольше
+окна), не открывает новый альбом — иначе из одного альбома получились бы
+две заявки. Такие части отбрасываются: ключи сброшенных альбомов
+помнятся `late_window` секунд (по умолчанию — `max_wait`).
+
+Время ожидания и число частей альбома попадают в метрики
+bot_media_group_wait_seconds и bot_media_group_parts.
+
+Часы и sleep подменяются через конструктор, так что логику можно
+проверять с фиктивным временем.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Максимум элементов в альбоме Telegram
+TELEGRAM_MEDIA_GROUP_LIMIT = 10
+
+
+@dataclass
+class AggregatorStats:
+    """Статистика по собранным альбомам."""
+    albums: int = 0
+    parts: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    parts_per_album: Counter = field(default_factory=Counter)
+    flush_reasons: Counter = field(default_factory=Counter)
+    # Части, пришедшие после сброса своего альбома (отброшены)
+    late_parts: int = 0
+
+    def record(self, parts: int, wait: float, reason: str) -> None:
+        self.albums += 1
+        self.parts += parts
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.parts_per_album[parts] += 1
+        self.flush_reasons[reason] += 1
+        metrics.MEDIA_GROUP_WAIT.observe(wait, reason)
+        metrics.MEDIA_GROUP_PARTS.observe(parts)
+
+
+@dataclass
+class _Group(Generic[T]):
+    items: list[T]
+    on_complete: Callable[[list[T]], Awaitable[None]]
+    first_at: float
+    last_at: float
+    waiter: Optional[asyncio.Task] = None
+
+
+class MediaGroupAggregator(Generic[T]):
+    def __init__(
+        self,
+        *,
+        debounce: float,
+        max_wait: float,
+        max_items: int = TELEGRAM_MEDIA_GROUP_LIMIT,
+        late_window: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self._debounce = debounce
+        self._max_wait = max_wait
+        self._max_items = max_items
+        self._late_window = max_wait if late_window is None else late_window
+        self._clock = clock
+        self._sleep = sleep
+        self._groups: dict[str, _Group[T]] = {}
+        # Ключи сброшенных альбомов -> время сброса (по возрастанию)
+        self._flushed: OrderedDict[str, float] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = AggregatorStats()
+
+    @property
+    def pending_groups(self) -> int:
+        return len(self._groups)
+
+    @property
+    def pending_items(self) -> int:
+        return sum(len(group.items) for group in self._groups.values())
+
+    def add(self, key: str, item: T, on_complete: Callable[[list[T]], Awaitable[None]]) -> None:
+        """
+        Добавляет часть альбома. on_complete вызывается один раз на альбом —
+        берётся от первой части. Часть уже сброшенного альбома отбрасывается.
+        """
+        now = self._clock()
+        group = self._groups.get(key)
+        if group is None and self._is_late(key, now):
+            self.stats.late_parts += 1
+            metrics.MEDIA_GROUP_LATE_PARTS.inc()
+            logger.warning("Альбом %s: часть пришла после сброса альбома и отброшена", key)
+            return
+        if group is None:
+            group = _Group(items=[], on_complete=on_complete, first_at=now, last_at=now)
+            self._groups[key] = group
+            group.waiter = self._spawn(self._wait_and_flush(key, group))
+
+        group.items.append(item)
+        group.last_at = now
+
+        if len(group.items) >= self._max_items:
+            group.waiter.cancel()
+            self._spawn(self._flush(key, group, "full"))
+
+    def _is_late(self, key: str, now: float) -> bool:
+        while self._flushed:
+            oldest, flushed_at = next(iter(self._flushed.items()))
+            if now - flushed_at <= self._late_window:
+                break
+            del self._flushed[oldest]
+        return key in self._flushed
+
+    def _spawn(self, coro) -> asyncio.Task:
+        # Держим ссылки на задачи, иначе сборщик мусора может их прибить
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _deadline(self, group: _Group[T]) -> tuple[float, str]:
+        debounce_at = group.last_at + self._debounce
+        cap_at = group.first_at + self._max_wait
+        if cap_at <= debounce_at:
+            return cap_at, "max_wait"
+        return debounce_at, "debounce"
+
+    async def _wait_and_flush(self, key: str, group: _Group[T]) -> None:
+        while True:
+            deadline, reason = self._deadline(group)
+            delay = deadline - self._clock()
+            if delay <= 0:
+                break
+            await self._sleep(delay)
+        await self._flush(key, group, reason)
+
+    async def _flush(self, key: str, group: _Group[T], reason: str) -> None:
+        if self._groups.get(key) is not group:
+            return
+        del self._groups[key]
+        now = self._clock()
+        self._flushed[key] = now
+
+        wait = now - group.first_at
+        self.stats.record(len(group.items), wait, reason)
+        logger.debug(
+            "Альбом %s: %d частей, ожидание %.3f с (%s)", key, len(group.items), wait, reason,
+        )
+        try:
+            await group.on_complete(group.items)
+        except Exception:
+            logger.exception("Ошибка обработки альбома %s", key)
@@ -0,0 +1,248 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+
+Включаются настройкой METRICS_PORT (0 — выключены). Пока метрики
+выключены, observe()/inc() сразу возвращаются, а MetricsMiddleware
+не регистрируется — накладные расходы сводятся к одной проверке флага.
+
+Эндпоинт: GET http://METRICS_HOST:METRICS_PORT/metrics
+"""
+
+import bisect
+import logging
+from typing import Callable, Optional, Sequence
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы бакетов по умолчанию (секунды): от 1 мс до 60 с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        # Повторная регистрация (например, второй диспетчер в бенчмарке) заменяет метрику
+        _registry[name] = self
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        if not _enabled:
+            return
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам (+Inf последним), сумма]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not _enabled:
+            return
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self._buckets) + 1), 0.0]
+        # Счётчики храним по бакетам, кумулятивные суммы считаем при выдаче
+        entry[0][bisect.bisect_left(self._buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self._buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Значение снимается функцией в момент запроса /metrics."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        super().__init__(name, help_text)
+        self._read = read
+
+    def render(self) -> list[str]:
+        try:
+            value = self._read()
+        except Exception:
+            logger.exception("Не удалось получить значение метрики %s", self.name)
+            return []
+        return [*self._header(), f"{self.name} {value}"]
+
+
+_registry: dict[str, _Metric] = {}
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ── Метрики бота ────────────────────────────────────────────────────────────
+UPDATES = Counter("bot_updates_total", "Входящие апдейты по типу", ("type",))
+UPDATE_LATENCY = Histogram(
+    "bot_update_seconds", "Полное время обработки апдейта (middleware + хендлер)", ("type",),
+)
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Время работы хендлера", ("router", "handler"),
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в хендлерах", ("router", "handler"))
+VERIFICATION_LOOKUPS = Counter(
+    "bot_verification_lookups_total",
+    "Проверки статуса в VerificationMiddleware: found — пользователь есть в хранилище, unknown — нет",
+    ("result",),
+)
+PHOTO_DOWNLOAD_BYTES = Counter("bot_photo_download_bytes_total", "Скачано байт фото из Telegram")
+PHOTO_DOWNLOAD_LATENCY = Histogram("bot_photo_download_seconds", "Время скачивания одного фото из Telegram")
+PHOTO_ORIGINAL_BYTES = Counter(
+    "bot_photo_original_bytes_total", "Размер самых больших вариантов отправленных фото",
+)
+PHOTO_UPLOADED_BYTES = Counter("bot_photo_uploaded_bytes_total", "Байт фото, отправленных на бэкенд")
+ORDER_PHOTO_BYTES_SAVED = Histogram(
+    "bot_order_photo_bytes_saved", "Сэкономлено байт фото на заявку (выбор варианта и пережатие)",
+    buckets=(0, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000, 25_000_000),
+)
+PHOTO_CACHE_REQUESTS = Counter(
+    "bot_photo_cache_requests_total", "Запросы к кэшу фото: memory / disk / inflight — попадание, miss — загрузка",
+    ("result",),
+)
+THROTTLED = Counter(
+    "bot_throttled_total",
+    "Апдейты, отклонённые ThrottleMiddleware: message / callback — лимит частоты, "
+    "pending — лимит неотправленных заявок, backlog — переполнена очередь",
+    ("reason",),
+)
+MEDIA_GROUP_WAIT = Histogram(
+    "bot_media_group_wait_seconds",
+    "Сборка альбома: от первой части до сброса, по причине сброса (debounce / full / max_wait)",
+    ("reason",),
+)
+MEDIA_GROUP_PARTS = Histogram(
+    "bot_media_group_parts", "Частей в собранном альбоме", buckets=tuple(range(1, 11)),
+)
+MEDIA_GROUP_LATE_PARTS = Counter(
+    "bot_media_group_late_parts_total", "Части альбома, пришедшие после его сброса (отброшены)",
+)
+ORDER_DUPLICATES = Counter(
+    "bot_order_duplicates_total",
+    "Повторы заявок, не поставленные в очередь: created — уже создана, queued — ещё отправляется",
+    ("state",),
+)
+ORDER_STAGE_LATENCY = Histogram(
+    "bot_order_stage_seconds",
+    "Этапы отправки заявки: download — фото из Telegram, upload — тело запроса, backend — ожидание ответа",
+    ("stage",),
+)
+ORDERS_CACHE_REQUESTS = Counter(
+    "bot_orders_cache_requests_total",
+    "Запросы /orders: hit — свежая запись, stale — устаревшая (обновляется в фоне), "
+    "inflight — ожидание начатой загрузки, miss — загрузка",
+    ("result",),
+)
+TELEGRAM_SENDS = Counter(
+    "bot_telegram_sends_total",
+    "Запросы в чаты Telegram через SendScheduler: sent — отправлен, dropped — не отпустил flood control "
+    "(RetryAfter на всех попытках), error — прочая ошибка (TelegramBadRequest, сеть...)",
+    ("result",),
+)
+TELEGRAM_SEND_DELAY = Histogram(
+    "bot_telegram_send_delay_seconds", "Ожидание лимитов Telegram перед отправкой (только задержанные)",
+)
+TELEGRAM_RETRY_AFTER = Counter("bot_telegram_retry_after_total", "Ответы TelegramRetryAfter (flood control)")
+BACKEND_LATENCY = Histogram("bot_backend_request_seconds", "Время запроса к бэкенду", ("endpoint",))
+BACKEND_RESPONSES = Counter(
+    "bot_backend_responses_total", "Ответы бэкенда по статусу (error — сетевая ошибка)", ("endpoint", "status"),
+)
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics на отдельном порту."""
+
+    def __init__(self, host: str, port: int):
+        self._host = host
+        self._port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        logger.info("Метрики: http://%s:%d/metrics", self._host, self._port)
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
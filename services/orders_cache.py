@@ -0,0 +1,125 @@
+"""
+Кэш списка заявок пользователя для /orders.
+
+Запись свежая ORDERS_CACHE_TTL секунд — отдаётся без запроса к бэкенду.
+Ещё ORDERS_CACHE_STALE секунд после этого запись устаревшая: отдаётся
+сразу, а в фоне запускается обновление (stale-while-revalidate). Запись
+старше — пользователь ждёт загрузку.
+
+Одновременные загрузки списка одного пользователя сливаются в один запрос.
+Когда заявка пользователя меняется (поставлена в очередь, подтверждена
+пользователем), хендлер вызывает invalidate(): запись выбрасывается;
+загрузка, начатая раньше, свой результат уже не сохраняет, и новые
+запросы к ней не присоединяются.
+
+Заявку из очереди создаёт на бэкенде воркер отправки — позже и, с
+--workers N, в любом процессе. Поэтому пока у пользователя есть
+неотправленные заявки (pending), список не кэшируется: каждый /orders
+идёт на бэкенд, а первая загрузка после отправки сохраняется как обычно.
+
+Записи — LRU в пределах ORDERS_CACHE_MAX_USERS пользователей. Кэш живёт
+в памяти процесса: с --workers N у каждого воркера свой, а все апдейты
+пользователя (и invalidate()) приходят в один воркер.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+Orders = list[dict[str, Any]]
+
+
+class OrdersCache:
+    def __init__(
+        self,
+        load: Callable[[int], Awaitable[Orders]],
+        *,
+        ttl: float,
+        stale: float,
+        max_users: int,
+        clock: Callable[[], float] = time.monotonic,
+        pending: Optional[Callable[[int], Awaitable[bool]]] = None,
+    ):
+        self._load = load
+        self._pending = pending
+        self._ttl = ttl
+        self._stale = stale
+        self._max_users = max_users
+        self._clock = clock
+        # user_id -> (момент загрузки, заявки)
+        self._entries: OrderedDict[int, tuple[float, Orders]] = OrderedDict()
+        self._inflight: dict[int, asyncio.Task] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    async def get(self, user_id: int) -> Orders:
+        """Заявки пользователя — из кэша или с бэкенда (одна загрузка на пользователя)."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            loaded_at, orders = entry
+            age = self._clock() - loaded_at
+            if age < self._ttl:
+                metrics.ORDERS_CACHE_REQUESTS.inc("hit")
+                self._entries.move_to_end(user_id)
+                return orders
+            if age < self._ttl + self._stale:
+                metrics.ORDERS_CACHE_REQUESTS.inc("stale")
+                self._entries.move_to_end(user_id)
+                self._refresh(user_id)
+                return orders
+
+        metrics.ORDERS_CACHE_REQUESTS.inc("inflight" if user_id in self._inflight else "miss")
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(self._refresh(user_id))
+
+    def invalidate(self, user_id: int) -> None:
+        """Заявки пользователя изменились — следующий get() пойдёт на бэкенд."""
+        self._entries.pop(user_id, None)
+        self._inflight.pop(user_id, None)
+
+    async def close(self) -> None:
+        tasks = list(self._inflight.values())
+        self._inflight.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _refresh(self, user_id: int) -> asyncio.Task:
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(user_id))
+            task.add_done_callback(lambda done: self._log_failure(user_id, done))
+            self._inflight[user_id] = task
+        return task
+
+    async def _fetch(self, user_id: int) -> Orders:
+        task = asyncio.current_task()
+        try:
+            # Заявка ещё в очереди: её создание кэш не увидит — список не сохраняем
+            cacheable = self._pending is None or not await self._pending(user_id)
+            orders = await self._load(user_id)
+        finally:
+            current = self._inflight.get(user_id) is task
+            if current:
+                del self._inflight[user_id]
+        # Запись инвалидирована во время загрузки — результат мог устареть, не сохраняем
+        if current and cacheable and self._ttl > 0:
+            self._entries[user_id] = (self._clock(), orders)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._max_users:
+                self._entries.popitem(last=False)
+        return orders
+
+    @staticmethod
+    def _log_failure(user_id: int, task: asyncio.Task) -> None:
+        # Забираем исключение и у фоновых обновлений, которые никто не ждёт
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Не удалось загрузить заявки пользователя %s: %s", user_id, task.exception())
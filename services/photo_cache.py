@@ -0,0 +1,231 @@
+"""
+Кэш скачанных из Telegram фото (PHOTO_CACHE_BYTES > 0).
+
+Пользователь, исправляющий заявку («Изменить» → новая заявка), обычно
+присылает те же фото. Ключ кэша — file_unique_id: он одинаков для одного
+и того же файла в любых сообщениях, так что повторная заявка не делает
+ни get_file, ни скачивания.
+
+Уровни:
+  - память — LRU в пределах PHOTO_CACHE_BYTES;
+  - диск (PHOTO_CACHE_DIR, необязательно) — LRU в пределах
+    PHOTO_CACHE_DISK_BYTES, запись сквозная; переживает перезапуск,
+    при попадании файл поднимается обратно в память.
+Записи старше PHOTO_CACHE_TTL считаются промахом и удаляются.
+
+Одновременные запросы одного файла (пока он скачивается) ждут одну
+загрузку. Файлы больше четверти бюджета памяти не кэшируются.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import aiofiles
+import aiofiles.os
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Tier:
+    """LRU с бюджетом в байтах: key -> (размер, время записи)."""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.used = 0
+        self.entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+
+    def touch(self, key: str) -> None:
+        self.entries.move_to_end(key)
+
+    def add(self, key: str, size: int, created_at: float) -> list[str]:
+        """Добавляет запись, возвращает вытесненные ключи."""
+        self.remove(key)
+        self.entries[key] = (size, created_at)
+        self.used += size
+        evicted = []
+        while self.used > self.budget and len(self.entries) > 1:
+            old_key, (old_size, _) = self.entries.popitem(last=False)
+            self.used -= old_size
+            evicted.append(old_key)
+        return evicted
+
+    def remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.used -= entry[0]
+
+
+class PhotoCache:
+    def __init__(self, *, memory_bytes: int, disk_dir: str = "", disk_bytes: int = 0, ttl: float):
+        self._memory = _Tier(memory_bytes)
+        self._data: dict[str, bytes] = {}
+        self._disk = _Tier(disk_bytes) if disk_dir and disk_bytes else None
+        self._disk_dir = disk_dir
+        self._disk_loaded = False
+        self._ttl = ttl
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.max_item_bytes = memory_bytes // 4
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._memory.budget > 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_bytes": self._memory.used,
+            "disk_bytes": self._disk.used if self._disk else 0,
+            "inflight": len(self._inflight),
+        }
+
+    # ── Чтение ──────────────────────────────────────────────────────────────
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Содержимое файла из кэша или через load() (одна загрузка на ключ)."""
+        data, tier = await self._get(key)
+        if data is not None:
+            self.hits += 1
+            metrics.PHOTO_CACHE_REQUESTS.inc(tier)
+            return data
+
+        # Проверяем после _get: пока читали диск, загрузку мог начать другой запрос
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            metrics.PHOTO_CACHE_REQUESTS.inc("inflight")
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        metrics.PHOTO_CACHE_REQUESTS.inc("miss")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await load()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Ошибку ждущим передали — «никто не забрал исключение» не логируем
+            future.exception()
+            raise
+        else:
+            future.set_result(data)
+            await self._put(key, data)
+            return data
+        finally:
+            del self._inflight[key]
+
+    async def _get(self, key: str) -> tuple[Optional[bytes], str]:
+        now = time.time()
+        entry = self._memory.entries.get(key)
+        if entry is not None:
+            if now - entry[1] <= self._ttl:
+                self._memory.touch(key)
+                return self._data[key], "memory"
+            self._drop_memory(key)
+
+        if self._disk is None:
+            return None, ""
+        await self._load_disk_index()
+        entry = self._disk.entries.get(key)
+        if entry is None:
+            return None, ""
+        if now - entry[1] > self._ttl:
+            await self._drop_disk(key)
+            return None, ""
+        try:
+            async with aiofiles.open(self._path(key), "rb") as f:
+                data = await f.read()
+        except OSError:
+            # Файл удалили снаружи — просто промах
+            self._disk.remove(key)
+            return None, ""
+        self._disk.touch(key)
+        self._add_memory(key, data, entry[1])
+        return data, "disk"
+
+    # ── Запись ──────────────────────────────────────────────────────────────
+    async def _put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_item_bytes:
+            return
+        now = time.time()
+        self._add_memory(key, data, now)
+        if self._disk is None:
+            return
+        await self._load_disk_index()
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                await f.write(data)
+            await aiofiles.os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning("Не удалось сохранить фото %s в кэш на диске: %s", key, exc)
+            return
+        for evicted in self._disk.add(key, len(data), now):
+            await self._remove_file(evicted)
+
+    def _add_memory(self, key: str, data: bytes, created_at: float) -> None:
+        self._data[key] = data
+        for evicted in self._memory.add(key, len(data), created_at):
+            del self._data[evicted]
+
+    def _drop_memory(self, key: str) -> None:
+        self._memory.remove(key)
+        self._data.pop(key, None)
+
+    async def _drop_disk(self, key: str) -> None:
+        self._disk.remove(key)
+        await self._remove_file(key)
+
+    # ── Диск ────────────────────────────────────────────────────────────────
+    def _path(self, key: str) -> str:
+        # file_unique_id — base64url, безопасен как имя файла
+        return os.path.join(self._disk_dir, key)
+
+    async def _remove_file(self, key: str) -> None:
+        try:
+            await aiofiles.os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def _load_disk_index(self) -> None:
+        """Восстанавливает индекс диска с прошлого запуска (один раз)."""
+        if self._disk_loaded:
+            return
+        self._disk_loaded = True
+        await aiofiles.os.makedirs(self._disk_dir, exist_ok=True)
+        entries = []
+        for name in await aiofiles.os.listdir(self._disk_dir):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = await aiofiles.os.stat(self._path(name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        # Старые первыми — LRU-порядок по времени записи
+        for mtime, name, size in sorted(entries):
+            for evicted in self._disk.add(name, size, mtime):
+                await self._remove_file(evicted)
+        if entries:
+            logger.info("Кэш фото на диске: %d файлов, %d байт", len(self._disk.entries), self._disk.used)
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        if stats["hits"] or stats["misses"]:
+            logger.info(
+                "Кэш фото: попаданий %d из %d (%.0f%%)",
+                stats["hits"], stats["hits"] + stats["misses"], stats["hit_rate"] * 100,
+            )
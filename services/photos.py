@@ -0,0 +1,333 @@
+"""
+Передача фото заявки из Telegram на бэкенд.
+
+Режимы (PHOTO_UPLOAD_MODE):
+  - stream — фото перекачивается из Telegram прямо в тело multipart-запроса
+             кусками по PHOTO_CHUNK_SIZE, в памяти держится не больше куска;
+  - spool  — фото сначала скачивается во временный файл на диске; у запроса
+             появляется Content-Length (для бэкендов без chunked-загрузки).
+
+Одновременные загрузки из Telegram ограничены общим на процесс семафором
+(PHOTO_DOWNLOAD_CONCURRENCY): один большой альбом не должен забирать
+всю полосу у остальных пользователей. В режиме stream слот занят только
+на чтение очередного куска из Telegram: пока кусок уходит на бэкенд,
+слот свободен, и медленный бэкенд не тормозит скачивание чужих заявок.
+Первый кусок stream-фото читается ещё при подготовке заявки — фото,
+которое Telegram не отдаёт, пропускается, как и в остальных режимах,
+а не обрывает всю отправку формы.
+
+Какой вариант фото брать, решает photo_ref(): Telegram хранит фото в
+нескольких размерах, и берётся наименьший, у которого длинная сторона
+не меньше PHOTO_TARGET_SIDE. Если задан бюджет PHOTO_MAX_BYTES, фото
+больше бюджета либо пережимаются (PHOTO_RECOMPRESS, services/recompress.py),
+либо заменяются наибольшим вариантом, укладывающимся в бюджет.
+Картинки, отправленные файлом (document с mime image/*), тоже принимаются;
+у них один вариант, так что бюджет соблюдается только пережатием.
+
+Если включён кэш фото (services/photo_cache.py), фото скачиваются целиком
+и кэшируются по file_unique_id: повторная заявка с теми же фото не
+обращается к Telegram. Такое фото держится в памяти целиком, мимо
+режимов stream/spool, поэтому кэш по умолчанию выключен. Файлы больше
+предела кэша и фото неизвестного размера идут обычным путём.
+"""
+
+import asyncio
+import logging
+import mimetypes
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Optional
+
+import aiofiles
+import aiohttp
+from aiogram import Bot
+from aiogram.types import File, Message, PhotoSize
+
+from config import (
+    PHOTO_CHUNK_SIZE, PHOTO_DOWNLOAD_CONCURRENCY, PHOTO_UPLOAD_MODE,
+    PHOTO_TARGET_SIDE, PHOTO_MAX_BYTES,
+    PHOTO_CACHE_BYTES, PHOTO_CACHE_DIR, PHOTO_CACHE_DISK_BYTES, PHOTO_CACHE_TTL,
+)
+from services import metrics, recompress, tracing
+from services.photo_cache import PhotoCache
+
+logger = logging.getLogger(__name__)
+
+PHOTO_CONTENT_TYPE = "image/jpeg"
+
+_download_semaphore = asyncio.Semaphore(PHOTO_DOWNLOAD_CONCURRENCY)
+
+cache = PhotoCache(
+    memory_bytes=PHOTO_CACHE_BYTES,
+    disk_dir=PHOTO_CACHE_DIR,
+    disk_bytes=PHOTO_CACHE_DISK_BYTES,
+    ttl=PHOTO_CACHE_TTL,
+)
+
+
+@dataclass
+class PhotoRef:
+    """Выбранный вариант фото из сообщения; в таком виде лежит в очереди заявок."""
+    file_id: str
+    file_size: Optional[int] = None      # размер выбранного варианта
+    original_size: Optional[int] = None  # размер самого большого варианта
+    content_type: str = PHOTO_CONTENT_TYPE
+    file_unique_id: Optional[str] = None  # ключ кэша: одинаков для одного файла в разных сообщениях
+
+    def to_payload(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_payload(cls, data: dict[str, Any]) -> "PhotoRef":
+        return cls(**data)
+
+
+def _over_budget(size: Optional[int]) -> bool:
+    return bool(PHOTO_MAX_BYTES) and (size is None or size > PHOTO_MAX_BYTES)
+
+
+def select_photo_size(sizes: list[PhotoSize]) -> PhotoSize:
+    """Наименьший вариант не меньше PHOTO_TARGET_SIDE (0 — всегда наибольший)."""
+    by_area = sorted(sizes, key=lambda size: size.width * size.height)
+    largest = by_area[-1]
+    chosen = largest
+    if PHOTO_TARGET_SIDE:
+        chosen = next((size for size in by_area if max(size.width, size.height) >= PHOTO_TARGET_SIDE), largest)
+
+    # Пережимать нечем — укладываемся в бюджет выбором варианта поменьше
+    if _over_budget(chosen.file_size) and not recompress.is_enabled():
+        within = [size for size in by_area if size.file_size and size.file_size <= PHOTO_MAX_BYTES]
+        if within:
+            chosen = within[-1]
+    return chosen
+
+
+def photo_ref(message: Message) -> Optional[PhotoRef]:
+    """Фото из сообщения (photo или картинка-документ); None — если фото нет."""
+    if message.photo:
+        chosen = select_photo_size(message.photo)
+        largest = max(message.photo, key=lambda size: size.width * size.height)
+        return PhotoRef(chosen.file_id, chosen.file_size, largest.file_size, file_unique_id=chosen.file_unique_id)
+    document = message.document
+    if document and (document.mime_type or "").startswith("image/"):
+        return PhotoRef(
+            document.file_id, document.file_size, document.file_size, document.mime_type,
+            file_unique_id=document.file_unique_id,
+        )
+    return None
+
+
+@dataclass
+class PhotoPart:
+    """Фото, готовое к добавлению в multipart-форму."""
+    filename: str
+    body: Any  # aiohttp.Payload (stream), временный файл (spool) или bytes (пережатое)
+    stream: Optional[AsyncGenerator] = None
+    content_type: str = PHOTO_CONTENT_TYPE
+    size: Optional[int] = None           # сколько байт уйдёт на бэкенд (если известно)
+    original_size: Optional[int] = None  # размер самого большого варианта в Telegram
+
+    async def close(self) -> None:
+        """Освобождает ресурсы, даже если форма так и не была отправлена."""
+        if self.stream is not None:
+            await self.stream.aclose()
+        elif hasattr(self.body, "close"):
+            self.body.close()
+
+
+async def iter_file_content(bot: Bot, file_path: str) -> AsyncIterator[bytes]:
+    """Читает файл Telegram кусками, не собирая его целиком в памяти."""
+    async with _download_semaphore:
+        started = time.perf_counter()
+        with tracing.span("telegram_download"):
+            async for chunk in _read_file(bot, file_path):
+                metrics.PHOTO_DOWNLOAD_BYTES.inc(amount=len(chunk))
+                yield chunk
+        metrics.PHOTO_DOWNLOAD_LATENCY.observe(time.perf_counter() - started)
+
+
+async def _stream_file_content(bot: Bot, file_path: str) -> AsyncIterator[bytes]:
+    """Как iter_file_content, но слот семафора занят только на чтение куска."""
+    started = time.perf_counter()
+    reader = _read_file(bot, file_path)
+    try:
+        with tracing.span("telegram_download"):
+            while True:
+                async with _download_semaphore:
+                    chunk = await anext(reader, None)
+                if chunk is None:
+                    break
+                metrics.PHOTO_DOWNLOAD_BYTES.inc(amount=len(chunk))
+                yield chunk
+    finally:
+        await reader.aclose()
+    metrics.PHOTO_DOWNLOAD_LATENCY.observe(time.perf_counter() - started)
+
+
+async def _open_stream(bot: Bot, file_path: str) -> tuple[AsyncGenerator, AsyncIterator[bytes]]:
+    """
+    Начинает скачивание: читает первый кусок, чтобы ошибка Telegram
+    (файл недоступен, 4xx/5xx) случилась до отправки формы.
+    Возвращает (исходный генератор — для закрытия, поток для формы).
+    """
+    stream = _stream_file_content(bot, file_path)
+    try:
+        first = await anext(stream, b"")
+    except BaseException:
+        await stream.aclose()
+        raise
+
+    async def _content() -> AsyncIterator[bytes]:
+        if first:
+            yield first
+        async for chunk in stream:
+            yield chunk
+
+    return stream, _content()
+
+
+async def _read_file(bot: Bot, file_path: str) -> AsyncIterator[bytes]:
+    if bot.session.api.is_local:
+        local_path = bot.session.api.wrap_local_file.to_local(file_path)
+        async with aiofiles.open(local_path, "rb") as f:
+            while chunk := await f.read(PHOTO_CHUNK_SIZE):
+                yield chunk
+        return
+
+    url = bot.session.api.file_url(bot.token, file_path)
+    async for chunk in bot.session.stream_content(
+        url=url,
+        chunk_size=PHOTO_CHUNK_SIZE,
+        raise_for_status=True,
+    ):
+        yield chunk
+
+
+async def _spool_photo(bot: Bot, file_path: str):
+    spool = tempfile.TemporaryFile()
+    try:
+        async for chunk in iter_file_content(bot, file_path):
+            spool.write(chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _filename(file_id: str, content_type: str) -> str:
+    return f"{file_id}{mimetypes.guess_extension(content_type) or '.jpg'}"
+
+
+async def _download_path(bot: Bot, file_path: str) -> bytes:
+    return b"".join([chunk async for chunk in iter_file_content(bot, file_path)])
+
+
+async def _get_file(bot: Bot, file_id: str) -> File:
+    with tracing.span("get_file"):
+        return await bot.get_file(file_id)
+
+
+async def _download(bot: Bot, file_id: str) -> bytes:
+    tg_file = await _get_file(bot, file_id)
+    return await _download_path(bot, tg_file.file_path)
+
+
+async def _photo_from_bytes(ref: PhotoRef, data: bytes) -> PhotoPart:
+    if recompress.is_enabled() and _over_budget(len(data)):
+        return await _recompressed_photo(ref, data)
+    return PhotoPart(
+        _filename(ref.file_id, ref.content_type), data,
+        content_type=ref.content_type, size=len(data), original_size=ref.original_size,
+    )
+
+
+async def _recompressed_photo(ref: PhotoRef, data: bytes) -> PhotoPart:
+    try:
+        smaller = await recompress.recompress(data)
+    except Exception as exc:
+        logger.warning("Не удалось пережать фото %s: %s", ref.file_id, exc)
+        smaller = None
+    if smaller is None:
+        return PhotoPart(
+            _filename(ref.file_id, ref.content_type), data,
+            content_type=ref.content_type, size=len(data), original_size=ref.original_size,
+        )
+    return PhotoPart(
+        _filename(ref.file_id, PHOTO_CONTENT_TYPE), smaller,
+        content_type=PHOTO_CONTENT_TYPE, size=len(smaller), original_size=ref.original_size,
+    )
+
+
+def _cacheable(ref: PhotoRef) -> bool:
+    # Размер неизвестен — не кэшируем: файл мог бы оказаться сколь угодно большим
+    return (
+        cache.enabled and bool(ref.file_unique_id)
+        and ref.file_size is not None and ref.file_size <= cache.max_item_bytes
+    )
+
+
+async def _prepare_photo(bot: Bot, ref: PhotoRef) -> PhotoPart:
+    if _cacheable(ref):
+        data = await cache.get_or_load(ref.file_unique_id, lambda: _download(bot, ref.file_id))
+        return await _photo_from_bytes(ref, data)
+
+    tg_file = await _get_file(bot, ref.file_id)
+    size = tg_file.file_size or ref.file_size
+    if recompress.is_enabled() and _over_budget(size):
+        return await _photo_from_bytes(ref, await _download_path(bot, tg_file.file_path))
+
+    filename = _filename(ref.file_id, ref.content_type)
+    if PHOTO_UPLOAD_MODE == "spool":
+        return PhotoPart(
+            filename, await _spool_photo(bot, tg_file.file_path),
+            content_type=ref.content_type, size=size, original_size=ref.original_size,
+        )
+    stream, content = await _open_stream(bot, tg_file.file_path)
+    return PhotoPart(
+        filename,
+        aiohttp.AsyncIterablePayload(content, content_type=ref.content_type),
+        stream=stream,
+        content_type=ref.content_type,
+        size=size,
+        original_size=ref.original_size,
+    )
+
+
+async def prepare_photos(
+    bot: Bot,
+    refs: list[PhotoRef],
+    on_photo: Optional[Callable[[int, int], None]] = None,
+) -> tuple[list[PhotoPart], int]:
+    """
+    Готовит фото к отправке, сохраняя порядок альбома.
+    Возвращает готовые части и число фото, которые получить не удалось.
+    on_photo(готово, всего) вызывается по мере готовности (и неудачи) каждого фото.
+
+    В режиме stream здесь запрашиваются пути файлов (get_file) и первые
+    куски, остальное содержимое скачивается во время отправки формы;
+    фото, которые идут через кэш, к этому моменту уже в памяти.
+    """
+    done = 0
+
+    async def _prepare(ref: PhotoRef) -> PhotoPart:
+        nonlocal done
+        try:
+            return await _prepare_photo(bot, ref)
+        finally:
+            done += 1
+            if on_photo is not None:
+                on_photo(done, len(refs))
+
+    results = await asyncio.gather(*map(_prepare, refs), return_exceptions=True)
+
+    parts: list[PhotoPart] = []
+    failed = 0
+    for ref, result in zip(refs, results):
+        if isinstance(result, BaseException):
+            logger.warning("Не удалось получить фото %s: %s", ref.file_id, result)
+            failed += 1
+        else:
+            parts.append(result)
+    return parts, failed
@@ -0,0 +1,117 @@
+"""
+Выборочный профилировщик event loop (команда администратора /profile).
+
+Отдельный поток раз в _INTERVAL секунд снимает стек потока event loop
+(sys._current_frames) и считает функции: «своё» время — функция на вершине
+стека, «общее» — функция где-либо в стеке. Event loop при этом работает
+как обычно: цена выборки — короткий захват GIL на обход стека.
+
+Выборки, где loop ждёт событий в selector, считаются простоем.
+Одновременно идёт не больше одного профиля, длительность ограничивает
+вызывающий (PROFILE_MAX_SECONDS).
+"""
+
+import asyncio
+import os
+import selectors
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import CodeType, FrameType
+from typing import Optional
+
+# Интервал между выборками (секунды)
+_INTERVAL = 0.005
+
+_running = False
+
+
+class ProfilerBusy(RuntimeError):
+    """Профиль уже снимается."""
+
+
+@dataclass
+class ProfileResult:
+    seconds: float
+    samples: int = 0
+    idle: int = 0
+    own: Counter = field(default_factory=Counter)
+    total: Counter = field(default_factory=Counter)
+
+    def top(self, limit: int) -> list[tuple[str, int, int]]:
+        """Самые горячие функции: (функция, выборок на вершине, выборок в стеке)."""
+        return [(name, count, self.total[name]) for name, count in self.own.most_common(limit)]
+
+
+def _label(code: CodeType) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno} {code.co_qualname}"
+
+
+def _is_idle(frame: FrameType) -> bool:
+    # Блокирующий epoll/select — C-функция, на вершине остаётся BaseSelector.select
+    return frame.f_code.co_name == "select" and frame.f_code.co_filename == selectors.__file__
+
+
+def _sample(thread_id: int, seconds: float) -> ProfileResult:
+    result = ProfileResult(seconds)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(_INTERVAL)
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        result.samples += 1
+        if _is_idle(frame):
+            result.idle += 1
+            continue
+        result.own[_label(frame.f_code)] += 1
+        # Рекурсия не должна считаться несколько раз в одной выборке
+        seen = set()
+        while frame is not None:
+            label = _label(frame.f_code)
+            if label not in seen:
+                seen.add(label)
+                result.total[label] += 1
+            frame = frame.f_back
+    return result
+
+
+async def profile(seconds: float) -> ProfileResult:
+    """Снимает профиль event loop, в котором вызван, за seconds секунд."""
+    global _running
+    if _running:
+        raise ProfilerBusy("профиль уже снимается")
+    _running = True
+    loop = asyncio.get_running_loop()
+    done: asyncio.Future = loop.create_future()
+    thread_id = threading.get_ident()
+
+    def _resolve(result: ProfileResult, exc: Optional[BaseException]) -> None:
+        # Ожидающий мог быть отменён (например, при остановке бота)
+        if done.done():
+            return
+        if exc is not None:
+            done.set_exception(exc)
+        else:
+            done.set_result(result)
+
+    def _run() -> None:
+        global _running
+        result, error = None, None
+        try:
+            result = _sample(thread_id, seconds)
+        except BaseException as exc:
+            error = exc
+        finally:
+            # Флаг снимает сам поток: пока он работает, второй профиль не начнётся
+            _running = False
+        try:
+            loop.call_soon_threadsafe(_resolve, result, error)
+        except RuntimeError:
+            pass  # event loop уже закрыт — бот остановлен
+
+    # Свой поток, а не to_thread: не занимаем общий пул на всё время профиля
+    threading.Thread(target=_run, name="loop-profiler", daemon=True).start()
+    return await done
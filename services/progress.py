@@ -0,0 +1,119 @@
+"""
+Ход отправки заявки в статусном сообщении пользователя.
+
+Воркер отправки (services/uploader.py) сообщает этапы: скачивание фото
+k/N, загрузка на бэкенд X%, ожидание ответа. StatusProgress сливает
+частые обновления: правка уходит не чаще раза в min_interval секунд
+(первая — не раньше min_interval после создания статусного сообщения,
+так что быстрые заявки обходятся без лишних правок), показывается только
+последний текст, одинаковый текст повторно не отправляется.
+
+StageTimer считает длительность этапов — для метрик и лога,
+а если передана трасса заявки (services/tracing.py), дописывает в неё этапы.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+from aiogram import Bot
+
+from services.tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_TEXT = "📥 <i>Скачиваю фото: {done} из {total}...</i>"
+UPLOAD_TEXT = "📤 <i>Отправляю заявку: {percent}%...</i>"
+WAITING_TEXT = "⏳ <i>Заявка отправлена, жду ответ сервера...</i>"
+
+
+class StatusProgress:
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        *,
+        min_interval: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._bot = bot
+        self._chat_id = chat_id
+        self._message_id = message_id
+        self._min_interval = min_interval
+        self._clock = clock
+        self._shown: Optional[str] = None
+        self._pending: Optional[str] = None
+        self._last_edit = clock()
+        self._task: Optional[asyncio.Task] = None
+        self._editing = False
+        self.edits = 0
+
+    def set(self, text: str) -> None:
+        """Показать text (не сразу, если правка была недавно)."""
+        if not self._min_interval or text == (self._pending or self._shown):
+            return
+        self._pending = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while self._pending is not None:
+                delay = self._last_edit + self._min_interval - self._clock()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                text, self._pending = self._pending, None
+                if text is None or text == self._shown:
+                    continue
+                self._editing = True
+                try:
+                    await self._bot.edit_message_text(text, chat_id=self._chat_id, message_id=self._message_id)
+                    self.edits += 1
+                except Exception as exc:
+                    # Ход отправки — не главное: итоговый статус всё равно придёт
+                    logger.debug("Не удалось показать ход заявки: %s", exc)
+                finally:
+                    self._editing = False
+                self._shown = text
+                self._last_edit = self._clock()
+        finally:
+            self._task = None
+
+    async def close(self) -> None:
+        """Отменяет неотправленные правки (перед итоговым статусом)."""
+        self._pending = None
+        task = self._task
+        if task is None:
+            return
+        # Начатую правку дожидаемся: иначе она может прийти в Telegram после итоговой
+        if not self._editing:
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+class StageTimer:
+    def __init__(self, clock: Callable[[], float] = time.perf_counter, trace: Optional[Trace] = None):
+        self._clock = clock
+        self._trace = trace
+        self.stages: dict[str, float] = {}
+        self._stage: Optional[str] = None
+        self._started = 0.0
+
+    def start(self, stage: str) -> None:
+        """Завершает текущий этап и начинает stage."""
+        if stage == self._stage:
+            return
+        self.stop()
+        self._stage = stage
+        self._started = self._clock()
+
+    def stop(self) -> None:
+        if self._stage is not None:
+            elapsed = self._clock() - self._started
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + elapsed
+            if self._trace is not None:
+                end = time.time()
+                self._trace.add(self._stage, end - elapsed, end)
+            self._stage = None
@@ -0,0 +1,71 @@
+"""
+Пережатие фото перед отправкой на бэкенд (PHOTO_RECOMPRESS=1).
+
+Фото больше бюджета (PHOTO_MAX_BYTES) уменьшается до PHOTO_RECOMPRESS_SIDE
+по длинной стороне и пересохраняется в JPEG. Работа с пикселями идёт
+в ProcessPoolExecutor, чтобы не занимать event loop и не упираться в GIL.
+Процессы пула запускаются через spawn, а не fork: к моменту первого
+пережатия в процессе бота уже работают потоки (логирование, aiosqlite,
+to_thread), и fork скопировал бы их блокировки в захваченном состоянии.
+
+Pillow — необязательная зависимость: без неё пережатие отключается
+с предупреждением в логе, фото уходят как есть.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from config import PHOTO_RECOMPRESS, PHOTO_RECOMPRESS_QUALITY, PHOTO_RECOMPRESS_SIDE, PHOTO_RECOMPRESS_WORKERS
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - зависит от окружения
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def is_enabled() -> bool:
+    return PHOTO_RECOMPRESS and Image is not None
+
+
+if PHOTO_RECOMPRESS and Image is None:
+    logger.warning("PHOTO_RECOMPRESS включён, но Pillow не установлен — фото отправляются без пережатия")
+
+
+def _recompress(data: bytes, max_side: int, quality: int) -> bytes:
+    """Выполняется в дочернем процессе."""
+    with Image.open(io.BytesIO(data)) as image:
+        # Учитываем EXIF-поворот, иначе после пересохранения фото «ляжет на бок»
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+async def recompress(data: bytes) -> Optional[bytes]:
+    """Уменьшает и пережимает фото в JPEG. None — если меньше не получилось."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PHOTO_RECOMPRESS_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+        )
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(_pool, _recompress, data, PHOTO_RECOMPRESS_SIDE, PHOTO_RECOMPRESS_QUALITY)
+    return result if len(result) < len(data) else None
+
+
+def close() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,249 @@
+"""
+Планировщик исходящих запросов к Telegram.
+
+Подключается как request-middleware сессии бота (main.create_bot), поэтому
+через него проходят все вызовы API, адресованные чату (send_message,
+edit_message_text, answer и т.д.), без правок в хендлерах:
+
+  - глобальный token bucket (~30 сообщений/с на бота) и bucket на каждый
+    чат (~1/с в личке, ~20/мин в группе) — как в лимитах Telegram;
+  - приоритеты: ответы пользователю идут раньше рассылок администраторам,
+    если глобальный лимит исчерпан;
+  - TelegramRetryAfter: ждём указанное время и повторяем запрос;
+  - счётчики задержанных и потерянных отправок (SendScheduler.stats),
+    они же — метрики bot_telegram_*.
+
+Для рассылок нескольким получателям есть broadcast(): отправляет всем
+параллельно (с приоритетом BROADCAST) и возвращает ошибки по получателям.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    USER = 0        # ответы пользователю
+    BROADCAST = 1   # рассылки (уведомления администраторам и т.п.)
+
+
+_current_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "send_priority", default=Priority.USER,
+)
+
+# Бакеты чатов, которые не использовались столько секунд, удаляются
+_IDLE_BUCKET_TTL = 300.0
+
+
+class TokenBucket:
+    """
+    Token bucket с резервированием: reserve() сразу списывает токен
+    (баланс может уйти в минус) и возвращает, сколько ждать до своей очереди.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        return now
+
+    def reserve(self) -> float:
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+
+    def wait_time(self) -> float:
+        """Сколько ждать до появления целого токена."""
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+
+    def take(self) -> None:
+        self._tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """Не выдавать токены ближайшие `seconds` секунд (после RetryAfter)."""
+        self._refill()
+        # После block() + reserve() ожидание как раз `seconds`
+        self._tokens = min(self._tokens, 1.0) - seconds * self._rate
+
+    @property
+    def idle_since(self) -> float:
+        return self._updated
+
+
+class _PriorityGate:
+    """Глобальный лимит: свободные токены раздаются ожидающим по приоритету."""
+
+    def __init__(self, bucket: TokenBucket):
+        self._bucket = bucket
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: Priority) -> None:
+        if not self._waiters and self._bucket.wait_time() == 0:
+            self._bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        while self._waiters:
+            delay = self._bucket.wait_time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._bucket.take()
+                future.set_result(None)
+
+
+@dataclass
+class SendStats:
+    sent: int = 0
+    delayed: int = 0        # ждали лимита перед отправкой
+    delay_total: float = 0.0
+    retry_after: int = 0    # получили TelegramRetryAfter
+    dropped: int = 0        # так и не отправлены: flood control не отпустил за все попытки
+    errors: int = 0         # прочие ошибки (TelegramBadRequest, сеть...) — без повторов
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(
+        self,
+        *,
+        global_rate: float,
+        chat_rate: float,
+        group_rate: float,
+        chat_burst: int,
+        max_retries: int,
+    ):
+        self._global = _PriorityGate(TokenBucket(global_rate, global_rate))
+        self._chat_rate = chat_rate
+        self._group_rate = group_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        self._chats: dict[Any, TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+        self.stats = SendStats()
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            self._sweep()
+            # Личные чаты — положительные ID, группы и каналы — отрицательные / @username
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = self._chat_rate if is_private else self._group_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self._chat_burst)
+        return bucket
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep < _IDLE_BUCKET_TTL:
+            return
+        self._last_sweep = now
+        idle = [chat_id for chat_id, b in self._chats.items() if now - b.idle_since > _IDLE_BUCKET_TTL]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getFile, getUpdates, answerCallbackQuery... — лимиты сообщений их не касаются
+            return await make_request(bot, method)
+
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self._max_retries + 1):
+            started = time.monotonic()
+            delay = bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            await self._global.acquire(_current_priority.get())
+            waited = time.monotonic() - started
+            if waited > 0.001:
+                self.stats.delayed += 1
+                self.stats.delay_total += waited
+                metrics.TELEGRAM_SEND_DELAY.observe(waited)
+
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                self.stats.retry_after += 1
+                metrics.TELEGRAM_RETRY_AFTER.inc()
+                if attempt == self._max_retries:
+                    self.stats.dropped += 1
+                    metrics.TELEGRAM_SENDS.inc("dropped")
+                    raise
+                logger.warning(
+                    "Flood control для чата %s: ждём %s с (%s)",
+                    chat_id, exc.retry_after, type(method).__name__,
+                )
+                bucket.block(exc.retry_after)
+                continue
+            except Exception:
+                self.stats.errors += 1
+                metrics.TELEGRAM_SENDS.inc("error")
+                raise
+
+            self.stats.sent += 1
+            metrics.TELEGRAM_SENDS.inc("sent")
+            return response
+        raise AssertionError("unreachable")
+
+
+async def broadcast(
+    chat_ids: Iterable[int],
+    send: Callable[[int], Awaitable[Any]],
+) -> dict[int, BaseException]:
+    """
+    Параллельно отправляет всем получателям с приоритетом BROADCAST.
+    Возвращает ошибки по чатам (пустой словарь — доставлено всем).
+    """
+    async def _send(chat_id: int) -> Any:
+        # send может вернуть объект метода aiogram (message.answer(...)) — он
+        # awaitable, но gather принимает только корутины и future
+        return await send(chat_id)
+
+    token = _current_priority.set(Priority.BROADCAST)
+    try:
+        chat_ids = list(chat_ids)
+        results = await asyncio.gather(*(_send(chat_id) for chat_id in chat_ids), return_exceptions=True)
+    finally:
+        _current_priority.reset(token)
+    return {
+        chat_id: result
+        for chat_id, result in zip(chat_ids, results)
+        if isinstance(result, BaseException)
+    }
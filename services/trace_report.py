@@ -0,0 +1,164 @@
+"""
+Отчёт по трассам заявок (ORDER_TRACE_PATH, services/tracing.py):
+p50/p95/p99 длительности каждого этапа за период.
+
+Длительность этапа в заявке — время, покрытое его span'ами: параллельные
+get_file / telegram_download по фото альбома не складываются.
+Ротированные файлы (<файл>.1, <файл>.2, ...) читаются вместе с основным.
+
+Запуск:
+    python -m services.trace_report                      # файл из ORDER_TRACE_PATH
+    python -m services.trace_report traces.jsonl --since 2h
+    python -m services.trace_report --since 2026-10-18T09:00 --until 2026-10-18T12:00
+    python -m services.trace_report --outcome created --json
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Iterator, Optional
+
+from dotenv import load_dotenv
+
+from services.tracing import STAGES
+
+_RELATIVE = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_time(value: str) -> float:
+    """30m / 2h / 1d — столько назад; иначе ISO-дата в локальном времени."""
+    match = _RELATIVE.match(value)
+    if match:
+        return time.time() - float(match.group(1)) * _UNITS[match.group(2)]
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _files(path: str) -> list[str]:
+    """Файл трасс и его ротированные копии, от старых к новым."""
+    rotated = [name for name in glob.glob(glob.escape(path) + ".*") if name[len(path) + 1:].isdigit()]
+    rotated.sort(key=lambda name: int(name[len(path) + 1:]), reverse=True)
+    return rotated + [path]
+
+
+def read_traces(
+    paths: list[str], since: Optional[float] = None, until: Optional[float] = None,
+) -> Iterator[dict[str, Any]]:
+    for path in paths:
+        for name in _files(path):
+            if not os.path.exists(name):
+                continue
+            with open(name, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        trace = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if since is not None and trace["ts"] < since:
+                        continue
+                    if until is not None and trace["ts"] >= until:
+                        continue
+                    yield trace
+
+
+def covered(spans: list[dict[str, Any]]) -> float:
+    """Сколько времени покрыто span'ами (пересечения считаются один раз)."""
+    total = 0.0
+    end = float("-inf")
+    for item in sorted(spans, key=lambda item: item["start"]):
+        start, stop = item["start"], item["start"] + item["duration"]
+        if start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize(traces: list[dict[str, Any]]) -> dict[str, Any]:
+    durations: dict[str, list[float]] = defaultdict(list)
+    for trace in traces:
+        by_stage: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        for item in trace["spans"]:
+            by_stage[item["name"]].append(item)
+        for stage, spans in by_stage.items():
+            durations[stage].append(covered(spans))
+        durations["total"].append(trace["duration"])
+
+    order = [stage for stage in STAGES if stage in durations]
+    order += sorted(set(durations) - set(STAGES) - {"total"})
+    if durations:
+        order.append("total")
+    return {
+        "traces": len(traces),
+        "outcomes": dict(Counter(trace.get("outcome") for trace in traces)),
+        "stages": [
+            {
+                "stage": stage,
+                "count": len(durations[stage]),
+                "p50_ms": percentile(durations[stage], 0.50) * 1000,
+                "p95_ms": percentile(durations[stage], 0.95) * 1000,
+                "p99_ms": percentile(durations[stage], 0.99) * 1000,
+                "max_ms": max(durations[stage]) * 1000,
+            }
+            for stage in order
+        ],
+    }
+
+
+def print_table(summary: dict[str, Any]) -> None:
+    outcomes = ", ".join(f"{name} {count}" for name, count in summary["outcomes"].items())
+    print(f"Трасс: {summary['traces']}" + (f" ({outcomes})" if outcomes else ""))
+    if not summary["stages"]:
+        return
+    header = f"{'stage':>18} | {'n':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'max ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in summary["stages"]:
+        print(
+            f"{row['stage']:>18} | {row['count']:>6} | {row['p50_ms']:>8.1f} | "
+            f"{row['p95_ms']:>8.1f} | {row['p99_ms']:>8.1f} | {row['max_ms']:>8.1f}"
+        )
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="файлы трасс (по умолчанию ORDER_TRACE_PATH)")
+    parser.add_argument("--since", type=parse_time, help="начало периода: ISO-дата или 30m / 2h / 1d назад")
+    parser.add_argument("--until", type=parse_time, help="конец периода (не включая)")
+    parser.add_argument("--outcome", help="только попытки с этим итогом (created, retry, deferred, failed)")
+    parser.add_argument("--json", action="store_true", help="вывести результат одной JSON-строкой")
+    args = parser.parse_args()
+
+    paths = args.paths or [path for path in [os.getenv("ORDER_TRACE_PATH", "")] if path]
+    if not paths:
+        parser.error("не задан файл трасс (аргумент или ORDER_TRACE_PATH)")
+
+    traces = [
+        trace for trace in read_traces(paths, args.since, args.until)
+        if args.outcome is None or trace.get("outcome") == args.outcome
+    ]
+    summary = summarize(traces)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print_table(summary)
+    if not traces:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
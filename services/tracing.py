@@ -0,0 +1,231 @@
+"""
+Трассы заявок: таймлайн этапов от фото пользователя до итогового статуса.
+
+Хендлер (handlers/correction.py) открывает трассу, когда приходит фото,
+и кладёт её в payload заявки — так трасса переживает очередь и доходит
+до воркера отправки (services/uploader.py), который дописывает свои этапы
+и по итогу попытки сохраняет трассу. Этапы (span'ы):
+
+  album_buffer       — сборка альбома: от первой части до сброса
+  status_message     — ответ «Заявка принята»
+  queue_wait         — от постановки в очередь до воркера
+  download           — подготовка фото (get_file, кэш, скачивание)
+  get_file           — запрос пути файла в Telegram (на каждое фото)
+  telegram_download  — скачивание фото из Telegram (на каждое фото;
+                       в режиме stream — во время upload)
+  multipart          — сборка multipart-формы
+  upload             — отправка тела запроса на бэкенд
+  backend            — ожидание ответа бэкенда
+  status_edit        — итоговая правка статусного сообщения
+
+Текущая трасса хранится в contextvar: span() в любом месте пути заявки
+(в том числе в задачах asyncio.gather) попадает в неё, а без трассы
+обходится одной проверкой. begin() и use() — контекстные менеджеры:
+по выходе из блока прежняя трасса контекста восстанавливается.
+
+Законченные трассы пишутся в ORDER_TRACE_PATH (JSONL, одна трасса
+на строку) пачками из фоновой задачи; файл ротируется по размеру.
+Пока путь не задан, трассы не собираются.
+Отчёт по этапам: python -m services.trace_report.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Как часто сбрасывать законченные трассы в файл (секунды)
+_FLUSH_INTERVAL = 1.0
+
+# Этапы в порядке прохождения заявки (для отчёта)
+STAGES = (
+    "album_buffer", "status_message", "queue_wait", "download", "get_file", "telegram_download",
+    "multipart", "upload", "backend", "status_edit",
+)
+
+
+class Trace:
+    def __init__(self, trace_id: str, started: float, spans: Optional[list[dict[str, Any]]] = None):
+        self.id = trace_id
+        self.started = started
+        self.spans: list[dict[str, Any]] = spans if spans is not None else []
+        self.queued: Optional[float] = None
+
+    def add(self, name: str, start: float, end: float, **attrs: Any) -> None:
+        """Добавляет этап; start и end — unix time."""
+        self.spans.append({"name": name, "start": start, "duration": max(0.0, end - start), **attrs})
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time(), **attrs)
+
+    def to_payload(self) -> dict[str, Any]:
+        return {"id": self.id, "started": self.started, "queued": self.queued, "spans": self.spans}
+
+    @classmethod
+    def from_payload(cls, data: dict[str, Any]) -> "Trace":
+        trace = cls(data["id"], data["started"], list(data.get("spans") or ()))
+        trace.queued = data.get("queued")
+        return trace
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("order_trace", default=None)
+_writer: Optional["TraceWriter"] = None
+
+
+def enable(path: str, *, max_bytes: int, backups: int) -> "TraceWriter":
+    """Включает сбор трасс; start()/close() писателя регистрирует main.py."""
+    global _writer
+    _writer = TraceWriter(path, max_bytes=max_bytes, backups=backups)
+    return _writer
+
+
+def is_enabled() -> bool:
+    return _writer is not None
+
+
+@contextmanager
+def begin(started: Optional[float] = None) -> Iterator[Optional[Trace]]:
+    """Открывает трассу на время блока (None — трассы выключены)."""
+    if _writer is None:
+        yield None
+        return
+    with use(Trace(uuid.uuid4().hex[:16], started or time.time())) as trace:
+        yield trace
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def use(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Делает trace текущей на время блока."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """Этап текущей трассы; без трассы — ничего не делает."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **attrs):
+        yield
+
+
+def export() -> Optional[dict[str, Any]]:
+    """Текущая трасса для payload заявки; момент вызова — начало ожидания в очереди."""
+    trace = _current.get()
+    if trace is None:
+        return None
+    trace.queued = time.time()
+    return trace.to_payload()
+
+
+def resume(data: Optional[dict[str, Any]], attempt: int) -> Optional[Trace]:
+    """
+    Продолжает трассу из payload заявки. Этапы хендлера и ожидание
+    в очереди попадают только в первую попытку: у повторов перед
+    попыткой — задержка повтора, а не очередь.
+    """
+    if _writer is None or not data:
+        return None
+    trace = Trace.from_payload(data)
+    if attempt > 1:
+        trace.spans = []
+        trace.started = time.time()
+    elif trace.queued is not None:
+        trace.add("queue_wait", trace.queued, time.time())
+    return trace
+
+
+def finish(trace: Optional[Trace], **fields: Any) -> None:
+    """Сохраняет законченную трассу; fields — итог (outcome, order_id, ...)."""
+    if trace is None or _writer is None:
+        return
+    end = max([trace.started] + [item["start"] + item["duration"] for item in trace.spans])
+    spans = [
+        {**item, "start": round(item["start"] - trace.started, 4), "duration": round(item["duration"], 4)}
+        for item in sorted(trace.spans, key=lambda item: item["start"])
+    ]
+    _writer.write({
+        "trace_id": trace.id,
+        "ts": round(trace.started, 3),
+        "duration": round(end - trace.started, 4),
+        **fields,
+        "spans": spans,
+    })
+
+
+def _append(path: str, data: bytes, max_bytes: int, backups: int) -> None:
+    if max_bytes and os.path.exists(path) and os.path.getsize(path) + len(data) > max_bytes:
+        _rotate(path, backups)
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def _rotate(path: str, backups: int) -> None:
+    """path → path.1 → path.2 ...; старше path.{backups} — удаляется."""
+    if backups <= 0:
+        os.remove(path)
+        return
+    for n in range(backups - 1, 0, -1):
+        if os.path.exists(f"{path}.{n}"):
+            os.replace(f"{path}.{n}", f"{path}.{n + 1}")
+    os.replace(path, f"{path}.1")
+
+
+class TraceWriter:
+    """Дописывает трассы в JSONL пачками из фоновой задачи, с ротацией по размеру."""
+
+    def __init__(self, path: str, *, max_bytes: int, backups: int):
+        self.path = path
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._buffer: list[str] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._buffer.append(json.dumps(record, ensure_ascii=False, default=str))
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(_FLUSH_INTERVAL)
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Не удалось записать трассы заявок в %s", self.path)
+
+    async def _flush(self) -> None:
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        data = ("\n".join(lines) + "\n").encode()
+        await asyncio.to_thread(_append, self.path, data, self._max_bytes, self._backups)
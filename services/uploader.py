@@ -0,0 +1,322 @@
+"""
+Фоновая отправка заявок на бэкенд.
+
+Хендлеры только ставят заявку в очередь (db/order_spool.py) через
+OrderUploader.submit() и сразу отвечают пользователю. Пул из ORDER_WORKERS
+воркеров разбирает очередь: скачивает фото из Telegram, отправляет
+POST /correction-orders/ и по итогу редактирует статусное сообщение
+пользователя. Временные ошибки (сеть, 5xx, 408/429) повторяются
+с экспоненциальной задержкой, до ORDER_MAX_ATTEMPTS попыток. Пока
+предохранитель бэкенда разомкнут, заявки откладываются без траты попыток
+и без скачивания фото.
+
+Повтор той же заявки (ключ идемпотентности в payload) в очередь не ставится:
+submit() сразу возвращает номер уже созданной заявки, а ключ уходит
+на бэкенд заголовком, чтобы повтор после таймаута не создал дубль там.
+
+Пока заявка отправляется, статусное сообщение показывает этапы
+(services/progress.py): скачивание фото k/N, загрузка X%, ожидание ответа.
+Правки сливаются — не чаще ORDER_PROGRESS_INTERVAL. Длительность этапов
+попадает в метрику bot_order_stage_seconds и в лог.
+
+Каждая попытка отправки дописывает этапы в трассу заявки, открытую
+хендлером (services/tracing.py), и сохраняет её с итогом попытки.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Any, Optional
+
+from aiogram import Bot
+
+from db.order_spool import Enqueued, OrderSpool, SpooledOrder
+from services.backend import BackendClient, BackendError, BackendUnavailable, NewOrder
+from services import metrics, tracing
+from services.photos import PhotoPart, PhotoRef, prepare_photos
+from services.progress import DOWNLOAD_TEXT, UPLOAD_TEXT, WAITING_TEXT, StageTimer, StatusProgress
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать новую работу, если очередь пуста (секунды).
+# Заодно подбирает заявки, у которых подошло время повторной попытки.
+_POLL_INTERVAL = 1.0
+
+# Как часто чистить очередь от старых неудавшихся заявок (секунды)
+_PURGE_INTERVAL = 3600.0
+
+
+# Сообщение пользователю, когда заявка отложена до восстановления бэкенда
+_DEFERRED_TEXT = (
+    "⏳ <b>Сервер временно недоступен.</b>\n\n"
+    "Заявка сохранена и будет отправлена автоматически."
+)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, BackendError):
+        return exc.status >= 500 or exc.status in (408, 429)
+    return True
+
+
+class OrderUploader:
+    def __init__(
+        self,
+        spool: OrderSpool,
+        backend: BackendClient,
+        *,
+        workers: int,
+        max_attempts: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        progress_interval: float = 0,
+    ):
+        self._spool = spool
+        self._backend = backend
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._retry_base_delay = retry_base_delay
+        self._retry_max_delay = retry_max_delay
+        self._progress_interval = progress_interval
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+
+    async def start(self, bot: Bot) -> None:
+        self._bot = bot
+        await self._spool.open()
+        pending = await self._spool.pending_count()
+        if pending:
+            logger.info("В очереди заявок с прошлого запуска: %d", pending)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"order-uploader-{n}")
+            for n in range(self._workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._purge_loop(), name="order-spool-purge"))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._spool.close()
+
+    async def submit(self, payload: dict[str, Any]) -> Enqueued:
+        """Ставит заявку в очередь (если это не повтор уже поставленной)."""
+        result = await self._spool.enqueue(payload)
+        if result.duplicate:
+            metrics.ORDER_DUPLICATES.inc("created" if result.order_id is not None else "queued")
+            logger.info(
+                "Повтор заявки %s: %s", payload.get("idempotency_key"),
+                f"уже создана #{result.order_id}" if result.order_id is not None else "уже в очереди",
+            )
+        else:
+            self._wakeup.set()
+        return result
+
+    async def backlog(self, user_id: int) -> tuple[int, int]:
+        """Неотправленные заявки пользователя и байт фото в очереди (для ThrottleMiddleware)."""
+        return await self._spool.backlog(user_id)
+
+    async def has_pending(self, user_id: int) -> bool:
+        """Есть ли у пользователя заявки, ещё не созданные на бэкенде (для кэша /orders)."""
+        return await self._spool.user_pending(user_id) > 0
+
+    async def _purge_loop(self) -> None:
+        while True:
+            try:
+                purged = await self._spool.purge()
+                if purged:
+                    logger.info("Удалено старых неудавшихся заявок из очереди: %d", purged)
+            except Exception:
+                logger.exception("Не удалось почистить очередь заявок")
+            await asyncio.sleep(_PURGE_INTERVAL)
+
+    # ── Воркеры ─────────────────────────────────────────────────────────────
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self._spool.claim()
+            except Exception:
+                logger.exception("Не удалось прочитать очередь заявок")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(job)
+
+    async def _process(self, job: SpooledOrder) -> None:
+        trace = tracing.resume(job.payload.get("trace"), job.attempts)
+        outcome, order_id = "interrupted", None
+        with tracing.use(trace):
+            try:
+                outcome, order_id = await self._deliver(job)
+            finally:
+                tracing.finish(
+                    trace, outcome=outcome, order_id=order_id, attempt=job.attempts,
+                    photos=len(job.payload["photos"]),
+                )
+
+    async def _deliver(self, job: SpooledOrder) -> tuple[str, Optional[int]]:
+        """Одна попытка отправки; возвращает итог попытки и номер созданной заявки."""
+        payload = job.payload
+        try:
+            created, failed_photos, total_photos = await self._upload(payload)
+        except asyncio.CancelledError:
+            # Бот останавливается — вернём заявку в очередь, не дожидаясь аренды
+            await self._spool.retry_later(job.id, 0, "прервано остановкой бота")
+            raise
+        except BackendUnavailable as exc:
+            # Предохранитель разомкнут — ждём, пока он снова попробует бэкенд
+            delay = exc.retry_after * random.uniform(1.0, 1.2)
+            logger.warning("Заявка %s отложена на %.0f с: %s", job.id, delay, exc)
+            await self._spool.defer(job.id, delay, str(exc))
+            if job.last_error is None:
+                await self._edit_status(payload, _DEFERRED_TEXT)
+            return "deferred", None
+        except Exception as exc:
+            if _is_retryable(exc) and job.attempts < self._max_attempts:
+                delay = min(self._retry_max_delay, self._retry_base_delay * 2 ** (job.attempts - 1))
+                delay *= random.uniform(0.8, 1.2)
+                logger.warning(
+                    "Заявка %s: попытка %d не удалась (%s), повтор через %.0f с",
+                    job.id, job.attempts, exc, delay,
+                )
+                await self._spool.retry_later(job.id, delay, str(exc))
+                # Пользователю сообщаем один раз — при первой неудаче
+                if job.last_error is None:
+                    await self._edit_status(payload, _DEFERRED_TEXT)
+                return "retry", None
+
+            logger.error("Заявка %s не отправлена после %d попыток: %s", job.id, job.attempts, exc)
+            await self._spool.fail(job.id, str(exc))
+            await self._edit_status(payload, _failure_text(exc))
+            return "failed", None
+
+        await self._spool.complete(job.id, payload.get("idempotency_key"), created.get("id"))
+        status_text = "успешно создана" if not payload.get("replace_order_id") else "обновлена"
+        warning = (
+            f"\n⚠️ Не удалось загрузить фото: {failed_photos} из {total_photos}"
+            if failed_photos else ""
+        )
+        await self._edit_status(
+            payload,
+            f"✅ <b>Заявка #{created['id']} {status_text}!</b>\n"
+            f"📋 Описание: {payload.get('description') or '<i>не указано</i>'}\n"
+            f"⏳ Заявка в работе..."
+            f"{warning}",
+        )
+        return "created", created.get("id")
+
+    async def _upload(self, payload: dict[str, Any]) -> tuple[dict[str, Any], int, int]:
+        # Фото не скачиваем, если бэкенд их всё равно не примет
+        self._backend.check_available()
+        refs = [PhotoRef.from_payload(item) for item in payload["photos"]]
+        progress = StatusProgress(
+            self._bot, payload["telegram_chat_id"], payload["status_message_id"],
+            min_interval=self._progress_interval,
+        )
+        trace = tracing.current()
+        timer = StageTimer(trace=trace)
+        try:
+            created, failed_photos, photos = await self._upload_with_progress(payload, refs, progress, timer)
+        finally:
+            timer.stop()
+            await progress.close()
+
+        for stage, seconds in timer.stages.items():
+            metrics.ORDER_STAGE_LATENCY.observe(seconds, stage)
+        logger.info(
+            "Заявка #%s отправлена: %s", created.get("id"),
+            ", ".join(f"{stage} {seconds:.2f} с" for stage, seconds in timer.stages.items()),
+            extra={
+                "order_id": created.get("id"), "stages": timer.stages, "progress_edits": progress.edits,
+                "trace_id": trace.id if trace else None,
+            },
+        )
+        _record_photo_bytes(created.get("id"), photos)
+        return created, failed_photos, len(refs)
+
+    async def _upload_with_progress(
+        self, payload: dict[str, Any], refs: list[PhotoRef], progress: StatusProgress, timer: StageTimer,
+    ) -> tuple[dict[str, Any], int, list[PhotoPart]]:
+        timer.start("download")
+        photos, failed_photos = await prepare_photos(
+            self._bot, refs,
+            lambda done, total: progress.set(DOWNLOAD_TEXT.format(done=done, total=total)),
+        )
+        if not photos:
+            # Telegram не отдал ни одного фото — скорее всего временная проблема
+            raise RuntimeError("не удалось загрузить ни одного фото из Telegram")
+
+        # Размер тела в режиме stream заранее неизвестен — оцениваем по фото
+        estimate = sum(photo.size or 0 for photo in photos) or 1
+
+        def on_upload(sent: int, total: Optional[int]) -> None:
+            if total is not None and sent >= total:
+                timer.start("backend")
+                progress.set(WAITING_TEXT)
+            else:
+                timer.start("upload")
+                progress.set(UPLOAD_TEXT.format(percent=min(99, sent * 100 // (total or estimate))))
+
+        order = NewOrder(
+            telegram_user_id=payload["telegram_user_id"],
+            telegram_chat_id=payload["telegram_chat_id"],
+            telegram_username=payload.get("telegram_username"),
+            telegram_full_name=payload.get("telegram_full_name"),
+            description=payload.get("description"),
+            replace_order_id=payload.get("replace_order_id"),
+            user_message_id=payload.get("user_message_id"),
+            photos=photos,
+            idempotency_key=payload.get("idempotency_key"),
+        )
+        timer.start("upload")
+        try:
+            created = await self._backend.create_order(order, on_progress=on_upload)
+        finally:
+            for photo in photos:
+                await photo.close()
+        return created, failed_photos, photos
+
+    async def _edit_status(self, payload: dict[str, Any], text: str) -> None:
+        chat_id = payload["telegram_chat_id"]
+        try:
+            with tracing.span("status_edit"):
+                await self._bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=payload["status_message_id"],
+                )
+        except Exception as exc:
+            logger.warning("Не удалось обновить статус заявки: %s", exc)
+            try:
+                await self._bot.send_message(chat_id, text)
+            except Exception:
+                logger.exception("Не удалось сообщить пользователю %s о заявке", chat_id)
+
+
+def _record_photo_bytes(order_id: Any, photos: list[PhotoPart]) -> None:
+    """Сколько байт сэкономили выбор варианта фото и пережатие."""
+    uploaded = sum(photo.size or 0 for photo in photos)
+    original = sum(photo.original_size or photo.size or 0 for photo in photos)
+    if not original:
+        return
+    saved = max(0, original - uploaded)
+    metrics.PHOTO_ORIGINAL_BYTES.inc(amount=original)
+    metrics.PHOTO_UPLOADED_BYTES.inc(amount=uploaded)
+    metrics.ORDER_PHOTO_BYTES_SAVED.observe(saved)
+    logger.info(
+        "Заявка #%s: фото %d байт вместо %d (сэкономлено %d)",
+        order_id, uploaded, original, saved,
+    )
+
+
+def _failure_text(exc: Exception) -> str:
+    if isinstance(exc, BackendError):
+        return f"❌ <b>Ошибка сервера ({exc.status}).</b>\n\nПожалуйста, попробуйте позже."
+    return "❌ <b>Произошла ошибка при отправке.</b>\n\nПроверьте соединение и попробуйте снова."
@@ -0,0 +1,111 @@
+"""
+Приём апдейтов через webhook (main.py --mode webhook).
+
+aiohttp-сервер принимает POST от Telegram, проверяет секретный токен
+(заголовок X-Telegram-Bot-Api-Secret-Token) и кладёт апдейт в ограниченную
+очередь; ответ Telegram уходит сразу, не дожидаясь хендлеров. Очередь
+разбирают `workers` задач, так что медленный хендлер не тормозит приём.
+Если очередь переполнена, отвечаем 503 — Telegram повторит доставку позже.
+"""
+
+import asyncio
+import hmac
+import logging
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Сколько ждать обработки оставшихся апдейтов при остановке (секунды)
+_DRAIN_TIMEOUT = 10.0
+
+
+class WebhookServer:
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        *,
+        path: str,
+        secret_token: str,
+        queue_size: int,
+        workers: int,
+    ):
+        self._bot = bot
+        self._dp = dp
+        self._path = path
+        # compare_digest над str принимает только ASCII — сравниваем байты
+        self._secret_token = secret_token.encode()
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        self._workers = workers
+        self._tasks: list[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self._path, self._handle)
+        return app
+
+    async def start(self, host: str, port: int) -> None:
+        await self._dp.emit_startup(
+            bot=self._bot, bots=[self._bot], dispatcher=self._dp, **self._dp.workflow_data,
+        )
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{n}")
+            for n in range(self._workers)
+        ]
+        # access-лог aiohttp на каждый апдейт — лишняя работа в горячем пути
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Не обработано апдейтов при остановке: %d", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._dp.emit_shutdown(
+            bot=self._bot, bots=[self._bot], dispatcher=self._dp, **self._dp.workflow_data,
+        )
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self._secret_token:
+            # Заголовок не в UTF-8 aiohttp отдаёт с суррогатами — кодируем без ошибок
+            received = request.headers.get(SECRET_HEADER, "").encode(errors="surrogateescape")
+            if not hmac.compare_digest(received, self._secret_token):
+                return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self._bot})
+        except Exception as exc:
+            logger.warning("Некорректный апдейт: %s", exc)
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning("Очередь апдейтов переполнена, апдейт %s отклонён", update.update_id)
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self._dp.feed_update(self._bot, update)
+            except Exception:
+                logger.exception("Ошибка обработки апдейта %s", update.update_id)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,17 @@
+"""
+Общая настройка тестов.
+
+config.py читает окружение при импорте и требует BOT_TOKEN, поэтому
+окружение задаётся до импорта модулей бота. Асинхронный код тесты
+запускают через asyncio.run — без плагинов pytest.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("BOT_TOKEN", "0:test")
+os.environ.setdefault("METRICS_PORT", "0")
@@ -0,0 +1,166 @@
+"""
+Предохранитель и адаптивные таймауты против настоящего BackendClient
+и заглушки бэкенда на aiohttp, которая добавляет задержку и ошибки.
+
+Часы предохранителя фиктивные: заглушка сдвигает их на «задержку» ответа,
+поэтому p99 и окно open_seconds не зависят от скорости машины. Настоящий
+sleep нужен только там, где проверяется сам таймаут aiohttp.
+"""
+
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from services.backend import BackendClient, BackendError, NewOrder, is_backend_failure
+from services.breaker import BackendUnavailable, BreakerState, CircuitBreaker
+from services.photos import PhotoPart
+
+_LIST = "GET /correction-orders/"
+_UPLOAD = "POST /correction-orders/"
+
+
+class StubBackend:
+    def __init__(self):
+        self.now = 0.0
+        self.status = 200
+        self.latency = 0.01      # фиктивная задержка ответа (сдвигает часы)
+        self.sleep = 0.0         # настоящая задержка (для проверки таймаута)
+        self.requests = 0
+
+    def clock(self) -> float:
+        return self.now
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await request.read()
+        if self.sleep:
+            await asyncio.sleep(self.sleep)
+        self.now += self.latency
+        if self.status != 200:
+            return web.json_response({"detail": "unavailable"}, status=self.status)
+        if request.method == "GET":
+            return web.json_response([{"id": 1, "status": "new"}])
+        return web.json_response({"id": self.requests}, status=201)
+
+    async def start(self) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/correction-orders/", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def close(self) -> None:
+        await self._runner.cleanup()
+
+
+def _run(scenario, **breaker_kwargs):
+    async def run():
+        stub = StubBackend()
+        url = await stub.start()
+        breaker = CircuitBreaker(**{
+            "window": 60, "min_calls": 4, "error_rate": 0.5, "open_seconds": 30,
+            "timeout_multiplier": 3, "timeout_min": 0.05, "is_failure": is_backend_failure,
+            "clock": stub.clock, **breaker_kwargs,
+        })
+        backend = BackendClient(
+            url, "secret", timeout=5, upload_timeout=30, connect_timeout=1,
+            limit_per_host=10, dns_ttl=10, breaker=breaker,
+        )
+        await backend.start()
+        try:
+            await scenario(stub, backend, breaker)
+        finally:
+            await backend.close()
+            await stub.close()
+
+    asyncio.run(run())
+
+
+def _order(size: int, known_size: bool = True) -> NewOrder:
+    photo = PhotoPart("photo.jpg", b"x" * size, size=size if known_size else None)
+    return NewOrder(telegram_user_id=1, telegram_chat_id=1, photos=[photo])
+
+
+def test_breaker_opens_probes_and_closes():
+    async def scenario(stub, backend, breaker):
+        stub.status = 503
+        for _ in range(4):
+            with pytest.raises(BackendError):
+                await backend.list_orders(1, limit=10)
+        assert breaker.state is BreakerState.OPEN
+
+        # Разомкнут — запрос не доходит до бэкенда
+        with pytest.raises(BackendUnavailable):
+            await backend.list_orders(1, limit=10)
+        assert stub.requests == 4
+
+        # Неудачная проба снова размыкает
+        stub.now += 31
+        with pytest.raises(BackendError):
+            await backend.list_orders(1, limit=10)
+        assert breaker.state is BreakerState.OPEN and breaker.opened == 2
+
+        # Удачная проба замыкает, окно ошибок начинается заново
+        stub.now += 31
+        stub.status = 200
+        assert await backend.list_orders(1, limit=10) == [{"id": 1, "status": "new"}]
+        assert breaker.state is BreakerState.CLOSED
+        assert breaker.error_rate() == 0
+
+    _run(scenario)
+
+
+def test_client_errors_do_not_open_breaker():
+    async def scenario(stub, backend, breaker):
+        stub.status = 404
+        for _ in range(10):
+            with pytest.raises(BackendError):
+                await backend.list_orders(1, limit=10)
+        assert breaker.state is BreakerState.CLOSED
+
+    _run(scenario)
+
+
+def test_timeout_follows_backend_latency():
+    async def scenario(stub, backend, breaker):
+        assert breaker.timeout(_LIST, 5) == 5  # данных ещё нет
+        for _ in range(25):
+            await backend.list_orders(1, limit=10)
+        stub.now += 1  # p99 пересчитывается не чаще раза в секунду
+        assert breaker.timeout(_LIST, 5) == pytest.approx(0.05)
+
+        # Бэкенд стал отвечать дольше адаптивного таймаута — это ошибка, а не ожидание 5 с
+        stub.sleep = 0.5
+        with pytest.raises(asyncio.TimeoutError):
+            await backend.list_orders(1, limit=10)
+        assert breaker.error_rate() > 0
+
+    _run(scenario)
+
+
+def test_upload_timeout_scales_with_payload_size():
+    async def scenario(stub, backend, breaker):
+        for _ in range(25):
+            await backend.create_order(_order(1024))
+        stub.now += 1
+        mb = 1024 * 1024
+        assert breaker.timeout(_UPLOAD, 30, 1024) == pytest.approx(0.05, abs=0.01)
+        assert breaker.timeout(_UPLOAD, 30, 4 * mb) == pytest.approx(0.05 + 4 * 0.25)
+        assert breaker.timeout(_UPLOAD, 30, 1000 * mb) == 30
+        assert breaker.timeout(_UPLOAD, 30, None) == 30
+
+        # Большое тело дольше p99 мелких загрузок, но в пределах запаса на размер
+        stub.sleep = 0.3
+        created = await backend.create_order(_order(4 * mb))
+        assert created["id"] == stub.requests
+        # Размер неизвестен — полный таймаут
+        await backend.create_order(_order(1024, known_size=False))
+        # Мелкое тело с той же задержкой — таймаут
+        with pytest.raises(asyncio.TimeoutError):
+            await backend.create_order(_order(1024))
+
+    _run(scenario, seconds_per_mb=0.25)
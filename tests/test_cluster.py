@@ -0,0 +1,51 @@
+"""Канал супервизор ↔ воркер: испорченные строки от воркера не останавливают чтение."""
+
+import asyncio
+import sys
+
+from services.cluster import Supervisor
+
+# Воркер, который перед каждым сообщением пишет в канал мусор
+_WORKER = r"""
+import json, sys
+
+out = sys.stdout.buffer
+garbage = b'garbage\n{"seq": 1}\n[1]\n\xff\xfe\n{"type": "ack"}\n'
+out.write(garbage + b'{"type": "ready"}\n')
+out.flush()
+for line in sys.stdin.buffer:
+    message = json.loads(line)
+    if message["type"] == "stop":
+        break
+    if message["type"] == "update":
+        out.write(garbage + json.dumps({"type": "ack", "seq": message["seq"]}).encode() + b"\n")
+        out.flush()
+"""
+
+
+def test_garbage_lines_are_skipped():
+    async def run():
+        supervisor = Supervisor(
+            1,
+            command=lambda index: [sys.executable, "-c", _WORKER],
+            env=lambda index: {},
+            health_interval=60,
+            health_timeout=60,
+        )
+        await supervisor.start()
+        worker = supervisor._workers[0]
+        try:
+            assert worker.ready.is_set()
+            for update_id in range(3):
+                supervisor._deliver(worker, 7, {"update_id": update_id})
+            for _ in range(100):
+                if not worker.unacked:
+                    break
+                await asyncio.sleep(0.05)
+            assert not worker.unacked
+            assert not worker.reader_task.done()
+            assert worker.restarts == 0
+        finally:
+            await supervisor.close()
+
+    asyncio.run(run())
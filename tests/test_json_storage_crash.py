@@ -0,0 +1,134 @@
+"""
+Падение процесса посреди записи в JsonUserStorage.
+
+Писатель — отдельный процесс: пишет пользователям возрастающие seq
+и после каждого подтверждённого upsert (журнал сброшен на диск) печатает
+его. Тест убивает писателя SIGKILL посреди дописывания журнала или
+посреди сворачивания журнала в снимок, открывает хранилище заново
+и проверяет, что ни одна подтверждённая запись не потеряна.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from db.json_storage import JsonUserStorage
+
+from conftest import ROOT
+
+_USERS = 20
+
+_WRITER = """
+import asyncio, os, sys, time
+sys.path.insert(0, {root!r})
+from db.json_storage import JsonUserStorage
+
+path, flush_threshold, mode = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+
+if mode == "compaction":
+    # Снимок уже во временном файле, os.replace ещё не сделан — здесь и убиваем
+    real_replace = os.replace
+    def slow_replace(src, dst):
+        print("replace", flush=True)
+        time.sleep(5)
+        real_replace(src, dst)
+    os.replace = slow_replace
+
+async def main():
+    storage = JsonUserStorage(path, flush_interval=3600, flush_threshold=flush_threshold)
+    await storage.ensure_open()
+    seq = 0
+    while True:
+        seq += 1
+        await storage.upsert(seq % {users}, {{"status": "pending", "seq": seq}})
+        print(seq, flush=True)
+
+asyncio.run(main())
+"""
+
+
+def _run_writer(path: str, flush_threshold: int, mode: str, acks: int) -> int:
+    """Запускает писателя и убивает его; возвращает последний подтверждённый seq."""
+    script = _WRITER.format(root=ROOT, users=_USERS)
+    proc = subprocess.Popen(
+        [sys.executable, "-c", script, path, str(flush_threshold), mode],
+        stdout=subprocess.PIPE, text=True,
+    )
+    last = 0
+    try:
+        for line in proc.stdout:
+            if line.strip() == "replace":
+                break
+            last = int(line)
+            if mode == "append" and last >= acks:
+                break
+        else:
+            pytest.fail(f"писатель завершился сам: код {proc.wait()}")
+    finally:
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+    return last
+
+
+def _expected(last: int) -> dict[int, int]:
+    """Последний подтверждённый seq каждого пользователя."""
+    expected: dict[int, int] = {}
+    for seq in range(1, last + 1):
+        expected[seq % _USERS] = seq
+    return expected
+
+
+def _reopen(path: str) -> dict[int, dict]:
+    async def run():
+        storage = JsonUserStorage(path, flush_interval=3600, flush_threshold=1000)
+        await storage.ensure_open()
+        try:
+            return {user_id: await storage.get(user_id) for user_id in range(_USERS)}
+        finally:
+            await storage.close()
+
+    return asyncio.run(run())
+
+
+def _assert_consistent(path: str, last: int) -> None:
+    users = _reopen(path)
+    for user_id, seq in _expected(last).items():
+        user = users[user_id]
+        assert user is not None, f"пользователь {user_id} потерян"
+        # Убитый после печати seq писатель мог успеть записать ещё одну строку
+        assert seq <= user["seq"] <= last + 1
+        assert user["seq"] % _USERS == user_id
+    # После открытия журнал свёрнут, снимок — валидный JSON
+    with open(path, encoding="utf-8") as f:
+        json.load(f)
+    assert not os.path.exists(f"{path}.journal") or os.path.getsize(f"{path}.journal") == 0
+
+
+@pytest.mark.parametrize("acks", [1, 37, 150])
+def test_kill_during_journal_append(tmp_path, acks):
+    path = str(tmp_path / "users.json")
+    last = _run_writer(path, flush_threshold=10_000, mode="append", acks=acks)
+    _assert_consistent(path, last)
+
+
+@pytest.mark.parametrize("flush_threshold", [5, 64])
+def test_kill_during_compaction(tmp_path, flush_threshold):
+    path = str(tmp_path / "users.json")
+    last = _run_writer(path, flush_threshold=flush_threshold, mode="compaction", acks=0)
+    assert os.path.exists(f"{path}.tmp"), "убит не во время сворачивания"
+    _assert_consistent(path, last)
+
+
+def test_torn_last_journal_line(tmp_path):
+    path = str(tmp_path / "users.json")
+    last = _run_writer(path, flush_threshold=10_000, mode="append", acks=25)
+    # Обрыв посреди дописывания строки: на диске только её начало
+    with open(f"{path}.journal", "a", encoding="utf-8") as f:
+        f.write('{"id": "3", "payload": {"status": "appr')
+    _assert_consistent(path, last)
+    assert _reopen(path)[3]["status"] == "pending"
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from aiogram.types import Chat, Message
+
+from middlewares.logging_mw import LoggingMiddleware
+
+
+def _call(middleware, username):
+    user = SimpleNamespace(id=42, username=username, full_name="Иван")
+    message = Message.model_construct(message_id=1, date=0, chat=Chat(id=42, type="private"), text="привет")
+
+    async def handler(event, data):
+        return "handled"
+
+    return asyncio.run(middleware(handler, message, {"event_from_user": user}))
+
+
+def test_user_without_username(caplog):
+    with caplog.at_level(logging.INFO, logger="UserLog"):
+        assert _call(LoggingMiddleware(), None) == "handled"
+        _call(LoggingMiddleware(), "ivan")
+    assert "| нет username |" in caplog.records[0].getMessage()
+    assert "| @ivan |" in caplog.records[1].getMessage()
+
+
+def test_suppressed_messages_are_counted(caplog):
+    middleware = LoggingMiddleware(sample_rate=0)
+    with caplog.at_level(logging.INFO, logger="UserLog"):
+        _call(middleware, "ivan")
+        _call(middleware, "ivan")
+    assert not caplog.records
+    assert middleware.suppressed == 2
@@ -0,0 +1,109 @@
+import asyncio
+
+from services.media_group import MediaGroupAggregator
+
+
+class FakeTime:
+    """Часы и sleep для агрегатора: время идёт только через advance()."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._sleepers: list[tuple[float, asyncio.Future]] = []
+
+    def clock(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._sleepers.append((self.now + delay, future))
+        await future
+
+    async def advance(self, seconds: float) -> None:
+        self.now += seconds
+        for wake_at, future in list(self._sleepers):
+            if wake_at <= self.now + 1e-9:
+                self._sleepers.remove((wake_at, future))
+                if not future.done():
+                    future.set_result(None)
+        await _settle()
+
+
+async def _settle() -> None:
+    # Даём задачам агрегатора дойти до следующего sleep / сброса
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def _run(scenario, *, debounce=0.3, max_wait=1.0):
+    async def run():
+        fake = FakeTime()
+        aggregator = MediaGroupAggregator(debounce=debounce, max_wait=max_wait, clock=fake.clock, sleep=fake.sleep)
+        flushed: list[tuple[float, list]] = []
+
+        def add(key, item):
+            async def on_complete(items):
+                flushed.append((fake.now, items))
+            aggregator.add(key, item, on_complete)
+
+        await scenario(aggregator, fake, add, flushed)
+        return aggregator
+
+    return asyncio.run(run())
+
+
+def test_debounce_window_moves_with_each_part():
+    async def scenario(aggregator, fake, add, flushed):
+        add("g", 1)
+        await fake.advance(0.2)
+        add("g", 2)
+        await fake.advance(0.2)
+        # С первой части 0.4 с, но с последней только 0.2 — альбом ещё собирается
+        assert flushed == []
+        await fake.advance(0.1)
+        assert flushed == [(0.5, [1, 2])]
+
+    aggregator = _run(scenario)
+    assert aggregator.stats.flush_reasons == {"debounce": 1}
+    assert aggregator.pending_groups == 0
+
+
+def test_tenth_part_flushes_without_waiting():
+    async def scenario(aggregator, fake, add, flushed):
+        for n in range(10):
+            add("g", n)
+        await _settle()
+        assert flushed == [(0.0, list(range(10)))]
+
+    aggregator = _run(scenario)
+    assert aggregator.stats.flush_reasons == {"full": 1}
+    assert aggregator.stats.parts_per_album == {10: 1}
+
+
+def test_max_wait_caps_slow_album():
+    async def scenario(aggregator, fake, add, flushed):
+        # Части идут чаще debounce — без предела альбом собирался бы бесконечно
+        for n in range(6):
+            add("g", n)
+            await fake.advance(0.25)
+        assert flushed == [(1.0, [0, 1, 2, 3])]
+
+    aggregator = _run(scenario)
+    assert aggregator.stats.flush_reasons["max_wait"] == 1
+
+
+def test_late_part_does_not_open_second_album():
+    async def scenario(aggregator, fake, add, flushed):
+        add("g", 1)
+        add("other", "x")
+        await fake.advance(0.3)
+        assert len(flushed) == 2
+        add("g", 2)
+        await fake.advance(5)
+        assert len(flushed) == 2
+        # Окно опоздания прошло — ключ забыт
+        add("g", 3)
+        await fake.advance(0.3)
+        assert flushed[-1] == (5.6, [3])
+
+    aggregator = _run(scenario)
+    assert aggregator.stats.late_parts == 1
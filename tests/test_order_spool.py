@@ -0,0 +1,203 @@
+import asyncio
+
+from db.order_spool import OrderSpool
+from services import uploader as uploader_module
+from services.uploader import OrderUploader
+
+_LEASE = 60.0
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _payload(user_id: int = 1, **extra) -> dict:
+    return {
+        "telegram_user_id": user_id, "telegram_chat_id": user_id, "status_message_id": 1,
+        "photos": [], **extra,
+    }
+
+
+def _spool(tmp_path, clock: Clock, **kwargs) -> OrderSpool:
+    return OrderSpool(str(tmp_path / "orders.db"), lease_seconds=_LEASE, dedupe_ttl=3600, clock=clock, **kwargs)
+
+
+def _run(tmp_path, scenario, **kwargs):
+    async def run():
+        clock = Clock()
+        spool = _spool(tmp_path, clock, **kwargs)
+        await spool.open()
+        try:
+            return await scenario(spool, clock)
+        finally:
+            await spool.close()
+
+    return asyncio.run(run())
+
+
+def test_claim_and_lease_expiry(tmp_path):
+    async def scenario(spool, clock):
+        queued = await spool.enqueue(_payload())
+        job = await spool.claim()
+        assert job.id == queued.spool_id and job.attempts == 1
+        # Взята воркером — другим не достаётся, пока аренда не истекла
+        assert await spool.claim() is None
+        clock.now += _LEASE - 1
+        assert await spool.claim() is None
+        clock.now += 2
+        again = await spool.claim()
+        assert again.id == job.id and again.attempts == 2
+
+    _run(tmp_path, scenario)
+
+
+def test_in_flight_order_survives_restart(tmp_path):
+    clock = Clock()
+
+    async def run():
+        spool = _spool(tmp_path, clock)
+        await spool.open()
+        queued = await spool.enqueue(_payload(description="до падения"))
+        assert (await spool.claim()).id == queued.spool_id
+        # Процесс упал посреди отправки: ни complete, ни retry_later
+        await spool.close()
+
+        spool = _spool(tmp_path, clock)
+        await spool.open()
+        try:
+            assert await spool.pending_count() == 1
+            assert await spool.claim() is None
+            clock.now += _LEASE + 1
+            job = await spool.claim()
+            assert job.id == queued.spool_id
+            assert job.payload["description"] == "до падения"
+            assert job.attempts == 2
+        finally:
+            await spool.close()
+
+    asyncio.run(run())
+
+
+def test_retry_later_and_defer(tmp_path):
+    async def scenario(spool, clock):
+        await spool.enqueue(_payload())
+        job = await spool.claim()
+        await spool.retry_later(job.id, 10, "503")
+        clock.now += 9.9
+        assert await spool.claim() is None
+        clock.now += 0.2
+        job = await spool.claim()
+        assert job.attempts == 2 and job.last_error == "503"
+
+        # Отложенная попытка (предохранитель разомкнут) не засчитывается
+        await spool.defer(job.id, 5, "breaker open")
+        clock.now += 5
+        assert (await spool.claim()).attempts == 2
+
+    _run(tmp_path, scenario)
+
+
+def test_failed_order_stays_failed(tmp_path):
+    async def scenario(spool, clock):
+        await spool.enqueue(_payload())
+        job = await spool.claim()
+        await spool.fail(job.id, "400 Bad Request")
+        clock.now += _LEASE * 100
+        assert await spool.claim() is None
+        assert await spool.pending_count() == 0
+        assert await spool.backlog(1) == (0, 0)
+
+    _run(tmp_path, scenario)
+
+
+def test_purge_removes_old_failed_orders_and_keys(tmp_path):
+    async def scenario(spool, clock):
+        await spool.enqueue(_payload(user_id=1))
+        await spool.fail((await spool.claim()).id, "old")
+        await spool.enqueue(_payload(user_id=2, idempotency_key="k-1"))
+        await spool.complete((await spool.claim()).id, "k-1", 42)
+
+        clock.now += 3000
+        await spool.enqueue(_payload(user_id=3))
+        await spool.fail((await spool.claim()).id, "recent")
+        # Ключ ещё помнится — повтор получает номер созданной заявки
+        assert (await spool.enqueue(_payload(user_id=2, idempotency_key="k-1"))).order_id == 42
+
+        clock.now += 1000
+        assert await spool.purge() == 1
+        rows = await spool._db.execute_fetchall("SELECT last_error FROM order_spool WHERE status = 'failed'")
+        assert [row[0] for row in rows] == ["recent"]
+        # Ключ старше dedupe_ttl забыт — тот же альбом снова ставится в очередь
+        assert not (await spool.enqueue(_payload(user_id=2, idempotency_key="k-1"))).duplicate
+
+    _run(tmp_path, scenario, failed_ttl=3600)
+
+
+class _StubBackend:
+    def check_available(self) -> None:
+        pass
+
+
+class _StubBot:
+    def __init__(self):
+        self.texts: list[str] = []
+
+    async def edit_message_text(self, text, **kwargs):
+        self.texts.append(text)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.texts.append(text)
+
+
+def test_uploader_retries_with_exponential_backoff(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploader_module.random, "uniform", lambda low, high: 1.0)
+
+    async def scenario(spool, clock):
+        uploader = OrderUploader(
+            spool, _StubBackend(), workers=1, max_attempts=4, retry_base_delay=2, retry_max_delay=5,
+        )
+        uploader._bot = bot = _StubBot()
+        await spool.enqueue(_payload())
+
+        # Ни одного фото — временная ошибка: 2, 4, 5 (потолок) секунд между попытками
+        delays = []
+        for _ in range(3):
+            job = await spool.claim()
+            assert await uploader._deliver(job) == ("retry", None)
+            rows = await spool._db.execute_fetchall("SELECT next_attempt_at FROM order_spool")
+            delays.append(rows[0][0] - clock.now)
+            clock.now = rows[0][0]
+        assert delays == [2, 4, 5]
+
+        job = await spool.claim()
+        assert job.attempts == 4
+        assert await uploader._deliver(job) == ("failed", None)
+        assert await spool.claim() is None
+        # О задержке пользователь узнаёт один раз, потом — итог
+        assert len(bot.texts) == 2
+
+    _run(tmp_path, scenario)
+
+
+def test_duplicate_key_is_not_queued_twice(tmp_path):
+    async def scenario(spool, clock):
+        first = await spool.enqueue(_payload(idempotency_key="album-1"))
+        results = await asyncio.gather(*(spool.enqueue(_payload(idempotency_key="album-1")) for _ in range(5)))
+        assert all(r.duplicate and r.spool_id == first.spool_id and r.order_id is None for r in results)
+        # Без ключа дублями не считаются
+        assert not (await spool.enqueue(_payload())).duplicate
+        assert not (await spool.enqueue(_payload())).duplicate
+        assert await spool.pending_count() == 3
+
+        # Неудавшуюся заявку можно отправить заново
+        job = await spool.claim()
+        await spool.fail(job.id, "400")
+        again = await spool.enqueue(_payload(idempotency_key="album-1"))
+        assert not again.duplicate and again.spool_id != first.spool_id
+
+    _run(tmp_path, scenario)
+
@@ -0,0 +1,116 @@
+"""
+Кэш /orders (services/orders_cache.py) и проверка ответа
+BackendClient.list_orders на заглушке бэкенда.
+"""
+
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from services.backend import BackendClient, BackendError, is_backend_failure
+from services.breaker import CircuitBreaker
+from services.orders_cache import OrdersCache
+
+
+class _Loader:
+    """Бэкенд списка заявок: отдаёт текущие заявки и считает запросы."""
+
+    def __init__(self):
+        self.orders = [{"id": 1, "status": "new"}]
+        self.calls = 0
+
+    async def __call__(self, user_id):
+        self.calls += 1
+        return list(self.orders)
+
+
+def _cache(loader, pending=None):
+    return OrdersCache(loader, ttl=60, stale=0, max_users=10, pending=pending)
+
+
+def test_invalidate_drops_entry():
+    async def run():
+        loader = _Loader()
+        cache = _cache(loader)
+        await cache.get(7)
+        await cache.get(7)
+        assert loader.calls == 1
+        loader.orders.append({"id": 2, "status": "new"})
+        cache.invalidate(7)
+        assert [order["id"] for order in await cache.get(7)] == [1, 2]
+        assert loader.calls == 2
+
+    asyncio.run(run())
+
+
+def test_not_cached_while_order_is_queued():
+    """Заявку создаёт воркер отправки (возможно, другой процесс): пока она в очереди, список не кэшируется."""
+    async def run():
+        loader = _Loader()
+        queued = {7}
+
+        async def pending(user_id):
+            return user_id in queued
+
+        cache = _cache(loader, pending)
+        await cache.get(7)
+        await cache.get(7)
+        assert loader.calls == 2
+
+        # Воркер создал заявку и убрал её из очереди — invalidate() сюда не приходит
+        loader.orders.append({"id": 2, "status": "new"})
+        queued.clear()
+        assert [order["id"] for order in await cache.get(7)] == [1, 2]
+        await cache.get(7)
+        assert loader.calls == 3
+
+    asyncio.run(run())
+
+
+def _list_orders(body):
+    """Ответ заглушки бэкенда на GET /correction-orders/ → BackendClient.list_orders."""
+    async def handle(request):
+        return web.json_response(body)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/correction-orders/", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        backend = BackendClient(
+            f"http://127.0.0.1:{port}", "secret", timeout=5, upload_timeout=30, connect_timeout=1,
+            limit_per_host=10, dns_ttl=10,
+            breaker=CircuitBreaker(
+                window=60, min_calls=4, error_rate=0.5, open_seconds=30,
+                timeout_multiplier=3, timeout_min=0.05, is_failure=is_backend_failure,
+            ),
+        )
+        await backend.start()
+        try:
+            return await backend.list_orders(7, limit=5)
+        finally:
+            await backend.close()
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_list_orders_coerces_id():
+    orders = _list_orders([{"id": "12", "status": "new"}, {"id": 3, "status": "done"}])
+    assert [order["id"] for order in orders] == [12, 3]
+
+
+@pytest.mark.parametrize("body", [
+    {"detail": "not a list"},
+    [{"status": "new"}],
+    ["1"],
+    [{"id": "<b>1</b>", "status": "new"}],
+    [{"id": None, "status": "new"}],
+])
+def test_list_orders_rejects_malformed_response(body):
+    with pytest.raises(BackendError):
+        _list_orders(body)
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services import photos
+from services.photos import PhotoRef
+
+
+@pytest.fixture
+def stream_mode(monkeypatch):
+    files = {}
+
+    async def fake_get_file(bot, file_id):
+        return SimpleNamespace(file_path=file_id, file_size=None)
+
+    async def fake_read_file(bot, file_path):
+        for chunk in files[file_path]:
+            if isinstance(chunk, BaseException):
+                raise chunk
+            await asyncio.sleep(0)
+            yield chunk
+
+    monkeypatch.setattr(photos, "PHOTO_UPLOAD_MODE", "stream")
+    monkeypatch.setattr(photos, "_get_file", fake_get_file)
+    monkeypatch.setattr(photos, "_read_file", fake_read_file)
+    monkeypatch.setattr(photos, "_cacheable", lambda ref: False)
+    return files
+
+
+async def _body(part) -> bytes:
+    return b"".join([chunk async for chunk in part.body._iter])
+
+
+def test_unavailable_photo_is_skipped(stream_mode):
+    stream_mode.update({
+        "ok-1": [b"a1", b"a2"],
+        "gone": [RuntimeError("404 Not Found")],
+        "ok-2": [b"b1"],
+    })
+
+    async def run():
+        parts, failed = await photos.prepare_photos(None, [PhotoRef("ok-1"), PhotoRef("gone"), PhotoRef("ok-2")])
+        try:
+            return [await _body(part) for part in parts], failed
+        finally:
+            for part in parts:
+                await part.close()
+
+    bodies, failed = asyncio.run(run())
+    assert failed == 1
+    assert bodies == [b"a1a2", b"b1"]
+
+
+def test_slot_is_free_while_chunk_is_uploaded(stream_mode, monkeypatch):
+    stream_mode.update({"slow": [b"s1", b"s2"], "other": [b"o1", b"o2", b"o3"]})
+
+    async def run():
+        monkeypatch.setattr(photos, "_download_semaphore", asyncio.Semaphore(1))
+        (slow_part, other_part), _ = await photos.prepare_photos(None, [PhotoRef("slow"), PhotoRef("other")])
+        try:
+            # Кусок «медленной» заявки отдан в форму, а бэкенд его ещё не принял:
+            # скачивание другой заявки не должно ждать слота
+            slow_iter = slow_part.body._iter.__aiter__()
+            assert await anext(slow_iter) == b"s1"
+            other = await asyncio.wait_for(_body(other_part), timeout=1)
+            assert await anext(slow_iter) == b"s2"
+            return other
+        finally:
+            await slow_part.close()
+            await other_part.close()
+
+    assert asyncio.run(run()) == b"o1o2o3"
+
+
+def test_cache_skips_unknown_size(monkeypatch):
+    monkeypatch.setattr(photos, "cache", photos.PhotoCache(memory_bytes=4096, disk_dir="", disk_bytes=0, ttl=60))
+    assert photos._cacheable(PhotoRef("a", file_size=1024, file_unique_id="ua"))
+    assert not photos._cacheable(PhotoRef("b", file_size=None, file_unique_id="ub"))
+    assert not photos._cacheable(PhotoRef("c", file_size=2048, file_unique_id="uc"))
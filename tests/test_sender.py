@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from services.sender import SendScheduler
+
+
+def _scheduler(max_retries: int = 2) -> SendScheduler:
+    return SendScheduler(global_rate=1e9, chat_rate=1e9, group_rate=1e9, chat_burst=1_000_000, max_retries=max_retries)
+
+
+def _send(scheduler: SendScheduler, make_request):
+    return asyncio.run(scheduler(make_request, None, SendMessage(chat_id=1, text="x")))
+
+
+def test_flood_control_exhausted_counts_as_dropped():
+    scheduler = _scheduler(max_retries=2)
+    calls = 0
+
+    async def make_request(bot, method):
+        nonlocal calls
+        calls += 1
+        raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=0)
+
+    with pytest.raises(TelegramRetryAfter):
+        _send(scheduler, make_request)
+    assert calls == 3
+    assert (scheduler.stats.retry_after, scheduler.stats.dropped, scheduler.stats.errors) == (3, 1, 0)
+
+
+def test_other_errors_are_not_dropped():
+    scheduler = _scheduler()
+
+    async def make_request(bot, method):
+        raise TelegramBadRequest(method, "Bad Request: message is not modified")
+
+    with pytest.raises(TelegramBadRequest):
+        _send(scheduler, make_request)
+    assert (scheduler.stats.dropped, scheduler.stats.errors, scheduler.stats.sent) == (0, 1, 0)
+
+
+def test_retry_after_then_success():
+    scheduler = _scheduler()
+    attempts = iter([TelegramRetryAfter, None])
+
+    async def make_request(bot, method):
+        if next(attempts) is not None:
+            raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=0)
+        return "ok"
+
+    assert _send(scheduler, make_request) == "ok"
+    assert (scheduler.stats.sent, scheduler.stats.retry_after, scheduler.stats.dropped) == (1, 1, 0)
@@ -0,0 +1,92 @@
+"""
+Пользователь, упёршийся в лимит сообщений, присылает альбом:
+первая часть ждёт токен дольше окна сборки альбома, остальные части
+не должны её обогнать — иначе альбом соберётся без первого фото и подписи.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Optional
+
+from aiogram.types import Chat, Message, PhotoSize
+
+from middlewares.throttle_mw import ThrottleMiddleware
+from services.media_group import MediaGroupAggregator
+
+_USER = SimpleNamespace(id=100, username="u", full_name="U")
+
+
+class _Message(Message):
+    async def answer(self, text, **kwargs):
+        _Message.answers.append(text)
+
+
+def _message(message_id: int, group: Optional[str] = None, caption: Optional[str] = None) -> Message:
+    return _Message.model_construct(
+        message_id=message_id, date=0, chat=Chat(id=_USER.id, type="private"), media_group_id=group,
+        caption=caption, photo=[PhotoSize(file_id=f"f{message_id}", file_unique_id=f"u{message_id}", width=1, height=1)],
+    )
+
+
+def _text(message_id: int) -> Message:
+    return _Message.model_construct(
+        message_id=message_id, date=0, chat=Chat(id=_USER.id, type="private"), text="привет",
+    )
+
+
+class _Uploader:
+    def __init__(self, pending: int = 0):
+        self.pending = pending
+
+    async def backlog(self, user_id: int) -> tuple[int, int]:
+        await asyncio.sleep(0.01)
+        return self.pending, 0
+
+
+def _send_album(pending: int = 0):
+    """Текст (забирает токен), затем альбом из трёх частей; возвращает собранные альбомы."""
+    _Message.answers = []
+
+    async def run():
+        middleware = ThrottleMiddleware(
+            _Uploader(pending),
+            message_rate_per_minute=600, message_burst=1,   # следующий токен — через 0.1 с
+            callback_rate_per_minute=600, callback_burst=1,
+            max_wait=2, max_pending=1, max_backlog_bytes=0,
+        )
+        aggregator = MediaGroupAggregator(debounce=0.05, max_wait=1)
+        albums: list[list[int]] = []
+
+        async def on_complete(messages):
+            albums.append([m.message_id for m in messages])
+
+        async def handler(event, data):
+            if event.media_group_id:
+                aggregator.add(event.media_group_id, event, on_complete)
+
+        await middleware(handler, _text(1), {"event_from_user": _USER})
+
+        parts = [_message(2, "album", caption="подпись"), _message(3, "album"), _message(4, "album")]
+        tasks = []
+        for part in parts:
+            tasks.append(asyncio.create_task(middleware(handler, part, {"event_from_user": _USER})))
+            await asyncio.sleep(0.005)
+        await asyncio.gather(*tasks)
+        await asyncio.sleep(0.2)
+        return albums, aggregator
+
+    return asyncio.run(run())
+
+
+def test_throttled_album_keeps_first_part():
+    albums, aggregator = _send_album()
+    assert albums == [[2, 3, 4]]
+    assert aggregator.stats.late_parts == 0
+    assert _Message.answers == []
+
+
+def test_rejected_album_drops_all_parts():
+    albums, _ = _send_album(pending=1)
+    assert albums == []
+    # Отказ — один ответ на весь альбом
+    assert len(_Message.answers) == 1
@@ -0,0 +1,37 @@
+"""Контекст трассы: begin() не оставляет трассу в контексте после заявки."""
+
+import pytest
+
+from services import tracing
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    writer = tracing.TraceWriter(str(tmp_path / "traces.jsonl"), max_bytes=0, backups=0)
+    monkeypatch.setattr(tracing, "_writer", writer)
+    return writer
+
+
+def test_begin_resets_context(writer):
+    with tracing.begin(started=100.0) as trace:
+        assert tracing.current() is trace
+        with tracing.span("status_message"):
+            pass
+    assert tracing.current() is None
+    assert [item["name"] for item in trace.spans] == ["status_message"]
+
+
+def test_begin_restores_outer_trace(writer):
+    with tracing.begin() as outer:
+        with tracing.begin() as inner:
+            assert tracing.current() is inner
+        assert tracing.current() is outer
+    assert tracing.current() is None
+
+
+def test_begin_without_writer():
+    with tracing.begin() as trace:
+        assert trace is None
+        assert tracing.current() is None
+        with tracing.span("status_message"):
+            pass
@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from db.json_storage import JsonUserStorage
+from db.sqlite_storage import SqliteUserStorage
+
+
+def _storages(tmp_path):
+    return {
+        "json": JsonUserStorage(str(tmp_path / "users.json"), flush_interval=60, flush_threshold=1000),
+        "sqlite": SqliteUserStorage(str(tmp_path / "users.db")),
+    }
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_upsert_keeps_null_values(tmp_path, backend):
+    async def run():
+        storage = _storages(tmp_path)[backend]
+        await storage.ensure_open()
+        try:
+            await storage.upsert(1, {"username": "a", "status": "pending", "note": "x", "lang": "ru"})
+            await storage.upsert(1, {"note": None, 'odd"key': [1, {"a": None}]})
+            return await storage.get(1)
+        finally:
+            await storage.close()
+
+    user = asyncio.run(run())
+    assert "note" in user and user["note"] is None
+    assert user["lang"] == "ru"
+    assert user['odd"key'] == [1, {"a": None}]
+    assert user["status"] == "pending"
@@ -0,0 +1,14 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from services.webhook import SECRET_HEADER, WebhookServer
+
+
+@pytest.mark.parametrize("token", ["wrong", "секрет", "\u00ff"])
+def test_bad_secret_token_is_rejected(token):
+    server = WebhookServer(None, None, path="/webhook", secret_token="secret", queue_size=1, workers=1)
+    request = make_mocked_request("POST", "/webhook", headers={SECRET_HEADER: token})
+    response = asyncio.run(server._handle(request))
+    assert response.status == 401